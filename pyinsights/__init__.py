@@ -1,3 +1,5 @@
 # prettify imports
 from pyinsights.connection import Connector
+from pyinsights.offline_connection import OfflineConnector
+from pyinsights.snapshot import EventSnapshot
 from pyinsights.combiner import Combiner
@@ -9,13 +9,14 @@ import numpy as np
 import math
 
 
-def anomaly_detection(connector, parameter_optimization=True, contamination='auto'):
+def anomaly_detection(connector, parameter_optimization=True, contamination='auto', snapshot=None):
     """
     Detects anomalous cases based on isolation forests
     Args:
         connector (pyinsights.Connector): connector
         parameter_optimization (bool): Wether to use hyperparameter optimization
         contamination ('auto' or float): contamination in dataset
+        snapshot (pyinsights.EventSnapshot): in-memory events to compute on instead of querying celonis
     Returns:
         pandas.DataFrame: case ids of anomalous cases
     """
@@ -29,7 +30,7 @@ def anomaly_detection(connector, parameter_optimization=True, contamination='aut
     has_endtime = connector.has_end_timestamp()
 
     # get features and scale them with standardscaler
-    feature_df = get_features(connector=connector)
+    feature_df = get_features(connector=connector, snapshot=snapshot)
     feature_df.dropna(inplace=True)
     X = feature_df.drop(case_col, axis=1)
     scaler = StandardScaler()
@@ -1,15 +1,17 @@
 from pycelonis.celonis_api.pql.pql import PQL, PQLColumn, PQLFilter
 from pyinsights.temporal_profiling import TemporalProfiler
 from pyinsights.organisational_profiling import ResourceProfiler
+from pyinsights.snapshot import local_log
 import datetime
 import pandas as pd
 
 
-def get_features(connector, concurrent_cases=False):
+def get_features(connector, concurrent_cases=False, snapshot=None):
     """
     Computes numerical features for cases
     Args:
         connector (pyinsights.Connector): connector
+        snapshot (pyinsights.EventSnapshot): in-memory events to compute on instead of querying celonis
 
     Returns:
         pandas.Dataframe: numerical features on case level
@@ -31,7 +33,8 @@ def get_features(connector, concurrent_cases=False):
     num_activities = f"""CALC_REWORK()  """
     biggest_loop = f"""  MAX( INDEX_ACTIVITY_LOOP ( "{activity_table}"."{act_col}" ) ) """
 
-    temporal_features = _temporal_features(connector)
+    temporal_features = _temporal_features(connector, snapshot=snapshot)
+    log = local_log(connector, snapshot)
 
     # get df with other features
     query = PQL()
@@ -41,7 +44,10 @@ def get_features(connector, concurrent_cases=False):
     query += PQLColumn(name="biggest loop", query=biggest_loop)
 
     # join with temporal features
-    df = datamodel.get_data_frame(query)
+    if log is not None:
+        df = _local_case_features(log)
+    else:
+        df = connector.get_data_frame(query)
     df = df.join(temporal_features, on=case_col, how="left")
 
     # if there are two timestamps, compute wasted time per case
@@ -56,7 +62,7 @@ def get_features(connector, concurrent_cases=False):
 
     # get workload per case
     if connector.has_resource_column():
-        workload_stats = workload(connector)
+        workload_stats = workload(connector, snapshot=snapshot)
         df = df.join(workload_stats, on=case_col, how="left")
 
     df.drop_duplicates(inplace=True)
@@ -64,12 +70,40 @@ def get_features(connector, concurrent_cases=False):
     return df
 
 
-def _temporal_features(connector):
+def _local_case_features(log):
+    """
+    computes throughput, number of activities and biggest loop per case on the in-memory log
+
+    Args:
+        log (pyinsights.columnar_log.ColumnarLog): in-memory log
+
+    Returns:
+        pandas.DataFrame: features per case
+    """
+    case_col = log.case_col()
+    act_col = log.activity_col()
+    timestamp = log.timestamp()
+
+    events = log.events()
+    # occurrences of activity so far, like INDEX_ACTIVITY_LOOP
+    events["loop"] = events.groupby([case_col, act_col]).cumcount() + 1
+    grouped = events.groupby(case_col, sort=False)
+    df = grouped.agg(start=(timestamp, "min"), end=(timestamp, "max"),
+                     num_activities=(act_col, "size"), biggest_loop=("loop", "max"))
+
+    return pd.DataFrame({case_col: df.index,
+                         "throughput": (df["end"] - df["start"]).dt.total_seconds().values,
+                         "num activities": df["num_activities"].values,
+                         "biggest loop": df["biggest_loop"].values})
+
+
+def _temporal_features(connector, snapshot=None):
     """
     returns temporal features
 
     Args:
         connector (pyinsights.Connector): connector
+        snapshot (pyinsights.EventSnapshot): in-memory events
 
     Returns:
         pandas.DataFrame: temporal features per case
@@ -80,7 +114,7 @@ def _temporal_features(connector):
     case_col = connector.case_col()
 
     # get temporal profile per case
-    temporal_profiler = TemporalProfiler(connector)
+    temporal_profiler = TemporalProfiler(connector, snapshot=snapshot)
     temp_profile = temporal_profiler.deviating_cases(
         sigma=0, deviation_cost=False, extended_view=True)
 
@@ -121,18 +155,19 @@ def count_values_in_range(df, range_min, range_max, timestamp):
     return df[timestamp].between(left=range_min, right=range_max).sum()
 
 
-def workload(connector):
+def workload(connector, snapshot=None):
     """computes the maximum and average workload of resources working on the case
 
     Args:
         connector (pyinsights.Connector): connector
+        snapshot (pyinsights.EventSnapshot): in-memory events
 
     Returns:
         pandas.Series: maximum and average workload
     """
     case_col = connector.case_col()
     res_col = connector.resource_column()
-    profiler = ResourceProfiler(connector)
+    profiler = ResourceProfiler(connector, snapshot=snapshot)
     res_profile = profiler.resource_profile()
     workload = res_profile[[case_col, res_col, "# this HOURS"]].groupby([case_col]).agg(
         max_workload=('# this HOURS', 'max'),
@@ -0,0 +1,276 @@
+import numpy as np
+import pandas as pd
+
+
+def _to_nanoseconds(timestamps):
+    """
+    converts a timestamp column to int64 nanoseconds since epoch
+    :param timestamps: pandas.Series of datetimes
+    :return: numpy.ndarray
+    """
+    timestamps = pd.to_datetime(timestamps)
+    if timestamps.dt.tz is not None:
+        timestamps = timestamps.dt.tz_convert(None)
+    return timestamps.values.astype("datetime64[ns]").view("int64")
+
+
+class ColumnarLog:
+    """
+    In-memory event log stored as integer-coded numpy arrays.
+    Events are sorted by case and timestamp, so every case is a contiguous slice.
+    Provides the data fetches of the analyzers natively, without pql.
+
+    :param log: event log as dataframe
+    :type log: pandas.DataFrame
+
+    :param case_col: name of case column
+    :type case_col: string
+
+    :param activity_col: name of activity column
+    :type activity_col: string
+
+    :param timestamp: name of timestamp column
+    :type timestamp: string
+
+    :param end_timestamp: name of end timestamp column or None
+    :type end_timestamp: string
+
+    :param resource_column: name of resource column or None
+    :type resource_column: string
+
+    :param table_name: name of the activity table
+    :type table_name: string
+    """
+
+    def __init__(self, log, case_col, activity_col, timestamp, end_timestamp=None, resource_column=None,
+                 table_name="activities"):
+        self._case_col = case_col
+        self._act_col = activity_col
+        self._timestamp = timestamp
+        self._table_name = table_name
+        self.end_time = end_timestamp
+        self.resource_col = resource_column
+
+        # factorize cases in order of appearance, then sort events by case and timestamp
+        case_codes, case_ids = pd.factorize(log[case_col], sort=False)
+        starts = _to_nanoseconds(log[timestamp])
+        # lexsort is stable, so simultaneous events keep their order in the log
+        order = np.lexsort((starts, case_codes))
+
+        self.log = log.iloc[order].reset_index(drop=True)
+        self.case_codes = case_codes[order].astype(np.int64)
+        self.case_ids = np.asarray(case_ids)
+        self.starts = starts[order]
+
+        act_codes, activities = pd.factorize(self.log[activity_col], sort=False)
+        self.act_codes = act_codes.astype(np.int64)
+        self.activities = np.asarray(activities)
+
+        # offsets of the cases in the event arrays
+        counts = np.bincount(self.case_codes, minlength=len(self.case_ids))
+        self.case_offsets = np.concatenate(([0], np.cumsum(counts)))
+        # 1-based position of every event in its case
+        self.positions = np.arange(len(self.case_codes)) - \
+            self.case_offsets[self.case_codes] + 1
+
+        self._encode_end_timestamps()
+
+    def _encode_end_timestamps(self):
+        """
+        encodes end timestamps, falls back to the start timestamp if there is none
+        """
+        if self.end_time is not None:
+            self.ends = _to_nanoseconds(self.log[self.end_time])
+        else:
+            self.ends = self.starts
+
+    def activity_table(self):
+        """
+        returns name of activity table
+        """
+        return self._table_name
+
+    def case_col(self):
+        """
+        returns name of case column
+        """
+        return self._case_col
+
+    def activity_col(self):
+        """
+        returns name of activity column
+        """
+        return self._act_col
+
+    def timestamp(self):
+        """
+        returns name of timestamp column
+        """
+        return self._timestamp
+
+    def end_timestamp(self):
+        """
+        returns name of end timestamp column or timestamp column
+        """
+        if self.end_time is not None:
+            return self.end_time
+        else:
+            return self.timestamp()
+
+    def has_end_timestamp(self):
+        """
+        returns true if log has end-timestamp
+        :return: bool
+        """
+        return self.end_time is not None
+
+    def has_resource_column(self):
+        """
+        returns true if log has resource column
+        """
+        return self.resource_col is not None
+
+    def resource_column(self):
+        return self.resource_col
+
+    def set_parameters(self, end_timestamp=None, resource_column=None, **kwargs):
+        """
+        sets end timestamp and resource column
+        :param end_timestamp: name of end timestamp column, "" to unset
+        :param resource_column: name of resource column
+        """
+        if end_timestamp == "":
+            self.end_time = None
+        elif end_timestamp is not None:
+            self.end_time = end_timestamp
+        self._encode_end_timestamps()
+
+        if resource_column is not None:
+            self.resource_col = resource_column
+
+    @property
+    def num_cases(self):
+        return len(self.case_ids)
+
+    @property
+    def num_activities(self):
+        return len(self.activities)
+
+    def _case_mask(self, case_id):
+        """
+        returns boolean mask of the events of a case, or None if case_id is None
+        :param case_id: case id
+        :return: numpy.ndarray
+        """
+        if case_id is None:
+            return None
+        # otherwise event logs with integer case ids wont work
+        return self.log[self._case_col].astype(str).values == str(case_id)
+
+    def _next_in_case(self):
+        """
+        returns boolean array, true if the next event belongs to the same case
+        """
+        same_case = np.zeros(len(self.case_codes), dtype=bool)
+        same_case[:-1] = self.case_codes[:-1] == self.case_codes[1:]
+        return same_case
+
+    def events(self):
+        """
+        returns all events as dataframe
+        """
+        return self.log[[self._case_col, self._act_col, self._timestamp]].copy()
+
+    def event_table(self):
+        """
+        returns all events with end timestamp and resource (if set) as dataframe
+        """
+        columns = [self._case_col, self._act_col]
+        if self.resource_col is not None:
+            columns.append(self.resource_col)
+        columns.append(self._timestamp)
+        if self.end_time is not None:
+            columns.append(self.end_time)
+        return self.log[columns].copy()
+
+    def activation_counts(self, case_id=None):
+        """
+        returns for every case the number of occurrences of every activity,
+        same as PU_MAX(DOMAIN_TABLE(case, activity), ACTIVATION_COUNT(activity))
+        :param case_id: only return counts for this case
+        :return: pandas.DataFrame with columns case, activity, "max nr"
+        """
+        case_codes = self.case_codes
+        act_codes = self.act_codes
+        mask = self._case_mask(case_id)
+        if mask is not None:
+            case_codes = case_codes[mask]
+            act_codes = act_codes[mask]
+
+        # one key per (case, activity) pair
+        keys = case_codes * self.num_activities + act_codes
+        keys, counts = np.unique(keys, return_counts=True)
+
+        return pd.DataFrame({self._case_col: self.case_ids[keys // self.num_activities],
+                             self._act_col: self.activities[keys % self.num_activities],
+                             "max nr": counts})
+
+    def activity_order(self, case_id=None):
+        """
+        returns position of every event in its case, same as INDEX_ACTIVITY_ORDER(activity)
+        :param case_id: only return positions for this case
+        :return: pandas.DataFrame with columns case, activity, "order"
+        """
+        df = pd.DataFrame({self._case_col: self.case_ids[self.case_codes],
+                           self._act_col: self.activities[self.act_codes],
+                           "order": self.positions})
+        mask = self._case_mask(case_id)
+        if mask is not None:
+            df = df[mask].reset_index(drop=True)
+        return df
+
+    def directly_follows(self, case_id=None):
+        """
+        returns the directly-follows edges of all cases, same as SOURCE/TARGET
+        :param case_id: only return edges for this case
+        :return: pandas.DataFrame with columns case, "SOURCE", "TARGET"
+        """
+        sources = np.flatnonzero(self._next_in_case())
+        if case_id is not None:
+            sources = sources[self._case_mask(case_id)[sources]]
+        targets = sources + 1
+
+        return pd.DataFrame({self._case_col: self.case_ids[self.case_codes[sources]],
+                             "SOURCE": self.activities[self.act_codes[sources]],
+                             "TARGET": self.activities[self.act_codes[targets]]})
+
+    def transitions(self, with_end=False):
+        """
+        returns directly-follows transitions with waiting times (end of source to start of target)
+        and the sojourn time of the source if the log has end timestamps
+        :param with_end: if true, adds a transition from the last activity of every case to "END"
+        :return: pandas.DataFrame with columns case, "source", "target", timestamp, "waiting time"(, "sojourn")
+        """
+        next_in_case = self._next_in_case()
+        if with_end:
+            sources = np.arange(len(self.case_codes))
+        else:
+            sources = np.flatnonzero(next_in_case)
+        has_target = next_in_case[sources]
+        # clip to stay in bounds, transitions to END are masked anyway
+        targets = np.minimum(sources + 1, len(self.case_codes) - 1)
+
+        target_acts = self.activities[self.act_codes[targets]].astype(object)
+        target_acts[~has_target] = "END"
+        waiting = (self.starts[targets] - self.ends[sources]) / 1e9
+        waiting = np.where(has_target, waiting, np.nan)
+
+        df = pd.DataFrame({self._case_col: self.case_ids[self.case_codes[sources]],
+                           "source": self.activities[self.act_codes[sources]],
+                           "target": target_acts,
+                           self._timestamp: self.log[self._timestamp].iloc[sources].reset_index(drop=True),
+                           "waiting time": waiting})
+        if self.has_end_timestamp():
+            df["sojourn"] = (self.ends[sources] - self.starts[sources]) / 1e9
+
+        return df
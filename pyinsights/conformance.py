@@ -1,31 +1,57 @@
 import typing
+import hashlib
+import math
+import time
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
 from pycelonis import pql
 from pycelonis.celonis_api.pql.pql import PQL, PQLColumn, PQLFilter
 from pm4py.discovery import discover_petri_net_inductive
+import numpy as np
 import pandas as pd
+from scipy import stats
 import pm4py
+from pm4py.objects.log.obj import Event, EventLog, Trace
+from pm4py.algo.conformance.alignments.petri_net import algorithm as alignments
+from pm4py.algo.conformance.alignments.petri_net.variants.state_equation_a_star import get_best_worst_cost, \
+    Parameters as AlignmentParameters
+from pm4py.objects.petri_net.utils.align_utils import STD_MODEL_LOG_MOVE_COST
 from pm4py.algo.evaluation.simplicity import algorithm as simplicity_evaluator
 from pm4py.algo.evaluation.generalization import algorithm as generalization_evaluator
+from pyinsights.model_cache import PetriNetCache
+from pyinsights.token_replay import TokenReplay
 
+# discovered nets are reused as long as the events they are discovered from don't change,
+# set petri_net_cache.cache_dir to keep them on disk
+petri_net_cache = PetriNetCache()
 
-def _get_top_variants(connector):
+
+def _get_top_variants(connector, events=None, coverage=0.01, epsilon=2):
     """
     returns the top variants of an event log as df
     :param connector:
+    :param events: already fetched events, the variants are filtered locally then, without querying celonis
+    :param coverage: minimum share of traces a variant cluster has to cover
+    :param epsilon: maximum distance of variants in a cluster
     :return:
     """
-    datamodel = connector.datamodel
     activity_table = connector.activity_table()
     case_col = connector.case_col()
     act_col = connector.activity_col()
     timestamp = connector.timestamp()
+    if connector.offline or events is not None:
+        df = _local_top_variants(connector, events, coverage, epsilon)
+        return pm4py.format_dataframe(df, case_id=case_col, activity_key=act_col, timestamp_key=timestamp)
+
     # get number of cases
     query = PQL()
     query += PQLColumn(name="case count",
-                       query=f""" FLOOR(COUNT (DISTINCT "{activity_table}"."{case_col}")*0.01) """)
-    df = datamodel.get_data_frame(query)
+                       query=f""" FLOOR(COUNT (DISTINCT "{activity_table}"."{case_col}")*{coverage}) """)
+    df = connector.get_data_frame(query)
     num_cases = df["case count"].values[0]
-    # cluster variants, retain the ones covering at least 1% of traces
+    cluster = f"""CLUSTER_VARIANTS( VARIANT ("{activity_table}"."{act_col}") , {num_cases}, {epsilon})"""
+
+    # cluster variants, retain the ones covering at least coverage of traces
     query = PQL()
     query.add(PQLColumn(name=case_col,
               query=f""" "{activity_table}"."{case_col}" """))
@@ -35,12 +61,12 @@ def _get_top_variants(connector):
               query=f""" "{activity_table}"."{timestamp}" """))
     query.add(PQLColumn(name="cluster",
                         query=f"""
-                        CLUSTER_VARIANTS( VARIANT ("{activity_table}"."{act_col}") , {num_cases}, 2)
+                        {cluster}
                     """))
     query += PQLFilter(f"""
-                        CLUSTER_VARIANTS( VARIANT ("{activity_table}"."{act_col}") , {num_cases}, 2) >= 0
+                        {cluster} >= 0
                     """)
-    df = datamodel.get_data_frame(query)
+    df = connector.get_data_frame(query)
 
     # pm4py formatting
     df_formatted = pm4py.format_dataframe(df, case_id=connector.case_col(), activity_key=connector.activity_col(),
@@ -49,41 +75,274 @@ def _get_top_variants(connector):
     return df_formatted
 
 
-def _discover_petri_net_from_log(connector, events, evaluate=False):
+def _edit_distance(a, b, bound):
+    """
+    levenshtein distance of two activity sequences, stops early once it exceeds bound
+    :return: distance or bound + 1
+    """
+    previous = list(range(len(b) + 1))
+    for i, x in enumerate(a, 1):
+        current = [i]
+        for j, y in enumerate(b, 1):
+            current.append(min(previous[j] + 1, current[j - 1] + 1,
+                               previous[j - 1] + (x != y)))
+        if min(current) > bound:
+            return bound + 1
+        previous = current
+
+    return min(previous[-1], bound + 1)
+
+
+def _cluster_variants(variants, counts, min_cases, epsilon):
+    """
+    clusters variants like CLUSTER_VARIANTS: a variant is a core variant if the variants within edit distance
+    epsilon cover at least min_cases cases, clusters are the core variants connected within epsilon
+    and the variants within epsilon of them
+    :param variants: list of activity sequences
+    :param counts: number of cases of every variant
+    :param min_cases: minimum number of cases in the neighbourhood of a core variant
+    :param epsilon: maximum distance of variants in a cluster
+    :return: cluster of every variant as numpy.ndarray, -1 for variants in no cluster
+    """
+    counts = np.asarray(counts)
+    lengths = np.array([len(variant) for variant in variants], dtype=np.int64)
+    # activity counts per variant, their difference is a lower bound of the edit distance
+    codes, activities = pd.factorize(
+        pd.Series([act for variant in variants for act in variant], dtype=object))
+    bags = np.zeros((len(variants), len(activities)), dtype=np.int64)
+    np.add.at(bags, (np.repeat(np.arange(len(variants)), lengths), codes), 1)
+
+    neighbours = [[i] for i in range(len(variants))]
+    for i in range(len(variants)):
+        difference = bags[i + 1:] - bags[i]
+        bag_distance = np.maximum(np.where(difference > 0, difference, 0).sum(axis=1),
+                                  np.where(difference < 0, -difference, 0).sum(axis=1))
+        for j in np.flatnonzero(bag_distance <= epsilon) + i + 1:
+            if _edit_distance(variants[i], variants[j], epsilon) <= epsilon:
+                neighbours[i].append(j)
+                neighbours[j].append(i)
+
+    core = np.array([counts[n].sum() >= min_cases for n in neighbours])
+    clusters = np.full(len(variants), -1)
+    for start in np.flatnonzero(core):
+        if clusters[start] >= 0:
+            continue
+        clusters[start] = start
+        stack = [start]
+        while stack:
+            for j in neighbours[stack.pop()]:
+                if clusters[j] < 0:
+                    clusters[j] = start
+                    if core[j]:
+                        stack.append(j)
+
+    return clusters
+
+
+def _local_top_variants(connector, events=None, coverage=0.01, epsilon=2):
     """
-    returns discovered petri net
+    returns the events of cases whose variant is in a cluster covering at least coverage of traces,
+    computed on the in-memory events. all events are returned if no variant is in a cluster
+    :param connector: pyinsights.Connector or pyinsights.OfflineConnector
+    :param events: events as df, all events of the connector if None
+    :param coverage: minimum share of traces a variant cluster has to cover
+    :param epsilon: maximum distance of variants in a cluster
+    :return: events as df
+    """
+    case_col = connector.case_col()
+    if events is None:
+        events = connector.events()
+    # same minimum cluster size as CLUSTER_VARIANTS above
+    min_cases = math.floor(events[case_col].nunique() * coverage)
+    variants, case_variants = _variants(events, connector)
+    counts = case_variants.value_counts().sort_index().values
+    clusters = _cluster_variants(variants, counts, min_cases, epsilon)
+    clustered = case_variants[clusters[case_variants.values] >= 0]
+    if len(clustered) == 0:
+        # discover from the whole log rather than from an empty one
+        return events.copy()
+
+    return events[events[case_col].isin(clustered.index)].copy()
+
+
+def _model_key(connector, events, coverage, epsilon):
+    """
+    returns cache key of the net discovered from events, a hash of the events and the discovery parameters
+    :param connector: pyinsights.Connector or pyinsights.OfflineConnector
     :param events: events as dataframe
-    :return: petri net, initial & final markings
+    :return: cache key
     """
+    columns = [connector.case_col(), connector.activity_col(),
+               connector.timestamp()]
+    hashes = pd.util.hash_pandas_object(events[columns], index=False)
+    fingerprint = hashlib.sha256(hashes.values.tobytes()).hexdigest()
 
-    df_formatted = pm4py.format_dataframe(events, case_id=connector.case_col(), activity_key=connector.activity_col(),
-                                          timestamp_key=connector.timestamp())
-    # filter log to top variants
+    return PetriNetCache.key(fingerprint, coverage=coverage, epsilon=epsilon)
 
-    filtered_dataframe = _get_top_variants(connector)
 
-    # discover model
-    net, initial_marking, final_marking = discover_petri_net_inductive(
-        filtered_dataframe)
+def _discover_petri_net_from_log(connector, events, evaluate=False, coverage=0.01, epsilon=2, cache=None):
+    """
+    returns discovered petri net, served from the cache if the net of the log was discovered before
+    :param events: events as dataframe
+    :param coverage: minimum share of traces a variant cluster has to cover
+    :param epsilon: maximum distance of variants in a cluster
+    :param cache: PetriNetCache, defaults to petri_net_cache
+    :return: petri net, initial & final markings
+    """
+    if cache is None:
+        cache = petri_net_cache
+
+    key = _model_key(connector, events, coverage, epsilon)
+    model = cache.get(key)
+    if model is None:
+        # filter log to top variants
+        filtered_dataframe = _get_top_variants(
+            connector, events, coverage=coverage, epsilon=epsilon)
+
+        # discover model
+        model = discover_petri_net_inductive(filtered_dataframe)
+        cache.put(key, *model)
+    net, initial_marking, final_marking = model
 
     if evaluate:
-        # evaluate discovered model (takes a while on big logs)
-        fitness = pm4py.fitness_token_based_replay(
-            df_formatted, net, initial_marking, final_marking)
-        precision = pm4py.precision_token_based_replay(
-            df_formatted, net, initial_marking, final_marking)
-        gen = generalization_evaluator.apply(
-            df_formatted, net, initial_marking, final_marking)
-        simp = simplicity_evaluator.apply(net)
-
-        print(f"fitness: {fitness}")
-        print(f"precision: {precision}")
-        print(f"generalization: {gen}")
-        print(f"simplicity: {simp}")
+        # evaluate discovered model on samples of the log
+        print(evaluate_model(connector, events, net,
+              initial_marking, final_marking))
 
     return net, initial_marking, final_marking
 
 
+def _stratified_sample(case_variants, size, rng):
+    """
+    draws cases stratified by variant, the number of cases of a variant is proportional to its frequency
+    :param case_variants: variant of every case, see _variants
+    :param size: number of cases
+    :param rng: numpy.random.Generator
+    :return: list of case ids
+    """
+    counts = case_variants.value_counts()
+    quotas = counts / counts.sum() * size
+    # the remaining cases go to variants drawn proportional to the fractional part of their quota,
+    # so rare variants are sampled in expectation
+    allocation = np.floor(quotas).astype(int)
+    remainder = quotas - allocation
+    if remainder.sum() > 0:
+        drawn = rng.choice(remainder.index, size - allocation.sum(), replace=False,
+                           p=remainder / remainder.sum())
+        allocation[drawn] += 1
+
+    cases = []
+    for variant, cases_of_variant in case_variants.groupby(case_variants).groups.items():
+        cases += list(rng.choice(cases_of_variant,
+                      allocation[variant], replace=False))
+
+    return cases
+
+
+def _log_fitness(replay, weights):
+    """
+    token-based replay fitness of a log, like pm4py.fitness_token_based_replay
+    :param replay: token counts per variant, see TokenReplay.replay
+    :param weights: number of cases of every variant
+    :return: float
+    """
+    missing, consumed, remaining, produced = [(replay[f"{key} tokens"] * weights).sum()
+                                              for key in ["missing", "consumed", "remaining", "produced"]]
+    if consumed == 0 or produced == 0:
+        return 1.0
+
+    return 0.5 * (1 - missing / consumed) + 0.5 * (1 - remaining / produced)
+
+
+def _batch_intervals(values, confidence):
+    """
+    returns t-intervals of the batch means
+    :param values: values of every batch per metric
+    :param confidence: confidence level of the intervals
+    :return: dict metric -> (mean, lower, upper)
+    """
+    intervals = {}
+    for metric, batch_values in values.items():
+        mean = np.mean(batch_values)
+        half_width = stats.t.ppf((1 + confidence) / 2, len(batch_values) - 1) * \
+            np.std(batch_values, ddof=1) / np.sqrt(len(batch_values))
+        intervals[metric] = (mean, mean - half_width, mean + half_width)
+
+    return intervals
+
+
+def evaluate_model(connector, events, net, initial_marking, final_marking, sample_size=100, batches=5,
+                   confidence=0.95, max_width=0.05, time_budget=60, seed=0):
+    """
+    evaluates a petri net on samples of the log.
+    fitness is computed exactly on all variants, simplicity only depends on the net.
+    precision and generalization are estimated from batches of cases sampled stratified by variant,
+    the sample size is doubled until all confidence intervals are narrower than max_width,
+    the time budget is used up or the whole log is sampled.
+    the budget is checked before every batch, the intervals are then computed from the completed batches.
+    generalization grows with the number of cases, the estimate holds for the final sample size
+    :param connector: pyinsights.Connector
+    :param events: events as dataframe
+    :param net: petri net
+    :param initial_marking: initial marking
+    :param final_marking: final marking
+    :param sample_size: initial number of cases per batch
+    :param batches: number of batches per sample size (at least 2), the interval is computed from the batch means
+    :param confidence: confidence level of the intervals
+    :param max_width: target width of the intervals
+    :param time_budget: seconds after which no further batch is drawn
+    :param seed: seed of the sampling
+    :return: dataframe with columns "metric", "estimate", "lower", "upper", "sample size"
+    """
+    if batches < 2:
+        raise ValueError("an interval needs at least 2 batches")
+    start = time.monotonic()
+    case_col = connector.case_col()
+    rng = np.random.default_rng(seed)
+    variants, case_variants = _variants(events, connector)
+    num_cases = len(case_variants)
+
+    replay = TokenReplay(net, initial_marking, final_marking).replay(variants)
+    weights = case_variants.value_counts().sort_index().values
+    fitness = _log_fitness(replay, weights)
+    simplicity = simplicity_evaluator.apply(net)
+    # exact values, simplicity needs no cases
+    rows = [("fitness", fitness, fitness, fitness, num_cases),
+            ("simplicity", simplicity, simplicity, simplicity, 0)]
+
+    size = min(sample_size, num_cases)
+    intervals = None
+    while True:
+        values = {"precision": [], "generalization": []}
+        for _ in range(batches):
+            # stop once the budget is used up, an interval needs at least two batches
+            if time.monotonic() - start > time_budget and (intervals is not None or len(values["precision"]) >= 2):
+                break
+            cases = _stratified_sample(case_variants, size, rng)
+            sample = pm4py.format_dataframe(events[events[case_col].isin(cases)], case_id=case_col,
+                                            activity_key=connector.activity_col(),
+                                            timestamp_key=connector.timestamp())
+            values["precision"].append(pm4py.precision_token_based_replay(
+                sample, net, initial_marking, final_marking))
+            values["generalization"].append(generalization_evaluator.apply(
+                sample, net, initial_marking, final_marking))
+
+        # intervals of the completed batches, else those of the last sample size
+        if len(values["precision"]) >= 2:
+            intervals = _batch_intervals(values, confidence)
+            interval_size = size
+
+        widths = [upper - lower for _, lower, upper in intervals.values()]
+        if max(widths) <= max_width or size == num_cases or time.monotonic() - start > time_budget:
+            break
+        size = min(2 * size, num_cases)
+
+    rows += [(metric, mean, lower, upper, interval_size)
+             for metric, (mean, lower, upper) in intervals.items()]
+
+    return pd.DataFrame(rows, columns=["metric", "estimate", "lower", "upper", "sample size"])
+
+
 # alignment base conformance checking
 
 def _petri_net_pql(net, inital_marking, final_marking):
@@ -116,50 +375,153 @@ def _petri_net_pql(net, inital_marking, final_marking):
     arcs_str += "]"
 
 
-def alignment_scores(events_to_align, event_log, connector):
+def _variants(events, connector):
+    """
+    collapses events into their variants (unique activity sequences)
+    :param events: events as df
+    :param connector: pyinsights.Connector
+    :return: (list of activity sequences, variant of every case as series indexed by case id)
+    """
+    case_col = connector.case_col()
+    act_col = connector.activity_col()
+    # same order of events as pm4py.format_dataframe
+    traces = events.sort_values(by=[case_col, connector.timestamp()], kind="stable") \
+        .groupby(by=case_col, sort=False)[act_col].agg(tuple)
+    case_variants = pd.Series(pd.factorize(traces)[0], index=traces.index)
+    variants = list(traces[~case_variants.duplicated().values])
+
+    return variants, case_variants
+
+
+def _variant_log(events, connector):
+    """
+    collapses events into their variants, see _variants
+    :param events: events as df
+    :param connector: pyinsights.Connector
+    :return: (pm4py event log with one trace per variant, variant of every case as series indexed by case id)
+    """
+    variants, case_variants = _variants(events, connector)
+    log = EventLog([Trace([Event({"concept:name": act}) for act in variant],
+                          attributes={"concept:name": str(i)})
+                    for i, variant in enumerate(variants)])
+
+    return log, case_variants
+
+
+def _case_costs(costs, case_variants, case_col):
+    """
+    maps the cost of every variant back to its cases
+    :param costs: cost per variant
+    :param case_variants: variant of every case, see _variant_log
+    :param case_col: name of case column
+    :return: dataframe with columns case_col, "cost"
+    """
+    costs = np.asarray(costs, dtype=float)
+
+    return pd.DataFrame({case_col: case_variants.index,
+                         "cost": costs[case_variants.values]})
+
+
+# petri net of the alignment worker processes, see _init_alignment_worker
+_alignment_model = None
+
+
+def _init_alignment_worker(net, initial_marking, final_marking):
+    """
+    sets the petri net of an alignment worker process, so it's sent once per process and not once per trace
+    """
+    global _alignment_model
+    _alignment_model = (net, initial_marking, final_marking)
+
+
+def _align_trace(trace, model, timeout=None, max_states=None):
+    """
+    aligns a trace within a budget
+    :param trace: pm4py trace
+    :param model: petri net, initial & final markings
+    :param timeout: seconds the alignment may take, None for no limit
+    :param max_states: maximum size of the search space, estimated as (trace length + 1) * number of places
+    :return: alignment cost or None if the trace exceeds its budget
+    """
+    net, initial_marking, final_marking = model
+    if max_states is not None and (len(trace) + 1) * len(net.places) > max_states:
+        return None
+
+    parameters = {}
+    if timeout is not None:
+        parameters[AlignmentParameters.PARAM_MAX_ALIGN_TIME_TRACE] = timeout
+    alignment = alignments.apply_trace(
+        trace, net, initial_marking, final_marking, parameters=parameters)
+
+    return None if alignment is None else alignment["cost"]
+
+
+def _align_in_worker(trace, timeout=None, max_states=None):
+    """
+    aligns a trace against the petri net of the worker process
+    """
+    return _align_trace(trace, _alignment_model, timeout=timeout, max_states=max_states)
+
+
+def alignment_scores(events_to_align, event_log, connector, processes=1, timeout=None, max_states=None):
     """
     Computes alignment scores for cases and returns them
-    as dataframe
+    as dataframe. every variant is aligned once, the variants are sharded across processes.
+    variants exceeding their budget get an upper bound of the cost
+    (all events as log moves plus the cheapest run of the model) and are flagged as approximate
     :param event_log: event log as df
     :param events_to_align: events to align as df
     :param connector: pyinsights.Connector
-    :return: alignment scores as dataframe
+    :param processes: number of worker processes, 1 aligns in this process
+    :param timeout: seconds an alignment of a trace may take, None for no limit
+    :param max_states: maximum size of the search space of a trace, estimated as (trace length + 1) * number of places
+    :return: alignment scores as dataframe with columns case, "cost", "approximate"
     """
-    # pm4py formatting
-    events_to_align = pm4py.format_dataframe(events_to_align, case_id=connector.case_col(),
-                                             activity_key=connector.activity_col(),
-                                             timestamp_key=connector.timestamp())
+    log, case_variants = _variant_log(events_to_align, connector)
     # discover model
-    net, im, fm = _discover_petri_net_from_log(
+    model = _discover_petri_net_from_log(
         events=event_log, connector=connector, evaluate=False)
     # align traces with pm4py (because not feasible in pql)
-    aligned_traces = pm4py.conformance_diagnostics_alignments(
-        events_to_align, net, im, fm)
-    # extract alignment cost per trace
-    costs = [aligned_traces[x]["cost"] for x in range(len(aligned_traces))]
-    return costs
+    align = partial(_align_in_worker, timeout=timeout, max_states=max_states)
+    if processes == 1 or len(log) <= 1:
+        costs = [_align_trace(trace, model, timeout=timeout, max_states=max_states)
+                 for trace in log]
+    else:
+        # several chunks per process, so expensive variants are spread
+        chunksize = max(1, len(log) // (4 * processes))
+        with ProcessPoolExecutor(max_workers=processes, initializer=_init_alignment_worker,
+                                 initargs=model) as executor:
+            costs = list(executor.map(align, log, chunksize=chunksize))
+
+    # upper bound for traces that exceeded their budget
+    approximate = np.array([cost is None for cost in costs], dtype=bool)
+    if approximate.any():
+        model_cost = get_best_worst_cost(*model)
+        costs = [model_cost + STD_MODEL_LOG_MOVE_COST * len(trace) if cost is None else cost
+                 for trace, cost in zip(log, costs)]
+
+    scores = _case_costs(costs, case_variants, connector.case_col())
+    scores["approximate"] = approximate[case_variants.values]
+
+    return scores
 
 
 def tbr_scores(events_to_replay, event_log, connector):
     """
     Computes tbr scores for cases and returns them
-    as dataframe
+    as dataframe. every variant is replayed once
     :param event_log: event log as df
     :param events_to_replay: events to replay as df
     :param connector: pyinsights.Connector
-    :return: replay scores as dataframe
+    :return: replay scores as dataframe with columns case, "cost"
     """
-    # pm4py formatting
-    events_to_replay = pm4py.format_dataframe(events_to_replay, case_id=connector.case_col(),
-                                              activity_key=connector.activity_col(),
-                                              timestamp_key=connector.timestamp())
+    variants, case_variants = _variants(events_to_replay, connector)
     # discover model
     net, im, fm = _discover_petri_net_from_log(
         events=event_log, connector=connector, evaluate=False)
-    # replay traces with pm4py (because not feasible in pql)
-    tbr_diagnostics = pm4py.conformance_diagnostics_token_based_replay(
-        events_to_replay, net, im, fm)
-    # extract cost per trace, defined as #missing tokens + #remaining tokens
-    costs = [trace['missing_tokens'] + trace['remaining_tokens']
-             for trace in tbr_diagnostics]
-    return costs
+    # replay traces on the incidence matrices of the net (because not feasible in pql)
+    replay = TokenReplay(net, im, fm).replay(variants)
+    # extract cost per variant, defined as #missing tokens + #remaining tokens
+    costs = replay["missing tokens"] + replay["remaining tokens"]
+
+    return _case_costs(costs, case_variants, connector.case_col())
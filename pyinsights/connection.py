@@ -1,5 +1,9 @@
+import json
+import time
+import warnings
 from pycelonis import get_celonis, __version__
 from pycelonis.celonis_api.pql.pql import PQL, PQLColumn, PQLFilter
+from pyinsights.query_cache import QueryCache
 
 
 class Connector:
@@ -19,6 +23,8 @@ provides datamodel, activity_table, case_col, activity_col, timestamp
 """
 
     end_time = None
+    # analyzers use native implementations for offline connectors
+    offline = False
 
     def __init__(self, api_token, url, key_type):
         self.datamodel = None
@@ -27,6 +33,10 @@ provides datamodel, activity_table, case_col, activity_col, timestamp
         self.url = url
         self.key_type = key_type
         self.resource_col = None
+        self.cache = None
+        self.reload_check_interval = 60
+        self._last_reload = None
+        self._last_reload_check = None
 
         global end_time
         end_time = None
@@ -116,6 +126,7 @@ provides datamodel, activity_table, case_col, activity_col, timestamp
 
         if model_id is not None:
             self.datamodel = self.celonis.get_datamodel(model_id)
+            self._last_reload_check = None
 
         if end_timestamp == "":
             self.end_time = None
@@ -153,6 +164,57 @@ provides datamodel, activity_table, case_col, activity_col, timestamp
         query.add(PQLColumn(name=self.timestamp(),
                   query=f""" "{self.activity_table()}"."{self.timestamp()}"  """))
 
-        events = self.datamodel.get_data_frame(query)
+        events = self.get_data_frame(query)
 
         return events
+
+    def enable_cache(self, cache_dir=".pyinsights_cache", max_size=2 * 1024 ** 3, reload_check_interval=60):
+        """
+        caches results of pql queries as parquet files on local disk
+        :param cache_dir: directory of the cache
+        :param max_size: maximum size of the cache in bytes
+        :param reload_check_interval: seconds until the datamodel is checked for reloads again
+        :return: pyinsights.query_cache.QueryCache
+        """
+        self.cache = QueryCache(cache_dir=cache_dir, max_size=max_size)
+        self.reload_check_interval = reload_check_interval
+
+        return self.cache
+
+    def last_reload(self):
+        """
+        returns load info of the datamodel as string, changes whenever the datamodel is reloaded
+        :return: string or None if unknown
+        """
+        now = time.monotonic()
+        if self._last_reload_check is not None and now - self._last_reload_check < self.reload_check_interval:
+            return self._last_reload
+
+        try:
+            load_info = self.celonis.api_request(
+                f"{self.datamodel.url}/load-history/load-info-sync")
+            self._last_reload = json.dumps(
+                load_info, sort_keys=True, default=str)
+        except Exception as e:
+            warnings.warn(f"could not get load info of datamodel: {e}")
+            self._last_reload = None
+        self._last_reload_check = now
+
+        return self._last_reload
+
+    def get_data_frame(self, query):
+        """
+        returns result of pql query on the datamodel as dataframe,
+        served from the cache if enabled and the last reload of the datamodel is known
+        :param query: pycelonis PQL
+        :return: pandas.core.Dataframe
+        """
+        if self.cache is None:
+            return self.datamodel.get_data_frame(query)
+
+        last_reload = self.last_reload()
+        if last_reload is None:
+            # cached results couldn't be invalidated
+            return self.datamodel.get_data_frame(query)
+
+        return self.cache.get_data_frame(self.datamodel, query, last_reload)
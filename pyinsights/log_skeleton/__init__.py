@@ -1 +1,4 @@
 from pyinsights.log_skeleton.log_skeleton import LogSkeleton
+from pyinsights.log_skeleton.model import LogSkeletonModel
+from pyinsights.log_skeleton.monitor import ConformanceMonitor
+from pyinsights.log_skeleton.statistics import SkeletonStatistics
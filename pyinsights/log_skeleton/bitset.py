@@ -0,0 +1,305 @@
+import json
+import numpy as np
+
+RELATIONS = ["equivalence", "always_after", "always_before",
+             "never_together", "directly_follows"]
+
+# relations that never relate an activity to itself
+_IRREFLEXIVE = ["equivalence", "never_together"]
+
+_WORD = np.dtype("<u8")
+# number of set bits of every byte
+_POPCOUNT = np.array([bin(i).count("1") for i in range(256)], dtype=np.uint8)
+
+
+def num_words(num_bits):
+    """
+    returns the number of uint64 words needed to store num_bits bits
+    """
+    return max(1, (num_bits + 63) // 64)
+
+
+def pack(matrix):
+    """
+    packs the last axis of a boolean array into uint64 words
+    :param matrix: numpy.ndarray of bools (..., n)
+    :return: numpy.ndarray of uint64 (..., num_words(n))
+    """
+    matrix = np.asarray(matrix, dtype=bool)
+    words = num_words(matrix.shape[-1])
+    packed = np.packbits(matrix, axis=-1, bitorder="little")
+    padding = [(0, 0)] * (matrix.ndim - 1) + \
+        [(0, words * 8 - packed.shape[-1])]
+    packed = np.ascontiguousarray(np.pad(packed, padding))
+
+    return packed.view(_WORD)
+
+
+def unpack(bits, num_bits):
+    """
+    unpacks uint64 words into a boolean array
+    :param bits: numpy.ndarray of uint64 (..., words)
+    :param num_bits: length of the last axis of the result
+    :return: numpy.ndarray of bools (..., num_bits)
+    """
+    as_bytes = np.ascontiguousarray(bits, dtype=_WORD).view(np.uint8)
+    unpacked = np.unpackbits(as_bytes, axis=-1, bitorder="little")
+
+    return unpacked[..., :num_bits].astype(bool)
+
+
+def popcount(bits):
+    """
+    returns the number of set bits of every matrix in a batch
+    :param bits: numpy.ndarray of uint64 (..., rows, words)
+    :return: numpy.ndarray of int64 (...)
+    """
+    as_bytes = np.ascontiguousarray(bits, dtype=_WORD).view(np.uint8)
+
+    return _POPCOUNT[as_bytes].sum(axis=(-2, -1), dtype=np.int64)
+
+
+def set_bits(bits, index, a, b):
+    """
+    sets bit (a, b) of the matrices at index in place
+    :param bits: numpy.ndarray of uint64 (n, rows, words)
+    :param index: numpy.ndarray of matrix indices
+    :param a: numpy.ndarray of row indices
+    :param b: numpy.ndarray of column indices
+    """
+    b = np.asarray(b, dtype=np.uint64)
+    np.bitwise_or.at(bits, (index, a, (b // 64).astype(np.int64)),
+                     np.left_shift(np.uint64(1), b % np.uint64(64)))
+
+
+def activities_to_array(activities):
+    """
+    encodes activity names as json in a string array, so their type (e.g. integer codes) survives a save
+    :param activities: list of activity names, json-serializable
+    :return: 0-d numpy.ndarray of str
+    """
+    return np.array(json.dumps([act.item() if isinstance(act, np.generic) else act for act in activities]))
+
+
+def activities_from_array(array):
+    """
+    decodes activity names encoded with activities_to_array
+    :param array: numpy.ndarray, arrays of names saved before are returned as strings
+    :return: list of activity names
+    """
+    if array.ndim == 0:
+        return json.loads(array.item())
+    return array.tolist()
+
+
+def to_pairs(bits, activities):
+    """
+    returns the pairs of activities of a packed activities x activities matrix
+    :param bits: numpy.ndarray of uint64 (activities, words)
+    :param activities: activity names
+    :return: set
+    """
+    activities = np.asarray(activities, dtype=object)
+    i, j = np.nonzero(unpack(bits, len(activities)))
+
+    return set(zip(activities[i], activities[j]))
+
+
+def from_pairs(pairs, activities):
+    """
+    packs a set of pairs of activities into an activities x activities matrix
+    :param pairs: set of pairs
+    :param activities: activity names
+    :return: numpy.ndarray of uint64 (activities, words)
+    """
+    index = {act: i for i, act in enumerate(activities)}
+    matrix = np.zeros((len(activities), len(activities)), dtype=bool)
+    for a, b in pairs:
+        matrix[index[a], index[b]] = True
+
+    return pack(matrix)
+
+
+class TraceBitset:
+    """
+    Relations of a batch of traces as packed activities x activities bit matrices, one per trace,
+    and the number of occurrences of every activity per trace.
+
+    :param activities: activity names, the bit index of an activity is its position
+    :type activities: list
+
+    :param num_traces: number of traces
+    :type num_traces: int
+    """
+
+    def __init__(self, activities, num_traces):
+        self.activities = list(activities)
+        num_activities = len(self.activities)
+        self.relations = {relation: np.zeros((num_traces, num_activities, num_words(num_activities)), dtype=_WORD)
+                          for relation in RELATIONS}
+        self.counts = np.zeros((num_traces, num_activities), dtype=np.int64)
+
+    def __len__(self):
+        return len(self.counts)
+
+    def pairs(self, relation, trace):
+        """
+        returns relation of a trace as set of pairs
+        :param relation: name of relation
+        :param trace: index of trace
+        :return: set
+        """
+        return to_pairs(self.relations[relation][trace], self.activities)
+
+    def frequencies(self, trace):
+        """
+        returns active frequencies of a trace
+        :param trace: index of trace
+        :return: dict of the form activity: {number of occurrences}
+        """
+        return {act: {count} for act, count in zip(self.activities, self.counts[trace].tolist())}
+
+
+class SkeletonBitset:
+    """
+    Log skeleton as packed activities x activities bit matrices (uint64 words).
+    Active frequencies are stored as packed activities x counts bit matrix of the allowed numbers of occurrences.
+
+    :param activities: activity names, the bit index of an activity is its position
+    :type activities: list
+
+    :param relations: dict of the form relation : packed bit matrix
+    :type relations: dict
+
+    :param frequencies: packed activities x counts bit matrix
+    :type frequencies: numpy.ndarray
+
+    :param num_reference: number of activities the skeleton was discovered on, activities after them
+        are unknown to the skeleton, defaults to all activities
+    :type num_reference: int
+    """
+
+    def __init__(self, activities, relations, frequencies, num_reference=None):
+        self.activities = list(activities)
+        self.relations = relations
+        self.frequencies = frequencies
+        if num_reference is None:
+            num_reference = len(self.activities)
+        self.num_reference = num_reference
+
+    @classmethod
+    def from_dict(cls, log_skeleton, activities):
+        """
+        packs a log skeleton given as dict of sets
+        :param log_skeleton: dict as returned by LogSkeleton.get_log_skeleton
+        :param activities: activity names
+        :return: SkeletonBitset
+        """
+        activities = list(activities)
+        relations = {relation: from_pairs(log_skeleton[relation], activities)
+                     for relation in RELATIONS}
+
+        activ_freq = log_skeleton["activ_freq"]
+        max_count = max([int(count) for counts in activ_freq.values()
+                        for count in counts], default=0)
+        allowed = np.zeros((len(activities), max_count + 1), dtype=bool)
+        for i, act in enumerate(activities):
+            for count in activ_freq.get(act, ()):
+                allowed[i, int(count)] = True
+
+        return cls(activities, relations, pack(allowed))
+
+    def reindex(self, activities):
+        """
+        returns the skeleton over additional activities, unknown activities are related to nothing
+        :param activities: activity names, starting with the activities of the skeleton
+        :return: SkeletonBitset
+        """
+        activities = list(activities)
+        if activities[:len(self.activities)] != self.activities:
+            raise ValueError(
+                "activities have to start with the activities of the log skeleton")
+
+        num_activities = len(self.activities)
+        relations = {}
+        for relation in RELATIONS:
+            matrix = np.zeros((len(activities), len(activities)), dtype=bool)
+            matrix[:num_activities, :num_activities] = unpack(
+                self.relations[relation], num_activities)
+            relations[relation] = pack(matrix)
+
+        frequencies = np.zeros(
+            (len(activities), self.frequencies.shape[-1]), dtype=_WORD)
+        frequencies[:num_activities] = self.frequencies
+
+        return SkeletonBitset(activities, relations, frequencies, num_reference=self.num_reference)
+
+    @property
+    def max_count(self):
+        """
+        returns the highest number of occurrences the frequency matrix can hold
+        """
+        return self.frequencies.shape[-1] * 64 - 1
+
+    def allowed_frequencies(self):
+        """
+        returns activities x counts boolean matrix of the allowed numbers of occurrences
+        """
+        return unpack(self.frequencies, self.max_count + 1)
+
+    def to_dict(self):
+        """
+        returns the log skeleton as dict of sets
+        :return: dict
+        """
+        log_skeleton = {relation: to_pairs(self.relations[relation], self.activities)
+                        for relation in RELATIONS}
+        allowed = self.allowed_frequencies()
+        log_skeleton["activ_freq"] = {act: set(np.flatnonzero(allowed[i]).tolist())
+                                      for i, act in enumerate(self.activities[:self.num_reference])}
+
+        return log_skeleton
+
+    def violations(self, traces, noise_threshold):
+        """
+        checks a batch of traces against the log skeleton.
+        a relation of a trace is violated if it has more than noise_threshold * number of pairs pairs
+        that are not in the log skeleton, the active frequencies are violated if an activity
+        occurs a number of times that is not allowed.
+        :param traces: TraceBitset with the same activities
+        :param noise_threshold: [0,1]
+        :return: dict of the form relation : boolean numpy.ndarray, true if the trace violates the relation
+        """
+        # pairs are counted w.r.t. the activities the skeleton was discovered on
+        num_activities = self.num_reference
+        violated = {}
+        for relation in RELATIONS:
+            if relation in _IRREFLEXIVE:
+                num_pairs = num_activities * (num_activities - 1)
+            else:
+                num_pairs = num_activities ** 2
+            # pairs of the trace that are not in the log skeleton
+            difference = traces.relations[relation] & ~self.relations[relation]
+            violated[relation] = popcount(
+                difference) > num_pairs * noise_threshold
+
+        # only activities known to the skeleton have bounded frequencies
+        allowed = self.allowed_frequencies()[:num_activities]
+        counts = traces.counts[:, :num_activities]
+        in_range = counts <= self.max_count
+        rows = np.broadcast_to(np.arange(num_activities), counts.shape)
+        allowed_counts = allowed[rows, np.minimum(counts, self.max_count)]
+        violated["activ_freq"] = ~(in_range & allowed_counts).all(axis=1)
+
+        return violated
+
+    def conforms(self, traces, noise_threshold):
+        """
+        returns true for every trace that violates no relation
+        :param traces: TraceBitset with the same activities
+        :param noise_threshold: [0,1]
+        :return: boolean numpy.ndarray
+        """
+        violated = self.violations(traces, noise_threshold)
+
+        return ~np.any(list(violated.values()), axis=0)
@@ -0,0 +1,150 @@
+import numpy as np
+import pandas as pd
+from scipy import sparse
+from pyinsights.log_skeleton.bitset import pack
+from pyinsights.log_skeleton.relations import equivalence_relation, never_together_relation, to_set
+
+
+class CountMatrix:
+    """
+    Sparse cases x activities matrix of the number of occurrences of every activity,
+    built from activation count data.
+    Computes the co-occurrence based relations for all activity pairs at once,
+    run time scales with the number of non-zeros.
+
+    :param df: dataframe with case, activity and number of occurrences
+    :type df: pandas.DataFrame
+
+    :param case_col: name of case column
+    :type case_col: string
+
+    :param act_col: name of activity column
+    :type act_col: string
+
+    :param activities: activity names defining the columns, defaults to the activities of df
+    :type activities: list
+
+    :param max_elements: maximum number of elements compared at once, bounds memory usage
+    :type max_elements: int
+    """
+
+    def __init__(self, df, case_col, act_col, count_col="max nr", activities=None, max_elements=2 ** 24):
+        self.max_elements = max_elements
+        case_codes, self.cases = pd.factorize(df[case_col])
+        if activities is None:
+            act_codes, self.activities = pd.factorize(df[act_col])
+        else:
+            self.activities = pd.Index(activities)
+            act_codes = self.activities.get_indexer(df[act_col])
+        counts = df[count_col].values
+
+        # activities without a name are never grouped
+        valid = (act_codes >= 0) & (case_codes >= 0)
+        self.matrix = sparse.csc_matrix((counts[valid], (case_codes[valid], act_codes[valid])),
+                                        shape=(len(self.cases), len(self.activities)))
+        # number of cases every activity occurs in
+        self.occurrences = np.asarray(
+            (self.matrix != 0).sum(axis=0)).ravel()
+
+    def co_occurrence(self):
+        """
+        Returns for every pair (a, b) the number of cases in which both a and b occur.
+        :return: numpy.ndarray activities x activities
+        """
+        occurs = (self.matrix != 0).astype(np.int64)
+        return (occurs.T @ occurs).toarray()
+
+    def equal_counts(self):
+        """
+        Returns for every pair (a, b) the number of cases in which a and b occur equally often (and at least once).
+        :return: numpy.ndarray activities x activities
+        """
+        num_activities = len(self.activities)
+        equal = np.zeros((num_activities, num_activities), dtype=np.int64)
+        # one indicator matrix per distinct number of occurrences
+        for count in np.unique(self.matrix.data):
+            occurs = (self.matrix == count).astype(np.int64)
+            equal += (occurs.T @ occurs).toarray()
+
+        return equal
+
+    def equivalence(self, noise_threshold):
+        """
+        Returns all pairs (a, b) whose number of occurrences differ in at most noise of the cases
+        the more frequent activity occurs in.
+        :param noise_threshold: [0,1]
+        :return: set
+        """
+        holds = equivalence_relation(
+            self.equal_counts(), self.occurrences, noise_threshold)
+
+        return to_set(holds, self.activities)
+
+    def never_together(self, noise_threshold):
+        """
+        Returns all pairs (a, b) that occur together in at most noise of the cases
+        the more frequent activity occurs in.
+        :param noise_threshold: [0,1]
+        :return: set
+        """
+        holds = never_together_relation(
+            self.co_occurrence(), self.occurrences, noise_threshold)
+
+        return to_set(holds, self.activities)
+
+    def _case_chunks(self):
+        """
+        yields (case slice, boolean cases x activities occurrence matrix) blocks, so that a block
+        compared with all activities has at most max_elements elements
+        """
+        num_cases, num_activities = self.matrix.shape
+        occurs = (self.matrix != 0).tocsr()
+        chunk = max(1, self.max_elements // max(1, num_activities ** 2))
+        for c in range(0, num_cases, chunk):
+            cases = slice(c, c + chunk)
+            yield cases, occurs[cases].toarray()
+
+    def _case_relations(self, relation):
+        """
+        evaluates relation(occurrence block) for all cases
+        :return: packed bit matrices, numpy.ndarray of uint64 cases x activities x words
+        """
+        num_activities = self.matrix.shape[1]
+        relations = [pack(relation(present))
+                     for _, present in self._case_chunks()]
+
+        return np.concatenate(relations) if relations else pack(np.zeros((0, num_activities, num_activities)))
+
+    def case_never_together(self):
+        """
+        Returns for every case the pairs (a, b) of which exactly one activity occurs in the case.
+        :return: packed bit matrices, numpy.ndarray of uint64 cases x activities x words, rows in the order of self.cases
+        """
+        return self._case_relations(lambda present: present[:, :, None] != present[:, None, :])
+
+    def case_equivalence(self, occurrences=None):
+        """
+        Returns for every case the pairs (a, b) for which the activity that occurs in more cases
+        (the first one on ties) occurs in the case.
+        :param occurrences: number of cases every activity occurs in, defaults to the cases of the matrix
+        :return: packed bit matrices, numpy.ndarray of uint64 cases x activities x words, rows in the order of self.cases
+        """
+        if occurrences is None:
+            occurrences = self.occurrences
+        num_activities = self.matrix.shape[1]
+        first_is_max = occurrences[:, None] >= occurrences[None, :]
+        diagonal = np.arange(num_activities)
+
+        def equivalence(present):
+            holds = np.where(first_is_max, present[:, :, None], present[:, None, :])
+            holds[:, diagonal, diagonal] = False
+            return holds
+
+        return self._case_relations(equivalence)
+
+    def case_counts(self):
+        """
+        Returns for every case the number of occurrences of every activity.
+        :return: numpy.ndarray cases x activities, rows in the order of self.cases
+        """
+        return self.matrix.toarray().astype(np.int64)
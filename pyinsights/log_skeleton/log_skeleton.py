@@ -1,9 +1,15 @@
 from pycelonis.celonis_api.pql.pql import PQL, PQLColumn, PQLFilter
 import numpy as np
-import itertools
 from tqdm import tqdm
-import math
 import pandas as pd
+from contextlib import contextmanager
+from functools import partial
+from pyinsights.snapshot import local_log
+from pyinsights.log_skeleton.position_matrix import PositionMatrix
+from pyinsights.log_skeleton.count_matrix import CountMatrix
+from pyinsights.log_skeleton.bitset import RELATIONS, TraceBitset, pack, set_bits
+from pyinsights.log_skeleton.statistics import SkeletonStatistics
+from pyinsights.log_skeleton.parallel import run_tasks
 
 
 class LogSkeleton:
@@ -17,9 +23,12 @@ class LogSkeleton:
     timestamp = None
     transition_mode = None
 
-    def __init__(self, connector):
+    def __init__(self, connector, snapshot=None, max_workers=None):
         """
         :param connector: Connector object
+        :param snapshot: EventSnapshot to compute on instead of querying celonis
+        :param max_workers: number of threads fetching the datasets and computing the relations concurrently,
+            defaults to one per relation (at most the number of cpus), 1 computes them one after another
         """
         global datamodel
         global activity_table
@@ -29,64 +38,106 @@ class LogSkeleton:
         global transition_mode
 
         self.connector = connector
+        self.max_workers = max_workers
         datamodel = self.connector.datamodel
         activity_table = self.connector.activity_table()
         case_col = self.connector.case_col()
         act_col = self.connector.activity_col()
         timestamp = self.connector.timestamp()
         transition_mode = "ANY_OCCURRENCE[] TO ANY_OCCURRENCE[]"
+        # in-memory logs (snapshot or offline connector) are fetched natively
+        self.local_log = local_log(self.connector, snapshot)
+        # datasets shared by all relations, see _shared_fetches
+        self._fetched = None
 
     def get_log_skeleton(self, noise_threshold=0):
         """
         Returns the log skeleton of the data model.
+        the model can be saved and used to check new cases, see check
         :param noise_threshold: [0,1]
-        :return: relations and active frequencies as dict
+        :return: relations and active frequencies as LogSkeletonModel (dict)
         """
-        log_skeleton = None
-        # Get the extended log
-        equivalence, always_after, always_before, never_together, directly_follows \
-            = self._get_relations(noise_threshold)
+        return self.get_statistics().log_skeleton(noise_threshold)
 
-        active_frequs = self._active_freq()
-
-        log_skeleton = {"equivalence": equivalence, "always_after": always_after, "always_before": always_before, "never_together": never_together,
-                        "directly_follows": directly_follows, "activ_freq": active_frequs}
+    def get_statistics(self):
+        """
+        Returns the sufficient statistics of the log skeleton. statistics of new cases can be added to (or removed from)
+        them, and the log skeleton for any noise threshold can be derived without fetching the log again.
+        :return: SkeletonStatistics
+        """
+        with self._shared_fetches():
+            activities = self._get_activities()
+            matrices = run_tasks({"positions": lambda: PositionMatrix(self._get_activity_order(), case_col, act_col,
+                                                                      activities=activities),
+                                  "counts": lambda: CountMatrix(self._get_activation_counts(), case_col, act_col,
+                                                                activities=activities)},
+                                 self.max_workers)
+            edge_table = self._get_edges()
 
-        return log_skeleton
+        return SkeletonStatistics.from_matrices(matrices["positions"], matrices["counts"], edge_table, case_col,
+                                                max_workers=self.max_workers)
 
     def get_log_skeleton_per_case(self, case_id):
         """
-        Returns the log skeleton per trace
-        :param noise_threshold: [0,1]
+        Returns the log skeleton per trace.
+        cases with the same trace (variant) share their relations, they are computed once per variant
+        :param case_id: str
         :return: dict of the form case_id : lsk of trace as dict
         """
-        log_skeleton = None
-        # Get the extended log
-
-        equivalence, always_after, always_before, never_together, directly_follows \
-            = self._get_relations_per_case(case_id=case_id)
+        traces, case_variants = self._get_log_skeleton_per_variant(case_id)
 
-        active_frequs = self._active_freq_per_case()
+        # dict of sets view of the bitsets, broadcast from variants to their cases
+        log_skeleton = {}
+        for relation in RELATIONS:
+            pairs = {variant: traces.pairs(relation, variant)
+                     for variant in case_variants[relation].unique()}
+            log_skeleton[relation] = {case: pairs[variant]
+                                      for case, variant in case_variants[relation].items()}
 
-        log_skeleton = {"equivalence": equivalence, "always_after": always_after, "always_before": always_before, "never_together": never_together,
-                        "directly_follows": directly_follows, "activ_freq": active_frequs}
+        frequencies = {variant: traces.frequencies(variant)
+                       for variant in case_variants["activ_freq"].unique()}
+        log_skeleton["activ_freq"] = {case: frequencies[variant]
+                                      for case, variant in case_variants["activ_freq"].items()}
 
         return log_skeleton
 
+    def _get_log_skeleton_per_variant(self, case_id=None, activities=None):
+        """
+        Returns the log skeleton of every variant as bitsets and the variant of every case.
+        the variant of a case is its row in the bitsets
+        :param case_id: str
+        :param activities: activities of the bitsets, defaults to the activities of the log
+        :return: (TraceBitset, dict of the form relation : variant of every case)
+        """
+        with self._shared_fetches():
+            variants = self._get_variants()
+            if activities is None:
+                activities = self._get_activities()
+            traces = TraceBitset(activities, variants.max() + 1)
+
+            # every relation writes its own bitsets, so they are computed concurrently
+            stages = {"equivalence": self._get_equivalence_per_variant,
+                      "always_after": self._get_always_after_per_variant,
+                      "always_before": self._get_always_before_per_variant,
+                      "never_together": self._get_never_together_per_variant,
+                      "directly_follows": self._get_directly_follows_per_variant}
+            tasks = {relation: partial(stage, traces, variants, case_id=case_id)
+                     for relation, stage in stages.items()}
+            tasks["activ_freq"] = partial(
+                self._active_freq_per_variant, traces, variants)
+            case_variants = run_tasks(tasks, self.max_workers)
+
+        return traces, case_variants
+
     def _extend_log(self):
         """
         Extends the log by adding an artificial start and end event to each trace.
         :return: pandas.DataFrame
         """
-        query = PQL()
-        query.add(PQLColumn(name=act_col,
-                            query=f"""  "{activity_table}"."{act_col}" """))
-        query.add(PQLColumn(name=case_col,
-                            query=f"""  "{activity_table}"."{case_col}" """))
-        query.add(PQLColumn(name=timestamp,
-                            query=f"""    "{activity_table}"."{timestamp}"  """))
-
-        df = datamodel.get_data_frame(query)
+        if self.local_log is not None:
+            df = self.local_log.events()
+        else:
+            df = self.connector.events()
 
         # should be sorted by timestamp per default by celonis but we sort it just to be sure
         sorted_by_timestamp = df.sort_values(timestamp)
@@ -94,103 +145,19 @@ class LogSkeleton:
             by=case_col).agg({act_col: lambda x: ["START"] + list(x) + ["END"]})  # construct the bag of traces while adding an artificial start and end
         return bag_of_traces.values
 
-    def _get_relations(self, noise_threshold=0, case_id=None):
-        """
-        Returns the relations of the log skeleton.
-        :param noise_threshold: [0,1]
-        :return: (equivalence, always_after, always_before, never_together, directly_follows)
-        """
-        equivalence = self._get_equivalence(noise_threshold, case_id=case_id)
-        always_after = self._get_always_after(noise_threshold, case_id)
-        always_before = self._get_always_before(
-            noise_threshold, case_id=case_id)
-        never_together = self._get_never_together(
-            noise_threshold, case_id=case_id)
-        directly_follows = self._get_directly_follows(
-            noise_threshold, case_id=case_id)
-        # Get the relations
-
-        return equivalence, always_after, always_before, never_together, directly_follows
-
-    def _get_relations_per_case(self, case_id=None):
-        """
-        Returns the relations per case
-        :param noise_threshold: [0,1]
-        :return: (equivalence, always_after, always_before, never_together, directly_follows)
-        """
-        equivalence = self._get_equivalence_per_case(case_id=case_id)
-        always_after = self._get_always_after_per_case(case_id)
-        always_before = self._get_always_before_per_case(case_id=case_id)
-        never_together = self._get_never_together_per_case(case_id=case_id)
-        directly_follows = self._get_directly_follows_per_case(case_id=case_id)
-        # Get the relations
-
-        return equivalence, always_after, always_before, never_together, directly_follows
-
     def _get_equivalence(self, noise_threshold, case_id=None):
         """
         Returns the equivalence relation of the log skeleton. two activities are related if and only if they occur equally often in every trace
         :param noise_threshold: [0,1]
         :return: set
         """
-        equivalence = set()
         # Get the number of occurrences of each activity per case
+        df = self._get_activation_counts(case_id)
+        counts = CountMatrix(df, case_col, act_col)
 
-        query = PQL()
-        query.add(PQLColumn(name=case_col,
-                            query=f"""DISTINCT "{activity_table}"."{case_col}"  """))
-        query.add(PQLColumn(name=act_col,
-                            query=f""" "{activity_table}"."{act_col}"  """))
-        query.add(PQLColumn(
-            name="max nr", query=f"""
-                PU_MAX( DOMAIN_TABLE("{activity_table}"."{case_col}", "{activity_table}"."{act_col}"),
-                ACTIVATION_COUNT ( "{activity_table}"."{act_col}" ) ) """))
-
-        if case_id is not None:
-            query.add(self._get_case_id_filter(case_id))
-
-        df = datamodel.get_data_frame(query)
-        num_cases = df[case_col].nunique()
-        # group by activity
-        grouped = df.groupby(by=[act_col], axis=0)
-        # get groups as dict
-        groups = grouped.groups
-        # currently groups contain only row index, expand with case id and count
-        groups_expanded = {k: df.loc[v, [case_col, "max nr"]]
-                           for k, v in groups.items()}
-        # get all pairs of activities
-        combs = itertools.permutations(groups_expanded.keys(), 2)
-        bar = tqdm(list(combs))
-        bar.set_description("Calculating equivalence")
-        # iterate over pairs
-        for pair in bar:
-            occ_act1 = groups_expanded[pair[0]]
-            occ_act2 = groups_expanded[pair[1]]
-            # determine activity that occurs more times
-            if len(occ_act1) >= len(occ_act2):
-                max = pair[0]
-                min = pair[1]
-            else:
-                max = pair[1]
-                min = pair[0]
-
-            # get profiles for larger and smaller acts
-            occ_max = groups_expanded[max]
-            occ_min = groups_expanded[min]
-
-            occurrences_max = len(groups_expanded[max])
-
-            # get difference betwwen two profiles
-
-            differences = occ_max.merge(
-                occ_min, indicator=True, how='left').loc[lambda x: x['_merge'] != 'both']
-
-            # if the two profiles deviate no more than noise * size of larger profile
-            # they are equivalent
-            if len(differences) <= occurrences_max*noise_threshold:
-                equivalence.add(pair)
-
-        return equivalence
+        # if the two profiles deviate in no more than noise * size of larger profile
+        # they are equivalent
+        return counts.equivalence(noise_threshold)
 
     def _get_always_after(self, noise_threshold, case_id=None):
         """
@@ -200,65 +167,16 @@ class LogSkeleton:
         :param case_id: str
         :return: set
         """
-        always_after = set()
-        # Get the always after relation
         # get for every activity its position in the trace
-        query = PQL()
-        query.add(PQLColumn(name=case_col,
-                            query=f""" "{activity_table}"."{case_col}"  """))
-        query.add(PQLColumn(name=act_col,
-                            query=f""" "{activity_table}"."{act_col}"  """))
-        query.add(PQLColumn(
-            name="order", query=f""" INDEX_ACTIVITY_ORDER( "{activity_table}"."{act_col}")
-                         """))
+        df = self._get_activity_order(case_id)
+        positions = PositionMatrix(df, case_col, act_col)
 
-        if case_id is not None:
-            query.add(self._get_case_id_filter(case_id))
+        # for every pair count the cases where the last occurrence of act2 is after the last occurrence of act1,
+        # for act1 == act2 the cases where act1 occurs more than once
+        support = positions.order_support()
 
-        df = datamodel.get_data_frame(query)
-
-        num_cases = df[case_col].nunique()
-        # group by activity
-        grouped = df.groupby(by=[act_col], axis=0)
-        # get groups as dict
-        groups = grouped.groups
-        # currently groups contain only row index, expand with case id and count
-        groups_expanded = {k: df.loc[v, [case_col, "order"]]
-                           for k, v in groups.items()}
-
-        # get cartesian product of activities (because relation is not symmetrical)
-        combs = itertools.product(groups_expanded.keys(), repeat=2)
-
-        bar = tqdm(list(combs))
-        bar.set_description("Calculating always-after")
-        # iterate over pairs
-        for pair in bar:
-            # get cases where act1 occurs merged with occurrences of act2 in these cases
-            merged = groups_expanded[pair[0]].merge(
-                groups_expanded[pair[1]], how="left", on=case_col)
-
-            # get the result per case and get compute for every case
-            # the greatest position for both activities
-            grouped = merged.groupby(case_col)
-            pos_per_case = grouped.agg({'order_x': 'max',
-                                        'order_y': 'max'})
-
-            # fill nas so they don't screw up max
-            pos_per_case.fillna(0, inplace=True)
-
-            # length of act1's profile
-            num = groups_expanded[pair[0]][case_col].nunique()
-
-            # handling if both activities are the same
-            if pair[0] == pair[1]:
-                # if they actually occur more than 1 time in every case --> they are in the relation
-                if np.sum(merged[case_col].value_counts() > 1) >= num*(1-noise_threshold):
-                    always_after.add(pair)
-            # else test if the last occurrence of act2 is after the last occurrence of act1
-            # in at least (1-noise) percent of times act1 occurs
-            elif np.sum(pos_per_case["order_x"] <= pos_per_case["order_y"]) >= num*(1-noise_threshold):
-                always_after.add(pair)
-        return always_after
+        # relation holds in at least (1-noise) percent of cases act1 occurs
+        return positions.relation(support, noise_threshold)
 
     def _get_always_before(self, noise_threshold, case_id=None):
         """
@@ -266,121 +184,29 @@ class LogSkeleton:
         :param noise_threshold: [0,1]
         :return: set
         """
-        always_before = set()
-        # Get the always after relation
         # get for every activity its position in the trace
-        query = PQL()
-        query.add(PQLColumn(name=case_col,
-                            query=f""" "{activity_table}"."{case_col}"  """))
-        query.add(PQLColumn(name=act_col,
-                            query=f""" "{activity_table}"."{act_col}"  """))
-        query.add(PQLColumn(
-            name="order", query=f""" INDEX_ACTIVITY_ORDER( "{activity_table}"."{act_col}")
-                                 """))
+        df = self._get_activity_order(case_id)
+        positions = PositionMatrix(df, case_col, act_col)
 
-        if case_id is not None:
-            query.add(self._get_case_id_filter(case_id))
+        # for every pair count the cases where the first occurrence of act1 is after the first occurrence of act2,
+        # for act1 == act2 the cases where act1 occurs more than once
+        support = positions.order_support(before=True)
 
-        df = datamodel.get_data_frame(query)
-        num_cases = df[case_col].nunique()
-        # group by activity
-        grouped = df.groupby(by=[act_col], axis=0)
-        # get groups as dict
-        groups = grouped.groups
-        # currently groups contain only row index, expand with case id and count
-        groups_expanded = {k: df.loc[v, [case_col, "order"]]
-                           for k, v in groups.items()}
-
-        # get cartesian product of activities (because relation is not symmetrical)
-        combs = itertools.product(groups_expanded.keys(), repeat=2)
-        # iterate over pairs
-
-        bar = tqdm(list(combs))
-        bar.set_description("Calculating always-before")
-        for pair in bar:
-
-            # get positions of both acts in one df
-            merged = groups_expanded[pair[0]].merge(
-                groups_expanded[pair[1]], on=case_col, how='left')
-            # replace nas so they don't mess up the minimum
-            merged.fillna(10000000000, inplace=True)
-            # get the result per column and compute for every case
-            # the lowest position for both activities
-            grouped = merged.groupby(case_col)
-            test = grouped.agg({'order_x': 'min',
-                                'order_y': 'min'})
-
-            # length of act1's profile
-            num = groups_expanded[pair[0]][case_col].nunique()
-            # handling if both activities are the same
-            if pair[0] == pair[1]:
-                # if they actually occur more than 1 time in every case --> they are in the relation
-                if np.sum(merged[case_col].value_counts() > 1) >= num*(1-noise_threshold):
-                    always_before.add(pair)
-
-            # else test if the first occurrence of act1 is after the first occurrence of act2
-            # in more than (1-noise) times act1 occurs
-            elif np.sum(test["order_x"] >= test["order_y"]) >= num*(1-noise_threshold):
-                always_before.add(pair)
-
-        return always_before
+        # relation holds in at least (1-noise) percent of cases act1 occurs
+        return positions.relation(support, noise_threshold)
 
     def _get_never_together(self, noise_threshold, case_id=None):
         """
         Returns the never together relation of the log skeleton. two activities are related if and only if they do not occur together in any trace.
         :return: set
         """
-        never_together = set()
-
-        # Get the never together relation
-        query = PQL()
-        query.add(PQLColumn(name=case_col,
-                            query=f"""DISTINCT "{activity_table}"."{case_col}"  """))
-        query.add(PQLColumn(name=act_col,
-                            query=f""" "{activity_table}"."{act_col}"  """))
-        query.add(PQLColumn(
-            name="max nr", query=f"""
-                        PU_MAX( DOMAIN_TABLE("{activity_table}"."{case_col}", "{activity_table}"."{act_col}"),
-                        ACTIVATION_COUNT ( "{activity_table}"."{act_col}" ) ) """))
-        if case_id is not None:
-            query.add(self._get_case_id_filter(case_id))
+        # Get the number of occurrences of each activity per case
+        df = self._get_activation_counts(case_id)
+        counts = CountMatrix(df, case_col, act_col)
 
-        df = datamodel.get_data_frame(query)
-        num_cases = df[case_col].nunique()
-        # group by activity
-        grouped = df.groupby(by=[act_col], axis=0)
-        # get groups as dict
-        groups = grouped.groups
-        # currently groups contain only row index, expand with case id and count
-        groups_expanded = {k: df.loc[v, [case_col, "max nr"]]
-                           for k, v in groups.items()}
-
-        # get all pairs of activities
-        combs = itertools.permutations(groups_expanded.keys(), 2)
-
-        bar = tqdm(list(combs))
-        bar.set_description("Calculating never-together")
-        # iterate over pairs
-        for pair in bar:
-            occ_act1 = groups_expanded[pair[0]][case_col]
-            occ_act2 = groups_expanded[pair[1]][case_col]
-            # determine activity that occurs more times
-            if len(occ_act1) >= len(occ_act2):
-                max = pair[0]
-                min = pair[1]
-            else:
-                max = pair[1]
-                min = pair[0]
-
-            # larger and smaller profile w.r.t. cases
-            occ_max = groups_expanded[max][case_col]
-            occ_min = groups_expanded[min][case_col]
-            num = len(occ_max)
-            # check if smaller profile and larger profile do not occur together
-            # more than num_cases * noise
-            if np.sum(occ_max.isin(occ_min)) <= num*(noise_threshold):
-                never_together.add(pair)
-        return never_together
+        # check if smaller profile and larger profile do not occur together
+        # in more than num * noise cases
+        return counts.never_together(noise_threshold)
 
     def _get_directly_follows(self, noise_threshold, case_id=None):
         """
@@ -388,25 +214,14 @@ class LogSkeleton:
         :param noise_threshold: [0,1]
         :return: set
         """
-        query = PQL()
-        query.add(
-            PQLColumn(name="ID", query=f""" SOURCE("{activity_table}"."{case_col}") """))
-        query.add(PQLColumn(name="SOURCE",
-                  query=f""" SOURCE ( "{activity_table}"."{act_col}" ) """))
-        query.add(PQLColumn(name="TARGET",
-                  query=f"""  TARGET ( "{activity_table}"."{act_col}") """))
+        edge_table = self._get_edges(case_id)
 
-        if case_id is not None:
-            query.add(self._get_case_id_filter(case_id))
-
-        edge_table = datamodel.get_data_frame(query)
-
-        case_count = edge_table['ID'].nunique()  # number of cases in the log
+        case_count = edge_table[case_col].nunique()  # number of cases in the log
         # threshold above which we consider the relation as a direct follow
         threshold = (1-noise_threshold) * case_count
 
         edge_table = edge_table.groupby(
-            ['ID', 'SOURCE', 'TARGET']).size().reset_index(name='count')
+            [case_col, 'SOURCE', 'TARGET']).size().reset_index(name='count')
 
         # set all counts to 1 since we only consider whether the relation exists or not (not how often) (also need this for the filter below)
         edge_table['count'] = 1
@@ -433,53 +248,80 @@ class LogSkeleton:
         Checks for each trace in the log, whether it is fitting or not.
         :return: dataframe with ids of non-conforming cases
         """
-        events = self.connector.events()
-        num_activities = events[act_col].nunique()
-        # get lsk
-        lsk = self.get_log_skeleton(noise_threshold)
-        # get lsk per trace
-        lsk_compare_traces = self.get_log_skeleton_per_case(
-            case_id=cases_to_compare)
-
-        # check for each case if relation is subset of lsk
+        # fetch every dataset once, lsk and lsk per variant are both computed from them
+        with self._shared_fetches():
+            return self.check(self.get_log_skeleton(noise_threshold), cases_to_compare=cases_to_compare)
 
-        non_conforming = {case for relation in lsk_compare_traces.keys(
-        ) for case in lsk_compare_traces[relation].keys() if not self._conforms(lsk_compare_traces, relation, case, lsk, noise_threshold, num_activities)}
+    def check(self, model, cases_to_compare=None):
+        """
+        Checks for each trace in the log, whether it fits a log skeleton that was computed before
+        (possibly on another log), without recomputing the log skeleton.
+        relations are compared as bitsets, once per variant, and broadcast to its cases.
+        relaxed problem: the difference between the relations can have up to noise-threshold * number of pairs elements, and still conform
+        :param model: LogSkeletonModel as returned by get_log_skeleton or LogSkeletonModel.load
+        :param cases_to_compare: str
+        :return: dataframe with ids of non-conforming cases
+        """
+        with self._shared_fetches():
+            # activities unknown to the model are appended
+            known = set(model.activities)
+            activities = model.activities + \
+                [act for act in self._get_activities() if act not in known]
+            # get lsk per variant
+            traces, case_variants = self._get_log_skeleton_per_variant(
+                case_id=cases_to_compare, activities=activities)
+
+        return self._non_conforming(model, traces, case_variants)
+
+    def get_conformance_curve(self, noise_thresholds, cases_to_compare=None):
+        """
+        Computes the log skeleton and the non-conforming cases for several noise thresholds at once.
+        the log is fetched once, support counts and relations per variant are computed once and
+        only the thresholds are applied per noise threshold.
+        :param noise_thresholds: list of noise thresholds [0,1]
+        :param cases_to_compare: str
+        :return: dict with "curve" (dataframe with number of non-conforming cases per noise threshold),
+            "log skeletons" and "non-conforming cases" (dicts of the form noise threshold : result)
+        """
+        with self._shared_fetches():
+            statistics = self.get_statistics()
+            traces, case_variants = self._get_log_skeleton_per_variant(
+                case_id=cases_to_compare)
+
+        log_skeletons = {}
+        non_conforming = {}
+        for noise_threshold in noise_thresholds:
+            log_skeletons[noise_threshold] = statistics.log_skeleton(
+                noise_threshold)
+            non_conforming[noise_threshold] = self._non_conforming(
+                log_skeletons[noise_threshold], traces, case_variants)
+
+        curve = pd.DataFrame({"noise threshold": list(noise_thresholds),
+                              "non-conforming cases": [len(non_conforming[noise_threshold]) for noise_threshold in noise_thresholds]})
+
+        return {"curve": curve, "log skeletons": log_skeletons, "non-conforming cases": non_conforming}
+
+    def _non_conforming(self, model, traces, case_variants):
+        """
+        Returns the cases whose variant violates the log skeleton.
+        :param model: LogSkeletonModel
+        :param traces: TraceBitset with a row per variant, its activities start with the activities of the model
+        :param case_variants: dict of the form relation : variant of every case
+        :return: dataframe with ids of non-conforming cases
+        """
+        # check for each variant if relation is subset of lsk
+        violations = model.bitset.reindex(traces.activities).violations(
+            traces, model.noise_threshold)
+        non_conforming = set()
+        for relation, violated in violations.items():
+            cases = case_variants[relation]
+            non_conforming.update(cases.index[violated[cases.values]])
 
         # return non-conforming cases as df
         df = pd.DataFrame(columns=[case_col], data=non_conforming)
 
         return df
 
-    def _conforms(self, lsk_traces, relation, case, lsk, noise_threshold, num_activities):
-        """checks if relation of trace conforms to lsk
-            relaxed problem: the difference between the relations can have up to noise-threshold * number of pairs elements, and still conform
-        Args:
-            lsk_traces (_type_): _description_
-            relation (_type_): _description_
-            case (_type_): _description_
-            lsk (_type_): _description_
-        Returns:
-            bool: conformity
-        """
-        if relation == "activ_freq":
-            for act in lsk[relation].keys():
-                if not lsk_traces[relation][case][act].issubset(lsk[relation][act]):
-                    return False
-
-        elif relation not in ['equivalence', 'never_together']:
-            num_pairs = num_activities**2
-            difference = lsk_traces[relation][case].difference(lsk[relation])
-            if len(difference) > num_pairs*noise_threshold:
-                return False
-        else:
-            num_pairs = math.factorial(
-                num_activities) / math.factorial(num_activities-2)
-            difference = lsk_traces[relation][case].difference(lsk[relation])
-            if len(difference) > num_pairs*noise_threshold:
-                return False
-        return True
-
     def _get_conformance_for_case(self, case_id, relations, noise_threshold):
         """
         Checks whether the given trace is fitting or not.
@@ -526,46 +368,53 @@ class LogSkeleton:
             case_id = f""" '{case_id}' """
         return PQLFilter(query=f""" "{activity_table}"."{case_col}" = {case_id} """)
 
-    def _active_freq(self):
-        """
-        returns for each activity, the number of possible occurrences per trace
-        :return:
+    @contextmanager
+    def _shared_fetches(self):
+        """
+        Fetches each distinct dataset of the relations exactly once (activation counts,
+        activity order and directly-follows edges). Inside the context, all fetches are served
+        from these datasets, fetches for a case id are filtered in memory.
+        :return: dict of datasets
+        """
+        # already planned by caller
+        if self._fetched is not None:
+            yield self._fetched
+            return
+
+        # the fetches are independent and wait on celonis, so they run concurrently
+        self._fetched = run_tasks({"activation counts": self._get_activation_counts,
+                                   "activity order": self._get_activity_order,
+                                   "edges": self._get_edges},
+                                  self.max_workers)
+        try:
+            yield self._fetched
+        finally:
+            self._fetched = None
+
+    def _from_fetched(self, dataset, case_id):
+        """
+        Returns a shared dataset, filtered to case_id.
+        :param dataset: key of dataset
+        :param case_id: str
+        :return: pandas.DataFrame
         """
-        query = PQL()
-        query.add(PQLColumn(name=case_col,
-                            query=f"""DISTINCT "{activity_table}"."{case_col}"  """))
-        query.add(PQLColumn(name=act_col,
-                            query=f""" "{activity_table}"."{act_col}"  """))
-        query.add(PQLColumn(
-            name="max nr", query=f"""
-                        PU_MAX( DOMAIN_TABLE("{activity_table}"."{case_col}", "{activity_table}"."{act_col}"),
-                        ACTIVATION_COUNT ( "{activity_table}"."{act_col}" ) ) """))
-
-        df = datamodel.get_data_frame(query)
-
-        case_ids = list(df[case_col].unique())
-        # group by activity
-        grouped = df.groupby(by=[act_col], axis=0)
-        # get groups as dict
-        groups = grouped.groups
-        # currently groups contain only row index, expand with case id and count
-        groups_expanded = {k: df.loc[v, [case_col, "max nr"]]
-                           for k, v in groups.items()}
-
-        bar = tqdm(groups_expanded.items())
-        bar.set_description("Computing active frequencies")
-        for act, occ in bar:
-            groups_expanded[act] = set(groups_expanded[act]["max nr"])
-            if not (case_ids == list(occ[case_col].unique())):
-                groups_expanded[act].add(0)
-
-        return groups_expanded
+        df = self._fetched[dataset]
+        if case_id is None:
+            return df
+        # otherwise event logs with integer case ids wont work
+        return df[df[case_col].astype(str) == str(case_id)].reset_index(drop=True)
 
-    def _active_freq_per_case(self):
+    def _get_activation_counts(self, case_id=None):
         """
-        returns for each activity, the number of possible occurrences per trace
-        :return:
+        Returns for every case the number of occurrences of each activity.
+        :param case_id: str
+        :return: pandas.DataFrame with columns case, activity, "max nr"
         """
+        if self._fetched is not None:
+            return self._from_fetched("activation counts", case_id)
+        if self.local_log is not None:
+            return self.local_log.activation_counts(case_id)
+
         query = PQL()
         query.add(PQLColumn(name=case_col,
                             query=f"""DISTINCT "{activity_table}"."{case_col}"  """))
@@ -573,110 +422,25 @@ class LogSkeleton:
                             query=f""" "{activity_table}"."{act_col}"  """))
         query.add(PQLColumn(
             name="max nr", query=f"""
-                        PU_MAX( DOMAIN_TABLE("{activity_table}"."{case_col}", "{activity_table}"."{act_col}"),
-                        ACTIVATION_COUNT ( "{activity_table}"."{act_col}" ) ) """))
-
-        df = datamodel.get_data_frame(query)
-
-        case_ids = list(df[case_col].unique())
-        activities = list(df[act_col].unique())
-        # group by case
-        grouped = df.groupby(by=[case_col], axis=0)
-        # init active frquencies as 0 per case per activity
-        all_freqs_per_case = {case: {act: {0}
-                                     for act in activities} for case in case_ids}
+                PU_MAX( DOMAIN_TABLE("{activity_table}"."{case_col}", "{activity_table}"."{act_col}"),
+                ACTIVATION_COUNT ( "{activity_table}"."{act_col}" ) ) """))
 
-        # set the frequencies in the dict for every case
-        bar = tqdm(grouped)
-        bar.set_description("Computing active-frequencies per case")
-        for group_name, df_group in bar:
-            for index, row in df_group.iterrows():
-                all_freqs_per_case[group_name][row[act_col]] = {row["max nr"]}
+        if case_id is not None:
+            query.add(self._get_case_id_filter(case_id))
 
-        return all_freqs_per_case
+        return self.connector.get_data_frame(query)
 
-    def _get_always_before_per_case(self, case_id=None):
+    def _get_activity_order(self, case_id=None):
         """
-        Returns the always before relation per case.  two activities are related if and only if before any occurrence of the first activity the second activity always occurs.
-        :param noise_threshold: [0,1]
-        :return: set
+        Returns for every event its position in the trace.
+        :param case_id: str
+        :return: pandas.DataFrame with columns case, activity, "order"
         """
-        always_before = set()
-        # Get the always after relation
-        # get for every activity its position in the trace
-        query = PQL()
-        query.add(PQLColumn(name=case_col,
-                            query=f""" "{activity_table}"."{case_col}"  """))
-        query.add(PQLColumn(name=act_col,
-                            query=f""" "{activity_table}"."{act_col}"  """))
-        query.add(PQLColumn(
-            name="order", query=f""" INDEX_ACTIVITY_ORDER( "{activity_table}"."{act_col}")
-                                    """))
-
-        if case_id is not None:
-            query.add(self._get_case_id_filter(case_id))
+        if self._fetched is not None:
+            return self._from_fetched("activity order", case_id)
+        if self.local_log is not None:
+            return self.local_log.activity_order(case_id)
 
-        df = datamodel.get_data_frame(query)
-
-        case_ids = df[case_col].unique()
-        ab_all_cases = {case: set() for case in case_ids}
-
-        # group by activity
-        grouped = df.groupby(by=[act_col], axis=0)
-        # get groups as dict
-        groups = grouped.groups
-        # currently groups contain only row index, expand with case id and count
-        groups_expanded = {k: df.loc[v, [case_col, "order"]]
-                           for k, v in groups.items()}
-
-        # get cartesian product of activities (because relation is not symmetrical)
-        combs = itertools.product(groups_expanded.keys(), repeat=2)
-
-        # iterate over pairs
-
-        bar = tqdm(list(combs))
-        bar.set_description("Calculating always-before for cases")
-        for pair in bar:
-
-            # get positions of both acts in one df
-            merged = groups_expanded[pair[0]].merge(
-                groups_expanded[pair[1]], on=case_col, how='left')
-            # replace nas so they don't mess up the minimum
-            merged.fillna(10000000000, inplace=True)
-            # get the result per column and compute for every case
-            # the lowest position for both activities
-            grouped = merged.groupby(case_col)
-            test = grouped.agg({'order_x': 'min',
-                                'order_y': 'min'})
-
-            # handling if both activities are the same
-            if pair[0] == pair[1]:
-                # if they actually occur more than 1 time in case --> they are in the relation
-                indices = np.where(merged[case_col].value_counts() > 1)
-                case_ids_ab = list(
-                    merged[case_col].value_counts().iloc[indices[0]].index)
-
-            else:
-                # get cases where first occurence of act1 is after act2
-                indices = np.where(test['order_x'] >= test['order_y'])
-                if len(indices[0]) > 0:
-                    case_ids_ab = test.iloc[indices[0], :].index
-                else:
-                    case_ids_ab = []
-
-            # add pair to dict for cases from before
-            for index in case_ids_ab:
-                ab_all_cases[index].add(pair)
-        return ab_all_cases
-
-    def _get_always_after_per_case(self, case_id=None):
-        """
-        Returns the always before relation per case.  two activities are related if and only if before any occurrence of the first activity the second activity always occurs.
-        :param noise_threshold: [0,1]
-        :return: set
-        """
-        # Get the always after relation
-        # get for every activity its position in the trace
         query = PQL()
         query.add(PQLColumn(name=case_col,
                             query=f""" "{activity_table}"."{case_col}"  """))
@@ -684,195 +448,24 @@ class LogSkeleton:
                             query=f""" "{activity_table}"."{act_col}"  """))
         query.add(PQLColumn(
             name="order", query=f""" INDEX_ACTIVITY_ORDER( "{activity_table}"."{act_col}")
-                                        """))
+                         """))
 
         if case_id is not None:
             query.add(self._get_case_id_filter(case_id))
 
-        df = datamodel.get_data_frame(query)
-
-        case_ids = df[case_col].unique()
-        aa_all_cases = {case: set() for case in case_ids}
-
-        # group by activity
-        grouped = df.groupby(by=[act_col], axis=0)
-        # get groups as dict
-        groups = grouped.groups
-        # currently groups contain only row index, expand with case id and count
-        groups_expanded = {k: df.loc[v, [case_col, "order"]]
-                           for k, v in groups.items()}
-
-        # get cartesian product of activities (because relation is not symmetrical)
-        combs = itertools.product(groups_expanded.keys(), repeat=2)
-
-        # iterate over pairs
-
-        bar = tqdm(list(combs))
-        bar.set_description("Calculating always-after for cases")
-        for pair in bar:
-
-            # get positions of both acts in one df
-            merged = groups_expanded[pair[0]].merge(
-                groups_expanded[pair[1]], on=case_col, how='left')
-            # replace nas so they don't mess up the minimum
-            merged.fillna(0, inplace=True)
-            # get the result per column and compute for every case
-            # the lowest position for both activities
-            grouped = merged.groupby(case_col)
-            test = grouped.agg({'order_x': 'max',
-                                'order_y': 'max'})
-
-            # handling if both activities are the same
-            if pair[0] == pair[1]:
-                # if they actually occur more than 1 time in case --> they are in the relation
-                indices = np.where(merged[case_col].value_counts() > 1)
-                case_ids_aa = list(
-                    merged[case_col].value_counts().iloc[indices[0]].index)
-
-            else:
-                # get cases where first occurence of act1 is after act2
-                indices = np.where(test['order_x'] >= test['order_y'])
-                if len(indices[0]) > 0:
-                    case_ids_aa = test.iloc[indices[0], :].index
-                else:
-                    case_ids_aa = []
-
-            # add pair to dict for cases from before
-            for index in case_ids_aa:
-                aa_all_cases[index].add(pair)
-
-        return aa_all_cases
-
-    def _get_never_together_per_case(self, case_id=None):
-        """
-        Returns the never together relation per case. two activities are related if and only if they do not occur together in any trace.
-        :return: set
-        """
-        # Get the never together relation
-        query = PQL()
-        query.add(PQLColumn(name=case_col,
-                            query=f"""DISTINCT "{activity_table}"."{case_col}"  """))
-        query.add(PQLColumn(name=act_col,
-                            query=f""" "{activity_table}"."{act_col}"  """))
-        query.add(PQLColumn(
-            name="max nr", query=f"""
-                        PU_MAX( DOMAIN_TABLE("{activity_table}"."{case_col}", "{activity_table}"."{act_col}"),
-                        ACTIVATION_COUNT ( "{activity_table}"."{act_col}" ) ) """))
-        if case_id is not None:
-            query.add(self._get_case_id_filter(case_id))
-        df = datamodel.get_data_frame(query)
-        # group by activity
-        grouped = df.groupby(by=[act_col], axis=0)
-        # get groups as dict
-        groups = grouped.groups
-        # currently groups contain only row index, expand with case id and count
-        groups_expanded = {k: df.loc[v, [case_col, "max nr"]]
-                           for k, v in groups.items()}
-
-        # get all pairs of activities
-        combs = itertools.permutations(groups_expanded.keys(), 2)
-
-        case_ids = df[case_col].unique()
-        nt_all_cases = {case: set() for case in case_ids}
-        bar = tqdm(list(combs))
-        bar.set_description("Calculating never-together for cases")
-        # iterate over pairs
-        for pair in bar:
-            occ_act1 = groups_expanded[pair[0]][case_col]
-            occ_act2 = groups_expanded[pair[1]][case_col]
-            # determine activity that occurs more times
-            if len(occ_act1) >= len(occ_act2):
-                max = pair[0]
-                min = pair[1]
-            else:
-                max = pair[1]
-                min = pair[0]
-
-            # larger and smaller profile w.r.t. cases
-            occ_max = set(groups_expanded[max][case_col])
-            occ_min = set(groups_expanded[min][case_col])
-
-            # check if smaller profile and larger profile do not occur together
-
-            nt_case_ids = occ_max.symmetric_difference(occ_min)
-            for case in nt_case_ids:
-                nt_all_cases[case].add(pair)
-        return nt_all_cases
-
-    def _get_equivalence_per_case(self, case_id=None):
+        return self.connector.get_data_frame(query)
+
+    def _get_edges(self, case_id=None):
         """
-        Returns the equivalence relation of the log skeleton. two activities are related if and only if they occur equally often in every trace
-        :param noise_threshold: [0,1]
-        :return: set
+        Returns the directly-follows edges of the traces.
+        :param case_id: str
+        :return: pandas.DataFrame with columns case, "SOURCE", "TARGET"
         """
-        # Get the number of occurrences of each activity per case
+        if self._fetched is not None:
+            return self._from_fetched("edges", case_id)
+        if self.local_log is not None:
+            return self.local_log.directly_follows(case_id)
 
-        query = PQL()
-        query.add(PQLColumn(name=case_col,
-                            query=f"""DISTINCT "{activity_table}"."{case_col}"  """))
-        query.add(PQLColumn(name=act_col,
-                            query=f""" "{activity_table}"."{act_col}"  """))
-        query.add(PQLColumn(
-            name="max nr", query=f"""
-                PU_MAX( DOMAIN_TABLE("{activity_table}"."{case_col}", "{activity_table}"."{act_col}"),
-                ACTIVATION_COUNT ( "{activity_table}"."{act_col}" ) ) """))
-
-        if case_id is not None:
-            query.add(self._get_case_id_filter(case_id))
-
-        df = datamodel.get_data_frame(query)
-
-        # group by activity
-        grouped = df.groupby(by=[act_col], axis=0)
-        # get groups as dict
-        groups = grouped.groups
-        # currently groups contain only row index, expand with case id and count
-        groups_expanded = {k: df.loc[v, [case_col, "max nr"]]
-                           for k, v in groups.items()}
-
-        case_ids = df[case_col].unique()
-        eq_all_cases = {case: set() for case in case_ids}
-        # get all pairs of activities
-        combs = itertools.permutations(groups_expanded.keys(), 2)
-        bar = tqdm(list(combs))
-        bar.set_description("Calculating equivalence for cases")
-        # iterate over pairs
-        for pair in bar:
-            occ_act1 = groups_expanded[pair[0]]
-            occ_act2 = groups_expanded[pair[1]]
-            # determine activity that occurs more times
-            if len(occ_act1) >= len(occ_act2):
-                max = pair[0]
-                min = pair[1]
-            else:
-                max = pair[1]
-                min = pair[0]
-
-            # get profiles for larger and smaller acts
-            occ_max = groups_expanded[max]
-            occ_min = groups_expanded[min]
-
-            occurrences_max = len(groups_expanded[max])
-
-            # get difference betwwen two profiles
-            differences = occ_max.merge(
-                occ_min, indicator=True, how='left').loc[lambda x: x['_merge'] != 'both']
-
-            # get all cases where max and min occur equivally often
-            equ_relation = [x for x in occ_max[case_col]
-                            if x not in differences[case_col]]
-            # y.loc[np.in1d(y['name'], names)
-            # add them to relation
-            for case in equ_relation:
-                eq_all_cases[case].add(pair)
-        return eq_all_cases
-
-    def _get_directly_follows_per_case(self, case_id=None):
-        """
-        Returns the directly follows relation per case. two activities are related if and only if an occurrence the first activity can directly be followed by an occurrence of the second.
-        :param noise_threshold: [0,1]
-        :return: set
-        """
         query = PQL()
         query.add(
             PQLColumn(name=case_col, query=f""" SOURCE("{activity_table}"."{case_col}") """))
@@ -884,20 +477,164 @@ class LogSkeleton:
         if case_id is not None:
             query.add(self._get_case_id_filter(case_id))
 
-        edge_table = datamodel.get_data_frame(query)
+        return self.connector.get_data_frame(query)
+
+    def _active_freq_per_variant(self, traces, variants):
+        """
+        sets for each variant the number of occurrences of every activity
+        :param traces: TraceBitset with a row per variant
+        :param variants: variant of every case, see _get_variants
+        :return: variant of every case
+        """
+        df = self._get_activation_counts()
+        df, case_variants = self._representatives(df, variants)
+        counts = CountMatrix(df, case_col, act_col,
+                             activities=traces.activities)
+        traces.counts[variants.loc[counts.cases].values] = counts.case_counts()
+
+        return case_variants
 
-        # number of cases in the log
-        case_count = edge_table[case_col].nunique()
+    def _get_activities(self):
+        """
+        Returns the activities of the log, their position is their index in the bitsets.
+        :return: list
+        """
+        df = self._get_activation_counts()
 
-        case_ids = edge_table[case_col].unique()
+        return list(df[act_col].dropna().unique())
 
-        df_all_cases = {case: set() for case in case_ids}
+    def _get_variants(self):
+        """
+        Groups the cases by their trace (sequence of activities).
+        :return: pandas.Series with the variant of every case, indexed by case id
+        """
+        df = self._get_activity_order()
+        traces = df.sort_values(by=[case_col, "order"]).groupby(
+            by=case_col, sort=False)[act_col].agg(tuple)
+        codes, _ = pd.factorize(traces)
 
-        iterations = len(edge_table)
+        return pd.Series(codes, index=traces.index)
 
-        bar = tqdm(total=iterations)
-        bar.set_description("Calculating directly- for cases")
-        df_all_cases = {case_col: set((source, target)) for (
-            case_col, source, target) in tqdm(edge_table[[case_col, "SOURCE", "TARGET"]].itertuples(name=None, index=False))}
+    def _representatives(self, df, variants):
+        """
+        Restricts a dataset to one case of every variant contained in it.
+        :param df: pandas.DataFrame with case column
+        :param variants: variant of every case, see _get_variants
+        :return: (rows of the representative cases, variant of every case in df)
+        """
+        case_variants = variants.loc[df[case_col].unique()]
+        representatives = case_variants.index[~case_variants.duplicated()]
+
+        return df[df[case_col].isin(representatives)], case_variants
+
+    def _set_case_relations(self, traces, relation, case_relations, cases, variants, df):
+        """
+        Sets the relation bitsets of representative cases in the rows of their variants.
+        only pairs of activities occurring in the dataset are related.
+        :param traces: TraceBitset with a row per variant
+        :param relation: name of relation
+        :param case_relations: packed bit matrices of the cases
+        :param cases: case ids of the bit matrices
+        :param variants: variant of every case, see _get_variants
+        :param df: dataset the relation is computed from
+        """
+        in_data = pd.Index(traces.activities).isin(df[act_col])
+        mask = pack(in_data[:, None] & in_data[None, :])
+        traces.relations[relation][variants.loc[cases].values] = case_relations & mask
+
+    def _get_always_before_per_variant(self, traces, variants, case_id=None):
+        """
+        Sets the always before relation per variant. a pair is related in a trace if the first occurrence of the first activity
+        is not before the first occurrence of the second activity.
+        :param traces: TraceBitset with a row per variant
+        :param variants: variant of every case, see _get_variants
+        :param case_id: str
+        :return: variant of every case
+        """
+        # get for every activity its position in the trace
+        df = self._get_activity_order(case_id)
+        df, case_variants = self._representatives(df, variants)
+        positions = PositionMatrix(
+            df, case_col, act_col, activities=traces.activities)
+        self._set_case_relations(traces, "always_before", positions.case_relations(before=True),
+                                 positions.cases, variants, df)
+
+        return case_variants
+
+    def _get_always_after_per_variant(self, traces, variants, case_id=None):
+        """
+        Sets the always after relation per variant. a pair is related in a trace if the last occurrence of the first activity
+        is not before the last occurrence of the second activity.
+        :param traces: TraceBitset with a row per variant
+        :param variants: variant of every case, see _get_variants
+        :param case_id: str
+        :return: variant of every case
+        """
+        # get for every activity its position in the trace
+        df = self._get_activity_order(case_id)
+        df, case_variants = self._representatives(df, variants)
+        positions = PositionMatrix(
+            df, case_col, act_col, activities=traces.activities)
+        self._set_case_relations(traces, "always_after", positions.case_relations(),
+                                 positions.cases, variants, df)
+
+        return case_variants
+
+    def _get_never_together_per_variant(self, traces, variants, case_id=None):
+        """
+        Sets the never together relation per variant. a pair is related in a trace if only one of the activities occurs in it.
+        :param traces: TraceBitset with a row per variant
+        :param variants: variant of every case, see _get_variants
+        :param case_id: str
+        :return: variant of every case
+        """
+        df = self._get_activation_counts(case_id)
+        df, case_variants = self._representatives(df, variants)
+        counts = CountMatrix(df, case_col, act_col,
+                             activities=traces.activities)
+        self._set_case_relations(traces, "never_together", counts.case_never_together(),
+                                 counts.cases, variants, df)
+
+        return case_variants
+
+    def _get_equivalence_per_variant(self, traces, variants, case_id=None):
+        """
+        Sets the equivalence relation per variant.
+        :param traces: TraceBitset with a row per variant
+        :param variants: variant of every case, see _get_variants
+        :param case_id: str
+        :return: variant of every case
+        """
+        # Get the number of occurrences of each activity per case
+        df = self._get_activation_counts(case_id)
+        # the larger profile of a pair is determined over all cases, not only over the variants
+        occurrences = df[act_col].value_counts().reindex(
+            traces.activities, fill_value=0)
+        df, case_variants = self._representatives(df, variants)
+        counts = CountMatrix(df, case_col, act_col,
+                             activities=traces.activities)
+        self._set_case_relations(traces, "equivalence", counts.case_equivalence(occurrences.values),
+                                 counts.cases, variants, df)
+
+        return case_variants
+
+    def _get_directly_follows_per_variant(self, traces, variants, case_id=None):
+        """
+        Sets the directly follows relation per variant. two activities are related if and only if an occurrence the first activity is directly followed by an occurrence of the second.
+        :param traces: TraceBitset with a row per variant
+        :param variants: variant of every case, see _get_variants
+        :param case_id: str
+        :return: variant of every case
+        """
+        edge_table = self._get_edges(case_id)
+        edge_table, case_variants = self._representatives(
+            edge_table, variants)
+
+        activities = pd.Index(traces.activities)
+        sources = activities.get_indexer(edge_table["SOURCE"])
+        targets = activities.get_indexer(edge_table["TARGET"])
+        valid = (sources >= 0) & (targets >= 0)
+        set_bits(traces.relations["directly_follows"], variants.loc[edge_table[case_col]].values[valid],
+                 sources[valid], targets[valid])
 
-        return df_all_cases
+        return case_variants
@@ -0,0 +1,60 @@
+import numpy as np
+from pyinsights.log_skeleton.bitset import RELATIONS, SkeletonBitset, activities_from_array, activities_to_array
+
+
+class LogSkeletonModel(dict):
+    """
+    Fitted log skeleton. Behaves like the pm4py-conforming dict of relations and
+    active frequencies, additionally holds the bitsets used for conformance checking,
+    so new cases can be checked without recomputing the reference relations
+    (see LogSkeleton.check). Can be saved to and loaded from a compressed binary file.
+
+    :param log_skeleton: dict of relations and active frequencies
+    :type log_skeleton: dict
+
+    :param activities: activities of the log, their position is their index in the bitsets
+    :type activities: list
+
+    :param noise_threshold: noise threshold the model was fitted with
+    :type noise_threshold: float
+    """
+
+    def __init__(self, log_skeleton, activities, noise_threshold=0, bitset=None):
+        super().__init__(log_skeleton)
+        self.noise_threshold = noise_threshold
+        if bitset is None:
+            bitset = SkeletonBitset.from_dict(log_skeleton, activities)
+        self.bitset = bitset
+
+    @property
+    def activities(self):
+        return self.bitset.activities
+
+    def save(self, path):
+        """
+        saves the model as compressed numpy archive
+        :param path: file path
+        """
+        arrays = {f"relation {relation}": self.bitset.relations[relation]
+                  for relation in RELATIONS}
+        with open(path, "wb") as f:
+            np.savez_compressed(f, activities=activities_to_array(self.activities),
+                                frequencies=self.bitset.frequencies,
+                                noise_threshold=self.noise_threshold, **arrays)
+
+    @classmethod
+    def load(cls, path):
+        """
+        loads a model saved with save
+        :param path: file path
+        :return: LogSkeletonModel
+        """
+        with np.load(path) as data:
+            activities = activities_from_array(data["activities"])
+            relations = {relation: data[f"relation {relation}"]
+                         for relation in RELATIONS}
+            bitset = SkeletonBitset(
+                activities, relations, data["frequencies"])
+            noise_threshold = data["noise_threshold"].item()
+
+        return cls(bitset.to_dict(), activities, noise_threshold, bitset=bitset)
@@ -0,0 +1,224 @@
+from collections import OrderedDict
+import numpy as np
+import pandas as pd
+from pyinsights.log_skeleton.bitset import num_words, unpack
+from pyinsights.time_utils import to_seconds
+
+# counts saturate instead of overflowing
+_MAX_COUNT = np.iinfo(np.uint16).max
+
+
+class ConformanceMonitor:
+    """
+    Online, event-at-a-time conformance checking against a log skeleton.
+    Keeps a compact state per running case (seen activities as bitset, activity counts and last activity)
+    in preallocated arrays and reports violations of always-before, never-together, directly-follows
+    and the upper activity frequency bounds as soon as the violating event arrives. Lower frequency
+    bounds are checked when the case is completed.
+    The cost per event is bounded by the number of activities.
+    Completed cases are removed, idle cases can be evicted, and if all slots are used,
+    the least recently active case is evicted.
+
+    :param model: log skeleton to check against
+    :type model: pyinsights.log_skeleton.LogSkeletonModel
+
+    :param capacity: maximum number of running cases
+    :type capacity: int
+
+    :param idle_timeout: seconds after which a case without events is evicted by evict_idle, None to keep cases
+    :type idle_timeout: float
+    """
+
+    def __init__(self, model, capacity=100000, idle_timeout=None):
+        self.model = model
+        self.capacity = capacity
+        self.idle_timeout = idle_timeout
+        self.evicted = 0
+
+        bitset = model.bitset
+        self.activities = list(bitset.activities[:bitset.num_reference])
+        self._index = {act: i for i, act in enumerate(self.activities)}
+        num_activities = len(self.activities)
+
+        # relations as boolean rows, a row is the constraint of an activity
+        self._always_before = unpack(
+            bitset.relations["always_before"], num_activities)[:num_activities]
+        np.fill_diagonal(self._always_before, False)
+        self._never_together = unpack(
+            bitset.relations["never_together"], num_activities)[:num_activities]
+        self._directly_follows = unpack(
+            bitset.relations["directly_follows"], num_activities)[:num_activities]
+        allowed = bitset.allowed_frequencies()[:num_activities]
+        self._allowed = allowed
+        # highest allowed number of occurrences of every activity
+        self._max_count = np.array([np.flatnonzero(row).max() if row.any() else -1
+                                    for row in allowed], dtype=np.int64)
+
+        # state of the running cases, one slot per case
+        self._seen = np.zeros((capacity, num_words(num_activities)), dtype=np.uint64)
+        self._counts = np.zeros((capacity, num_activities), dtype=np.uint16)
+        # -1: no event yet, -2: activity unknown to the model
+        self._last = np.full(capacity, -1, dtype=np.int32)
+        self._last_time = np.zeros(capacity, dtype=np.float64)
+        # case -> slot, least recently active first
+        self._slots = OrderedDict()
+        self._free = list(range(capacity - 1, -1, -1))
+        # names of unknown last activities
+        self._unknown = {}
+
+    def __len__(self):
+        return len(self._slots)
+
+    def __contains__(self, case):
+        return case in self._slots
+
+    def _slot(self, case):
+        """
+        returns slot of a case, allocates one for new cases
+        """
+        slot = self._slots.get(case)
+        if slot is not None:
+            self._slots.move_to_end(case)
+            return slot
+
+        if not self._free:
+            # evict least recently active case
+            self._release(next(iter(self._slots)))
+            self.evicted += 1
+        slot = self._free.pop()
+        self._slots[case] = slot
+
+        return slot
+
+    def _release(self, case):
+        """
+        removes the state of a case
+        """
+        slot = self._slots.pop(case)
+        self._seen[slot] = 0
+        self._counts[slot] = 0
+        self._last[slot] = -1
+        self._unknown.pop(slot, None)
+        self._free.append(slot)
+
+    def _is_seen(self, slot):
+        """
+        returns seen activities of a case as boolean array
+        """
+        return unpack(self._seen[slot], len(self.activities))
+
+    def process(self, case, activity, timestamp=None):
+        """
+        processes the next event of a case
+        :param case: case id
+        :param activity: activity of the event
+        :param timestamp: time of the event, defaults to now
+        :return: list of violations of the form (relation, pair)
+        """
+        slot = self._slot(case)
+        self._last_time[slot] = to_seconds(timestamp)
+        violations = []
+
+        last = self._last[slot]
+        if last == -2:
+            last_name = self._unknown.pop(slot)
+        elif last >= 0:
+            last_name = self.activities[last]
+
+        act = self._index.get(activity)
+        if act is None:
+            # unknown activities are never directly followed
+            if last != -1:
+                violations.append(("directly_follows", (last_name, activity)))
+            self._last[slot] = -2
+            self._unknown[slot] = activity
+            return violations
+
+        if last == -2 or (last >= 0 and not self._directly_follows[last, act]):
+            violations.append(("directly_follows", (last_name, activity)))
+
+        count = self._counts[slot, act]
+        if count == 0:
+            seen = self._is_seen(slot)
+            # activities that have to occur before the first occurrence of act
+            missing = np.flatnonzero(self._always_before[act] & ~seen)
+            violations += [("always_before", (activity, self.activities[b]))
+                           for b in missing]
+            # activities that never occur together with act
+            together = np.flatnonzero(self._never_together[act] & seen)
+            violations += [("never_together", (activity, self.activities[b]))
+                           for b in together]
+            self._seen[slot, act // 64] |= np.uint64(1) << np.uint64(act % 64)
+
+        count = min(int(count) + 1, _MAX_COUNT)
+        self._counts[slot, act] = count
+        # reported once, when the maximum is exceeded
+        if count - 1 <= self._max_count[act] < count:
+            violations.append(("activ_freq", (activity, count)))
+        self._last[slot] = act
+
+        return violations
+
+    def complete(self, case):
+        """
+        completes a case, checks the activity frequencies and removes its state
+        :param case: case id
+        :return: list of violations of the form ("activ_freq", (activity, number of occurrences))
+        """
+        if case not in self._slots:
+            return []
+        slot = self._slots[case]
+        counts = self._counts[slot].astype(np.int64)
+        # counts above the maximum were reported when they occurred
+        in_range = counts <= self._max_count
+        allowed = self._allowed[np.arange(len(counts)), np.minimum(
+            counts, self._allowed.shape[1] - 1)]
+        violations = [("activ_freq", (self.activities[a], int(counts[a])))
+                      for a in np.flatnonzero(in_range & ~allowed)]
+        self._release(case)
+
+        return violations
+
+    def evict_idle(self, now=None):
+        """
+        evicts all cases without events for more than idle_timeout seconds
+        :param now: current time, defaults to now
+        :return: list of evicted case ids
+        """
+        if self.idle_timeout is None:
+            return []
+        deadline = to_seconds(now) - self.idle_timeout
+        evicted = []
+        # cases are ordered by their last event
+        while self._slots:
+            case, slot = next(iter(self._slots.items()))
+            if self._last_time[slot] >= deadline:
+                break
+            self._release(case)
+            evicted.append(case)
+        self.evicted += len(evicted)
+
+        return evicted
+
+    def process_log(self, df, case_col, act_col, timestamp, complete=True):
+        """
+        replays an event log event by event
+        :param df: events as dataframe
+        :param case_col: name of case column
+        :param act_col: name of activity column
+        :param timestamp: name of timestamp column
+        :param complete: if true, completes every case after its last event
+        :return: pandas.DataFrame with columns case, "activity", "relation", "pair"
+        """
+        df = df.sort_values(by=timestamp, kind="stable").reset_index(drop=True)
+        last_events = set(df.drop_duplicates(
+            subset=case_col, keep="last").index) if complete else set()
+        rows = []
+        for index, case, activity, time_ in zip(df.index, df[case_col], df[act_col], df[timestamp]):
+            for relation, pair in self.process(case, activity, time_):
+                rows.append((case, activity, relation, pair))
+            if index in last_events:
+                for relation, pair in self.complete(case):
+                    rows.append((case, activity, relation, pair))
+
+        return pd.DataFrame(rows, columns=[case_col, "activity", "relation", "pair"])
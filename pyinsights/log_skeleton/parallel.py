@@ -0,0 +1,24 @@
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+
+def run_tasks(tasks, max_workers=None):
+    """
+    runs independent tasks concurrently on a thread pool.
+    pql fetches wait on the network and the numpy/scipy kernels of the matrices release the gil,
+    so threads overlap both. results are collected by name, not in order of completion,
+    so they don't depend on the scheduling.
+    :param tasks: dict of the form name : function without arguments
+    :param max_workers: maximum number of threads, defaults to one per task (at most the number of cpus),
+        1 runs the tasks one after another in the calling thread
+    :return: dict of the form name : result
+    """
+    if max_workers is None:
+        max_workers = min(len(tasks), os.cpu_count() or 1)
+    if max_workers <= 1 or len(tasks) <= 1:
+        return {name: task() for name, task in tasks.items()}
+
+    with ThreadPoolExecutor(max_workers=min(max_workers, len(tasks))) as executor:
+        futures = {name: executor.submit(task) for name, task in tasks.items()}
+        # re-raises the exception of a failed task
+        return {name: future.result() for name, future in futures.items()}
@@ -0,0 +1,151 @@
+import numpy as np
+import pandas as pd
+from pyinsights.log_skeleton.bitset import pack
+from pyinsights.log_skeleton.relations import order_relation, to_set
+
+
+class PositionMatrix:
+    """
+    Cases x activities matrices of the first and last position and the number of occurrences
+    of every activity, built from INDEX_ACTIVITY_ORDER data.
+    Computes the support of the order relations for all activity pairs at once.
+
+    :param df: dataframe with case, activity and position of every event
+    :type df: pandas.DataFrame
+
+    :param case_col: name of case column
+    :type case_col: string
+
+    :param act_col: name of activity column
+    :type act_col: string
+
+    :param activities: activity names defining the columns, defaults to the activities of df
+    :type activities: list
+
+    :param max_elements: maximum number of elements compared at once, bounds memory usage
+    :type max_elements: int
+    """
+
+    def __init__(self, df, case_col, act_col, order_col="order", activities=None, max_elements=2 ** 24):
+        self.max_elements = max_elements
+        if activities is None:
+            act_codes, self.activities = pd.factorize(df[act_col])
+        else:
+            self.activities = pd.Index(activities)
+            act_codes = self.activities.get_indexer(df[act_col])
+        # activities without a name are never grouped
+        df = df[act_codes >= 0]
+        act_codes = act_codes[act_codes >= 0]
+        case_codes, self.cases = pd.factorize(df[case_col])
+        order = df[order_col].values
+        num_cases = len(self.cases)
+        num_activities = len(self.activities)
+
+        # sort events by (case, activity) and position, first and last event of each group
+        # are the first and last occurrence
+        keys = case_codes.astype(np.int64) * num_activities + act_codes
+        sorted_idx = np.lexsort((order, keys))
+        keys = keys[sorted_idx]
+        order = order[sorted_idx]
+        group_keys, starts, counts = np.unique(
+            keys, return_index=True, return_counts=True)
+
+        self.first = np.zeros((num_cases, num_activities), dtype=np.int64)
+        self.last = np.zeros((num_cases, num_activities), dtype=np.int64)
+        self.count = np.zeros((num_cases, num_activities), dtype=np.int64)
+        self.first.flat[group_keys] = order[starts]
+        self.last.flat[group_keys] = order[starts + counts - 1]
+        self.count.flat[group_keys] = counts
+
+    @property
+    def present(self):
+        return self.count > 0
+
+    def _chunks(self):
+        """
+        yields (case slice, activity slice) blocks, so that a block compared with all activities
+        has at most max_elements elements
+        """
+        num_cases, num_activities = self.count.shape
+        if num_cases * num_activities <= self.max_elements:
+            rows = max(1, self.max_elements // max(1, num_cases * num_activities))
+            case_rows = max(1, num_cases)
+        else:
+            rows = 1
+            case_rows = max(1, self.max_elements // max(1, num_activities))
+
+        for i in range(0, num_activities, rows):
+            for c in range(0, num_cases, case_rows):
+                yield slice(c, c + case_rows), slice(i, i + rows)
+
+    def order_support(self, before=False):
+        """
+        Returns for every pair (a, b) the number of cases containing a in which the last occurrence of a
+        is not after the last occurrence of b (always-after), or the first occurrence of a is not before
+        the first occurrence of b (always-before). Cases without b never count.
+        The diagonal holds the number of cases in which a occurs more than once.
+        :param before: if true computes support of always-before, else of always-after
+        :return: numpy.ndarray activities x activities
+        """
+        present = self.present
+        if before:
+            # absent activities are never before
+            positions = np.where(present, self.first, np.iinfo(np.int64).max)
+        else:
+            # absent activities are never after (positions start at 1)
+            positions = self.last
+
+        num_activities = self.count.shape[1]
+        support = np.zeros((num_activities, num_activities), dtype=np.int64)
+        for cases, acts in self._chunks():
+            if before:
+                block = positions[cases, acts, None] >= positions[cases, None, :]
+            else:
+                block = positions[cases, acts, None] <= positions[cases, None, :]
+            block &= present[cases, acts, None]
+            support[acts] += block.sum(axis=0)
+
+        # an activity follows/precedes itself if it occurs more than once
+        np.fill_diagonal(support, (self.count > 1).sum(axis=0))
+
+        return support
+
+    def relation(self, support, noise_threshold):
+        """
+        Returns all pairs (a, b) whose support covers at least (1-noise) of the cases containing a.
+        :param support: numpy.ndarray activities x activities
+        :param noise_threshold: [0,1]
+        :return: set
+        """
+        holds = order_relation(
+            support, self.present.sum(axis=0), noise_threshold)
+
+        return to_set(holds, self.activities)
+
+    def case_relations(self, before=False):
+        """
+        Returns for every case the pairs (a, b) in which the last occurrence of a is not before the last
+        occurrence of b (always-after, absent b counts as before), or the first occurrence of a is not
+        before the first occurrence of b (always-before, b must occur). Pairs (a, a) are related if a occurs
+        more than once.
+        :param before: if true computes always-before, else always-after
+        :return: packed bit matrices, numpy.ndarray of uint64 cases x activities x words, rows in the order of self.cases
+        """
+        num_cases, num_activities = self.count.shape
+        diagonal = np.arange(num_activities)
+        chunk = max(1, self.max_elements // max(1, num_activities ** 2))
+        relations = []
+        for c in range(0, num_cases, chunk):
+            cases = slice(c, c + chunk)
+            present = self.count[cases] > 0
+            if before:
+                positions = self.first[cases]
+                holds = (positions[:, :, None] >= positions[:, None, :]) & present[:, None, :]
+            else:
+                positions = self.last[cases]
+                holds = positions[:, :, None] >= positions[:, None, :]
+            holds &= present[:, :, None]
+            holds[:, diagonal, diagonal] = self.count[cases] > 1
+            relations.append(pack(holds))
+
+        return np.concatenate(relations) if relations else pack(np.zeros((0, num_activities, num_activities)))
@@ -0,0 +1,77 @@
+import numpy as np
+
+# Relations of the log skeleton as boolean activities x activities matrices, derived from support counts.
+# All functions expect the counts over the same activities.
+
+
+def order_relation(support, occurrences, noise_threshold):
+    """
+    always-after / always-before: pair (a, b) holds if its support covers at least (1-noise) of the cases containing a
+    :param support: numpy.ndarray activities x activities, see PositionMatrix.order_support
+    :param occurrences: number of cases every activity occurs in
+    :param noise_threshold: [0,1]
+    :return: boolean numpy.ndarray
+    """
+    return support >= occurrences[:, None] * (1 - noise_threshold)
+
+
+def equivalence_relation(equal_counts, occurrences, noise_threshold):
+    """
+    equivalence: pair (a, b) holds if the number of occurrences differ in at most noise of the cases
+    the more frequent activity occurs in
+    :param equal_counts: numpy.ndarray activities x activities, see CountMatrix.equal_counts
+    :param occurrences: number of cases every activity occurs in
+    :param noise_threshold: [0,1]
+    :return: boolean numpy.ndarray
+    """
+    # cases in which a occurs, but b not equally often
+    differences = occurrences[:, None] - equal_counts
+    # compare w.r.t. the activity that occurs in more cases, the first one on ties
+    first_is_max = occurrences[:, None] >= occurrences[None, :]
+    differences = np.where(first_is_max, differences, differences.T)
+    num = np.maximum(occurrences[:, None], occurrences[None, :])
+
+    holds = differences <= num * noise_threshold
+    np.fill_diagonal(holds, False)
+
+    return holds
+
+
+def never_together_relation(co_occurrence, occurrences, noise_threshold):
+    """
+    never-together: pair (a, b) holds if a and b occur together in at most noise of the cases
+    the more frequent activity occurs in
+    :param co_occurrence: numpy.ndarray activities x activities, see CountMatrix.co_occurrence
+    :param occurrences: number of cases every activity occurs in
+    :param noise_threshold: [0,1]
+    :return: boolean numpy.ndarray
+    """
+    num = np.maximum(occurrences[:, None], occurrences[None, :])
+
+    holds = co_occurrence <= num * noise_threshold
+    np.fill_diagonal(holds, False)
+
+    return holds
+
+
+def directly_follows_relation(edge_cases, num_cases, noise_threshold):
+    """
+    directly-follows: pair (a, b) holds if a is directly followed by b in at least (1-noise) of the cases
+    :param edge_cases: numpy.ndarray activities x activities, number of cases containing the edge
+    :param num_cases: number of cases with at least one edge
+    :param noise_threshold: [0,1]
+    :return: boolean numpy.ndarray
+    """
+    return (edge_cases > 0) & (edge_cases >= (1 - noise_threshold) * num_cases)
+
+
+def to_set(holds, activities):
+    """
+    returns the pairs of a boolean relation matrix
+    :param holds: boolean numpy.ndarray activities x activities
+    :param activities: activity names
+    :return: set
+    """
+    activities = list(activities)
+
+    return {(activities[i], activities[j]) for i, j in zip(*np.nonzero(holds))}
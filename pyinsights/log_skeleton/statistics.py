@@ -0,0 +1,221 @@
+import numpy as np
+import pandas as pd
+from pyinsights.log_skeleton.bitset import activities_from_array, activities_to_array
+from pyinsights.log_skeleton.model import LogSkeletonModel
+from pyinsights.log_skeleton.parallel import run_tasks
+from pyinsights.log_skeleton.relations import directly_follows_relation, equivalence_relation, \
+    never_together_relation, order_relation, to_set
+
+# pair counts of the statistics, activities x activities
+_PAIR_COUNTS = ["after", "before", "co_occurrence",
+                "equal_counts", "edge_cases"]
+
+
+def edge_case_counts(edge_table, case_col, activities):
+    """
+    returns for every pair (a, b) the number of cases in which a is directly followed by b
+    :param edge_table: pandas.DataFrame with columns case, "SOURCE", "TARGET"
+    :param case_col: name of case column
+    :param activities: activity names
+    :return: numpy.ndarray activities x activities
+    """
+    activities = pd.Index(activities)
+    num_activities = len(activities)
+    edges = edge_table[[case_col, "SOURCE", "TARGET"]].drop_duplicates()
+    sources = activities.get_indexer(edges["SOURCE"])
+    targets = activities.get_indexer(edges["TARGET"])
+    valid = (sources >= 0) & (targets >= 0)
+
+    counts = np.zeros((num_activities, num_activities), dtype=np.int64)
+    np.add.at(counts, (sources[valid], targets[valid]), 1)
+
+    return counts
+
+
+class SkeletonStatistics:
+    """
+    Sufficient statistics of the log skeleton: pair support counts, per-activity histograms of
+    the number of occurrences and directly-follows case counts.
+    Statistics of disjoint sets of cases can be added and removed, the log skeleton
+    for any noise threshold is derived from the counts.
+
+    :param activities: activity names, rows and columns of the counts
+    :type activities: list
+    """
+
+    def __init__(self, activities):
+        self.activities = list(activities)
+        num_activities = len(self.activities)
+        self.num_cases = 0
+        # cases with at least one directly-follows edge
+        self.num_edge_cases = 0
+        # number of cases every activity occurs in
+        self.occurrences = np.zeros(num_activities, dtype=np.int64)
+        for name in _PAIR_COUNTS:
+            setattr(self, name, np.zeros(
+                (num_activities, num_activities), dtype=np.int64))
+        # number of cases in which an activity occurs k times, activities x (k + 1)
+        self.histogram = np.zeros((num_activities, 1), dtype=np.int64)
+
+    @classmethod
+    def from_matrices(cls, positions, counts, edge_table, case_col, max_workers=None):
+        """
+        computes the statistics of a set of cases
+        :param positions: PositionMatrix of the cases
+        :param counts: CountMatrix of the cases, over the same activities
+        :param edge_table: directly-follows edges of the cases
+        :param case_col: name of case column
+        :param max_workers: number of threads computing the pair counts, see run_tasks
+        :return: SkeletonStatistics
+        """
+        statistics = cls(counts.activities)
+        statistics.num_cases = counts.matrix.shape[0]
+        statistics.num_edge_cases = edge_table[case_col].nunique()
+        statistics.occurrences = counts.occurrences.astype(np.int64)
+        # pair counts are independent of each other
+        pair_counts = run_tasks({"after": positions.order_support,
+                                 "before": lambda: positions.order_support(before=True),
+                                 "co_occurrence": counts.co_occurrence,
+                                 "equal_counts": counts.equal_counts,
+                                 "edge_cases": lambda: edge_case_counts(edge_table, case_col, statistics.activities)},
+                                max_workers)
+        for name in _PAIR_COUNTS:
+            setattr(statistics, name, pair_counts[name])
+
+        # histogram of the number of occurrences
+        matrix = counts.matrix.tocoo()
+        occurrences = matrix.data.astype(np.int64)
+        statistics.histogram = np.zeros(
+            (len(statistics.activities), occurrences.max(initial=0) + 1), dtype=np.int64)
+        np.add.at(statistics.histogram, (matrix.col, occurrences), 1)
+
+        return statistics
+
+    def reindex(self, activities):
+        """
+        returns the statistics over additional activities
+        :param activities: activity names, containing all activities of the statistics
+        :return: SkeletonStatistics
+        """
+        statistics = SkeletonStatistics(activities)
+        index = pd.Index(statistics.activities).get_indexer(self.activities)
+        if (index < 0).any():
+            raise ValueError(
+                "activities have to contain the activities of the statistics")
+
+        statistics.num_cases = self.num_cases
+        statistics.num_edge_cases = self.num_edge_cases
+        statistics.occurrences[index] = self.occurrences
+        for name in _PAIR_COUNTS:
+            getattr(statistics, name)[np.ix_(index, index)] = getattr(self, name)
+        statistics.histogram = np.zeros(
+            (len(statistics.activities), self.histogram.shape[1]), dtype=np.int64)
+        statistics.histogram[index] = self.histogram
+
+        return statistics
+
+    def _combine(self, other, sign):
+        """
+        adds (sign=1) or subtracts (sign=-1) the statistics of other in place
+        """
+        known = set(self.activities)
+        activities = self.activities + \
+            [act for act in other.activities if act not in known]
+        if activities != self.activities:
+            self.__dict__.update(self.reindex(activities).__dict__)
+        other = other.reindex(activities)
+
+        width = max(self.histogram.shape[1], other.histogram.shape[1])
+        self.histogram = np.pad(
+            self.histogram, [(0, 0), (0, width - self.histogram.shape[1])])
+        self.histogram[:, :other.histogram.shape[1]] += sign * other.histogram
+
+        self.num_cases += sign * other.num_cases
+        self.num_edge_cases += sign * other.num_edge_cases
+        self.occurrences += sign * other.occurrences
+        for name in _PAIR_COUNTS:
+            getattr(self, name)[:] += sign * getattr(other, name)
+
+        return self
+
+    def add(self, other):
+        """
+        adds the statistics of new cases
+        :param other: SkeletonStatistics of cases not contained yet
+        :return: self
+        """
+        return self._combine(other, 1)
+
+    def remove(self, other):
+        """
+        removes the statistics of cases
+        :param other: SkeletonStatistics of cases contained in the statistics
+        :return: self
+        """
+        self._combine(other, -1)
+        if self.num_cases < 0 or (self.occurrences < 0).any():
+            raise ValueError("removed cases that were not contained")
+
+        return self
+
+    def log_skeleton(self, noise_threshold=0):
+        """
+        derives the log skeleton from the counts
+        :param noise_threshold: [0,1]
+        :return: LogSkeletonModel
+        """
+        # activities of removed cases are not part of the log skeleton
+        present = np.flatnonzero(self.occurrences > 0)
+        activities = [self.activities[i] for i in present]
+        occurrences = self.occurrences[present]
+
+        def counts(name):
+            return getattr(self, name)[np.ix_(present, present)]
+
+        relations = {
+            "equivalence": equivalence_relation(counts("equal_counts"), occurrences, noise_threshold),
+            "always_after": order_relation(counts("after"), occurrences, noise_threshold),
+            "always_before": order_relation(counts("before"), occurrences, noise_threshold),
+            "never_together": never_together_relation(counts("co_occurrence"), occurrences, noise_threshold),
+            "directly_follows": directly_follows_relation(counts("edge_cases"), self.num_edge_cases, noise_threshold)}
+        log_skeleton = {relation: to_set(holds, activities)
+                        for relation, holds in relations.items()}
+
+        # numbers of occurrences per trace, 0 if activity does not occur in every trace
+        histogram = self.histogram[present]
+        log_skeleton["activ_freq"] = {act: set(np.flatnonzero(histogram[i]).tolist())
+                                      for i, act in enumerate(activities)}
+        for i, act in enumerate(activities):
+            if occurrences[i] < self.num_cases:
+                log_skeleton["activ_freq"][act].add(0)
+
+        return LogSkeletonModel(log_skeleton, activities, noise_threshold)
+
+    def save(self, path):
+        """
+        saves the statistics as compressed numpy archive
+        :param path: file path
+        """
+        arrays = {name: getattr(self, name) for name in _PAIR_COUNTS}
+        with open(path, "wb") as f:
+            np.savez_compressed(f, activities=activities_to_array(self.activities),
+                                num_cases=self.num_cases, num_edge_cases=self.num_edge_cases,
+                                occurrences=self.occurrences, histogram=self.histogram, **arrays)
+
+    @classmethod
+    def load(cls, path):
+        """
+        loads statistics saved with save
+        :param path: file path
+        :return: SkeletonStatistics
+        """
+        with np.load(path) as data:
+            statistics = cls(activities_from_array(data["activities"]))
+            statistics.num_cases = data["num_cases"].item()
+            statistics.num_edge_cases = data["num_edge_cases"].item()
+            statistics.occurrences = data["occurrences"]
+            statistics.histogram = data["histogram"]
+            for name in _PAIR_COUNTS:
+                setattr(statistics, name, data[name])
+
+        return statistics
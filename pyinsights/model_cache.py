@@ -0,0 +1,118 @@
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+import pm4py
+
+
+class PetriNetCache:
+    """
+    Cache for discovered petri nets, keyed by a hash of the log they are discovered from
+    and the discovery parameters (variant coverage and distance).
+    Nets are kept in memory, least recently used nets are evicted once more than max_entries are held.
+    If cache_dir is set, nets are also stored as pnml files, so they survive a restart.
+
+    :param cache_dir: directory of the pnml files, None to keep nets in memory only
+    :type cache_dir: string
+
+    :param max_entries: maximum number of nets held in memory
+    :type max_entries: int
+
+    """
+
+    def __init__(self, cache_dir=None, max_entries=16):
+        self.cache_dir = cache_dir
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        # key -> (net, initial marking, final marking), least recently used first
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def key(datamodel_id, last_reload=None, **parameters):
+        """
+        returns cache key of a discovered net
+        :param datamodel_id: id of datamodel (or fingerprint of an in-memory log)
+        :param last_reload: marker of the last datamodel reload
+        :param parameters: discovery parameters
+        :return: hex digest
+        """
+        content = "\n".join([str(datamodel_id), str(last_reload)] +
+                            [f"{name}={value}" for name, value in sorted(parameters.items())])
+        return hashlib.sha256(content.encode("utf-8")).hexdigest()
+
+    def _path(self, key):
+        return os.path.join(self.cache_dir, f"{key}.pnml")
+
+    def get(self, key):
+        """
+        returns cached net or None
+        :param key: cache key
+        :return: (petri net, initial marking, final marking)
+        """
+        with self._lock:
+            model = self._entries.get(key)
+            if model is None and self.cache_dir is not None and os.path.exists(self._path(key)):
+                # stored by an earlier session
+                model = pm4py.read_pnml(self._path(key))
+                self._entries[key] = model
+            if model is None:
+                self.misses += 1
+                return None
+
+            self._entries.move_to_end(key)
+            self._evict()
+            self.hits += 1
+
+            return model
+
+    def put(self, key, net, initial_marking, final_marking):
+        """
+        stores a net, in the cache directory too if set
+        :param key: cache key
+        :param net: pm4py petri net
+        :param initial_marking: initial marking
+        :param final_marking: final marking
+        """
+        with self._lock:
+            self._entries[key] = (net, initial_marking, final_marking)
+            self._entries.move_to_end(key)
+            self._evict()
+
+        if self.cache_dir is not None:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            path = self._path(key)
+            # write to temporary file first, so other sessions never read half-written files
+            tmp_path = f"{path[:-len('.pnml')]}.{os.getpid()}.{threading.get_ident()}.tmp.pnml"
+            pm4py.write_pnml(net, initial_marking, final_marking, tmp_path)
+            os.replace(tmp_path, path)
+
+    def _evict(self):
+        """
+        removes least recently used nets from memory until max_entries are left
+        """
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def clear(self):
+        """
+        removes all cached nets, also from the cache directory
+        """
+        with self._lock:
+            self._entries.clear()
+            if self.cache_dir is not None and os.path.isdir(self.cache_dir):
+                for f in os.listdir(self.cache_dir):
+                    if f.endswith(".pnml"):
+                        os.remove(os.path.join(self.cache_dir, f))
+
+    def stats(self):
+        """
+        returns hit/miss statistics of the cache
+        :return: dict
+        """
+        requests = self.hits + self.misses
+        return {"hits": self.hits,
+                "misses": self.misses,
+                "hit rate": self.hits / requests if requests > 0 else 0,
+                "entries": len(self._entries)}
@@ -0,0 +1,84 @@
+import os
+import pandas as pd
+import pm4py
+from pyinsights.columnar_log import ColumnarLog
+
+
+def read_event_log(path, timestamps=()):
+    """
+    reads an event log from xes, parquet or csv
+    :param path: file path
+    :param timestamps: names of timestamp columns to parse (csv only)
+    :return: event log as dataframe
+    """
+    extension = os.path.splitext(path)[1].lower()
+    if extension == ".xes":
+        log = pm4py.read_xes(path)
+        if not isinstance(log, pd.DataFrame):
+            log = pm4py.convert_to_dataframe(log)
+    elif extension == ".parquet":
+        log = pd.read_parquet(path)
+    elif extension == ".csv":
+        log = pd.read_csv(path)
+        for col in timestamps:
+            if col is not None:
+                log[col] = pd.to_datetime(log[col])
+    else:
+        raise ValueError(f"unsupported event log format: {extension}")
+
+    return log
+
+
+class OfflineConnector(ColumnarLog):
+    """
+    Loads an event log from local disk (or a dataframe) into memory,
+    provides the same interface as pyinsights.Connector, so all analyzers
+    run in-process without a celonis datamodel
+
+    :param log: path to xes, parquet or csv file, or event log as dataframe
+    :type log: string or pandas.DataFrame
+
+    :param case_col: name of case column
+    :type case_col: string
+
+    :param activity_col: name of activity column
+    :type activity_col: string
+
+    :param timestamp: name of timestamp column
+    :type timestamp: string
+
+    :param end_timestamp: name of end timestamp column or None
+    :type end_timestamp: string
+
+    :param resource_column: name of resource column or None
+    :type resource_column: string
+
+    """
+    offline = True
+
+    def __init__(self, log, case_col="case:concept:name", activity_col="concept:name",
+                 timestamp="time:timestamp", end_timestamp=None, resource_column=None):
+        self.datamodel = None
+        self.datapool = None
+        self.celonis = None
+        self.path = None
+        table_name = "activities"
+
+        if not isinstance(log, pd.DataFrame):
+            self.path = log
+            table_name = os.path.splitext(os.path.basename(log))[0]
+            log = read_event_log(log, timestamps=(timestamp, end_timestamp))
+
+        super().__init__(log, case_col=case_col, activity_col=activity_col, timestamp=timestamp,
+                         end_timestamp=end_timestamp, resource_column=resource_column,
+                         table_name=table_name)
+
+    def connect(self):
+        """
+        nothing to connect to, log is held in memory
+        """
+        pass
+
+    def columns(self):
+        return [{"name": col, "type": "DATE" if pd.api.types.is_datetime64_any_dtype(self.log[col]) else "STRING"}
+                for col in self.log.columns]
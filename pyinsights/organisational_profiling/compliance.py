@@ -1,5 +1,7 @@
 from pycelonis.celonis_api.pql.pql import PQL, PQLColumn, PQLFilter
 from pyinsights import Connector
+import pandas as pd
+from pyinsights.snapshot import local_log
 
 
 def _build_filter(connector, resource_column, activities):
@@ -17,14 +19,19 @@ def _build_filter(connector, resource_column, activities):
     return PQLFilter(resource_filter)
 
 
-def segregation_of_duties(connector, resource_column, activities):
+def segregation_of_duties(connector, resource_column, activities, snapshot=None):
     """
     computes violations of the four-eyes principle
     :param connector: pycelonis.Connector
+    :param snapshot: pyinsights.EventSnapshot to compute on instead of querying celonis
     :return: pandas.core.Dataframe
     """
 
     resource_column = connector.resource_column()
+    log = local_log(connector, snapshot)
+    if log is not None:
+        return _local_segregation_of_duties(log, resource_column, activities)
+
     act_source = f"""SOURCE("{connector.activity_table()}"."{connector.activity_col()}") """
     act_target = f"""TARGET("{connector.activity_table()}"."{connector.activity_col()}") """
     case_id = f"""SOURCE("{connector.activity_table()}"."{connector.case_col()}") """
@@ -43,6 +50,34 @@ def segregation_of_duties(connector, resource_column, activities):
         connector, resource_column, activities)
     query += resource_filter
 
-    df = connector.datamodel.get_data_frame(query)
+    df = connector.get_data_frame(query)
 
     return df
+
+
+def _local_segregation_of_duties(log, resource_column, activities):
+    """
+    computes violations of the four-eyes principle on the in-memory log
+    :param log: pyinsights.columnar_log.ColumnarLog
+    :return: pandas.core.Dataframe
+    """
+    case_col = log.case_col()
+    act_col = log.activity_col()
+    timestamp = log.timestamp()
+
+    # other activities are skipped, like remapping them to NULL in pql
+    events = log.event_table()
+    events = events[events[act_col].isin(activities)].reset_index(drop=True)
+    following = events.shift(-1)
+
+    # same resource executes associated activities one after another
+    violations = (events[case_col] == following[case_col]) & (
+        events[resource_column] == following[resource_column])
+
+    df = pd.DataFrame({case_col: events[case_col],
+                       "source": events[act_col],
+                       "target": following[act_col],
+                       timestamp: events[timestamp],
+                       resource_column: events[resource_column]})
+
+    return df[violations].reset_index(drop=True)
@@ -2,6 +2,7 @@ import pandas as pd
 from pycelonis.celonis_api.pql.pql import PQL, PQLColumn, PQLFilter
 from pyinsights.conformance import alignment_scores
 from tqdm import tqdm
+from pyinsights.snapshot import local_log
 
 
 class ResourceProfiler:
@@ -13,6 +14,9 @@ class ResourceProfiler:
     :param connector: Connector to connect to celonis
     :type connector: pyinsights.Connector
 
+    :param snapshot: EventSnapshot to compute on instead of querying celonis
+    :type snapshot: pyinsights.EventSnapshot
+
     """
     datamodel = None
     activity_table = None
@@ -22,10 +26,11 @@ class ResourceProfiler:
     transition_mode = None
     end_timestamp = None
 
-    def __init__(self, connector):
+    def __init__(self, connector, snapshot=None):
         """
         init class
         :param connector: pycelonis.Connector
+        :param snapshot: pyinsights.EventSnapshot
         """
 
         # init class
@@ -51,6 +56,8 @@ class ResourceProfiler:
         transition_mode = "ANY_OCCURRENCE[] TO ANY_OCCURRENCE[]"
         res_col = self.connector.resource_column()
         has_endtime = self.connector.has_end_timestamp()
+        # in-memory logs (snapshot or offline connector) are used natively
+        self.local_log = local_log(self.connector, snapshot)
 
     def resource_profile(self, time_unit="HOURS", reference_unit=None):
         """
@@ -60,10 +67,13 @@ class ResourceProfiler:
         :return: pandas.core.Dataframe
         """
 
+        if self.local_log is not None:
+            return self._local_resource_profile(time_unit=time_unit, reference_unit=reference_unit)
+
         # get query for resource profiler
         query = self._resource_profile_query(
             time_unit=time_unit, reference_unit=reference_unit)
-        df = datamodel.get_data_frame(query)
+        df = self.connector.get_data_frame(query)
 
         return df
 
@@ -181,6 +191,36 @@ class ResourceProfiler:
 
         return query
 
+    def _local_resource_profile(self, time_unit, reference_unit, filtered=False, min_batch_size=None, batch_percentage=None):
+        """
+        computes the resource profile on the in-memory log,
+        same columns and filters as _resource_profile_query
+        :param time_unit: in ["SECONDS", "MINUTES", "HOURS", "DAY", "MONTH"]
+        :param reference_unit: in ["MINUTES", "HOURS", "DAY", "MONTH"]
+        :return: pandas.core.Dataframe
+        """
+        df = self.local_log.event_table()
+
+        # calculate times resource executes activity per time unit
+        df[f"# this {time_unit}"] = df.groupby(
+            [res_col, act_col, _truncate(df[timestamp], time_unit)])[act_col].transform("size")
+
+        # calculate times resource executes activity per reference unit
+        if reference_unit is not None:
+            df[f"# this {reference_unit}"] = df.groupby(
+                [res_col, act_col, _truncate(df[timestamp], reference_unit)])[act_col].transform("size")
+
+        if filtered:
+            # include occurrences per reference unit
+            if reference_unit is not None:
+                df = df[df[f"# this {time_unit}"] >=
+                        batch_percentage * df[f"# this {reference_unit}"]]
+
+            # filter for batches
+            df = df[df[f"# this {time_unit}"] >= min_batch_size]
+
+        return df.reset_index(drop=True)
+
     def _detect_batches(self, time_unit="HOURS", reference_unit=None, min_batch_size=2, batch_percentage=0.1):
         """
         identifies batches, returns df with
@@ -191,11 +231,15 @@ class ResourceProfiler:
         :return: pandas.core.Dataframe
         """
 
+        if self.local_log is not None:
+            return self._local_resource_profile(time_unit=time_unit, reference_unit=reference_unit, filtered=True,
+                                                min_batch_size=min_batch_size, batch_percentage=batch_percentage)
+
         # get query for filtered resource profile (with batches)
         query = self._resource_profile_query(time_unit=time_unit, reference_unit=reference_unit, filtered=True,
                                              min_batch_size=min_batch_size, batch_percentage=batch_percentage)
 
-        df = datamodel.get_data_frame(query)
+        df = self.connector.get_data_frame(query)
 
         return df
 
@@ -344,3 +388,17 @@ class ResourceProfiler:
             # set batch type
             df.loc[group, "batch type"] = group_type
         return df
+
+
+def _truncate(timestamps, time_unit):
+    """
+    truncates timestamps to time_unit (including all coarser units, like the pql query)
+    :param timestamps: pandas.Series
+    :param time_unit: in ["SECONDS", "MINUTES", "HOURS", "DAY", "MONTH"]
+    :return: pandas.Series
+    """
+    if time_unit == "MONTH":
+        return timestamps.dt.year * 12 + timestamps.dt.month
+    freq_offset = {"SECONDS": "S", "MINUTES": "min",
+                   "HOURS": "H", "DAY": "D"}[time_unit]
+    return timestamps.dt.floor(freq_offset)
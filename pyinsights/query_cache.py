@@ -0,0 +1,182 @@
+import hashlib
+import os
+import re
+import threading
+from collections import OrderedDict
+import pandas as pd
+
+# string literals and quoted identifiers, whitespace inside them is significant
+_QUOTED = re.compile(r"""('(?:[^']|'')*'|"[^"]*")""")
+
+
+def normalize_pql(text):
+    """
+    collapses whitespace outside of quoted strings, so formatting doesn't change the cache key
+    :param text: pql string
+    :return: normalized pql string
+    """
+    parts = _QUOTED.split(text)
+    # every odd part is a quoted string
+    return "".join(part if i % 2 else re.sub(r"\s+", " ", part)
+                   for i, part in enumerate(parts)).strip()
+
+
+def query_text(query):
+    """
+    returns normalized text of a pql query (columns, filters and options)
+    :param query: pycelonis PQL
+    :return: string
+    """
+    lines = [f"COLUMN {column.name} := {normalize_pql(column.query)}"
+             for column in getattr(query, "columns", [])]
+    lines += [f"FILTER {normalize_pql(pql_filter.query)}"
+              for pql_filter in getattr(query, "filters", [])]
+    for option in ["distinct", "limit", "offset"]:
+        lines.append(f"{option.upper()} {getattr(query, option, None)}")
+
+    return "\n".join(lines)
+
+
+class QueryCache:
+    """
+    Persistent, content-addressed cache for pql query results.
+    Results are stored as parquet files on local disk, keyed by a hash of the datamodel id,
+    the normalized pql text and the last reload of the datamodel.
+    Least recently used results are evicted once the cache exceeds max_size.
+
+    :param cache_dir: directory of the parquet files
+    :type cache_dir: string
+
+    :param max_size: maximum size of the cache in bytes
+    :type max_size: int
+
+    """
+
+    def __init__(self, cache_dir=".pyinsights_cache", max_size=2 * 1024 ** 3):
+        self.cache_dir = cache_dir
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        # queries may be fetched concurrently, see LogSkeleton
+        self._lock = threading.Lock()
+        os.makedirs(cache_dir, exist_ok=True)
+
+        # key -> size of file, least recently used first
+        self._entries = OrderedDict()
+        files = [f for f in os.listdir(cache_dir) if f.endswith(".parquet")]
+        files.sort(key=lambda f: os.path.getmtime(
+            os.path.join(cache_dir, f)))
+        for f in files:
+            self._entries[f[:-len(".parquet")]] = os.path.getsize(
+                os.path.join(cache_dir, f))
+
+    @staticmethod
+    def key(datamodel_id, text, last_reload=None):
+        """
+        returns cache key of a query
+        :param datamodel_id: id of datamodel
+        :param text: normalized pql text
+        :param last_reload: marker of the last datamodel reload
+        :return: hex digest
+        """
+        content = f"{datamodel_id}\n{last_reload}\n{text}"
+        return hashlib.sha256(content.encode("utf-8")).hexdigest()
+
+    def _path(self, key):
+        return os.path.join(self.cache_dir, f"{key}.parquet")
+
+    def get(self, key):
+        """
+        returns cached result or None
+        :param key: cache key
+        :return: pandas.DataFrame
+        """
+        path = self._path(key)
+        with self._lock:
+            if key not in self._entries or not os.path.exists(path):
+                self._entries.pop(key, None)
+                self.misses += 1
+                return None
+
+            # mark as recently used, also for other sessions
+            os.utime(path)
+            self._entries.move_to_end(key)
+            self.hits += 1
+
+        return pd.read_parquet(path)
+
+    def put(self, key, df):
+        """
+        stores a result and evicts least recently used results if necessary
+        :param key: cache key
+        :param df: pandas.DataFrame
+        """
+        path = self._path(key)
+        # write to temporary file first, so other sessions never read half-written files
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        df.to_parquet(tmp_path)
+        os.replace(tmp_path, path)
+
+        with self._lock:
+            self._entries[key] = os.path.getsize(path)
+            self._entries.move_to_end(key)
+            self._evict()
+
+    def _evict(self):
+        """
+        removes least recently used results until cache fits into max_size
+        """
+        while self.size() > self.max_size and len(self._entries) > 1:
+            key, _ = self._entries.popitem(last=False)
+            try:
+                os.remove(self._path(key))
+            except FileNotFoundError:
+                pass
+            self.evictions += 1
+
+    def get_data_frame(self, datamodel, query, last_reload=None):
+        """
+        returns result of query, executes it on the datamodel on a cache miss
+        :param datamodel: pycelonis datamodel
+        :param query: pycelonis PQL
+        :param last_reload: marker of the last datamodel reload
+        :return: pandas.DataFrame
+        """
+        key = self.key(datamodel.id, query_text(query), last_reload)
+        df = self.get(key)
+        if df is None:
+            df = datamodel.get_data_frame(query)
+            self.put(key, df)
+
+        return df
+
+    def size(self):
+        """
+        returns size of the cache in bytes
+        """
+        return sum(self._entries.values())
+
+    def clear(self):
+        """
+        removes all cached results
+        """
+        for key in list(self._entries.keys()):
+            try:
+                os.remove(self._path(key))
+            except FileNotFoundError:
+                pass
+        self._entries.clear()
+
+    def stats(self):
+        """
+        returns hit/miss statistics of the cache
+        :return: dict
+        """
+        requests = self.hits + self.misses
+        return {"hits": self.hits,
+                "misses": self.misses,
+                "hit rate": self.hits / requests if requests > 0 else 0,
+                "evictions": self.evictions,
+                "entries": len(self._entries),
+                "size": self.size()}
@@ -0,0 +1,53 @@
+from pycelonis.celonis_api.pql.pql import PQL, PQLColumn
+from pyinsights.columnar_log import ColumnarLog
+
+
+def local_log(connector, snapshot=None):
+    """
+    returns the in-memory log analyzers should compute on, or None if they have to query celonis
+    :param connector: pyinsights.Connector or pyinsights.OfflineConnector
+    :param snapshot: pyinsights.EventSnapshot or None
+    :return: pyinsights.columnar_log.ColumnarLog or None
+    """
+    if snapshot is not None:
+        return snapshot
+    if connector.offline:
+        return connector
+    return None
+
+
+class EventSnapshot(ColumnarLog):
+    """
+    Session-scoped snapshot of the event log of a datamodel.
+    Fetches case, activity, start/end timestamp and resource once and pins them in memory,
+    analyzers that get the snapshot compute on it instead of querying celonis again.
+
+    :param connector: Connector to connect to celonis
+    :type connector: pyinsights.Connector
+
+    """
+
+    def __init__(self, connector):
+        self.connector = connector
+        case_col = connector.case_col()
+        act_col = connector.activity_col()
+        timestamp = connector.timestamp()
+        end_timestamp = connector.end_time if connector.has_end_timestamp() else None
+        resource_column = connector.resource_column()
+
+        if connector.offline:
+            log = connector.event_table()
+        else:
+            activity_table = connector.activity_table()
+            columns = [case_col, act_col, timestamp, end_timestamp, resource_column]
+
+            query = PQL()
+            for col in columns:
+                if col:
+                    query.add(PQLColumn(name=col,
+                                        query=f""" "{activity_table}"."{col}" """))
+            log = connector.get_data_frame(query)
+
+        super().__init__(log, case_col=case_col, activity_col=act_col, timestamp=timestamp,
+                         end_timestamp=end_timestamp, resource_column=resource_column or None,
+                         table_name=connector.activity_table())
@@ -1 +1,4 @@
 from pyinsights.temporal_profiling.temporal_profiler import TemporalProfiler
+from pyinsights.temporal_profiling.profile_engine import TemporalProfileEngine
+from pyinsights.temporal_profiling.streaming import StreamingTemporalProfiler, TemporalProfileMoments
+from pyinsights.temporal_profiling.sketch import QuantileSketch, QuantileProfile
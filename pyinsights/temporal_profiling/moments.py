@@ -0,0 +1,354 @@
+import math
+from collections import deque
+import numpy as np
+import pandas as pd
+
+
+def _duration(duration):
+    """
+    converts a duration to seconds, numbers are seconds already
+    :param duration: number, pandas.Timedelta or string like "30D"
+    """
+    if isinstance(duration, (int, float, np.number)):
+        return float(duration)
+    return pd.Timedelta(duration).total_seconds()
+
+
+def profile_moments(window=None, half_life=None):
+    """
+    returns empty moments over all time, over a sliding window or with exponential time decay
+    :param window: length of the sliding window, seconds or pandas.Timedelta (e.g. "30D")
+    :param half_life: half-life of the decay, seconds or pandas.Timedelta
+    :return: RunningMoments, WindowedMoments or DecayedMoments
+    """
+    if window is not None and half_life is not None:
+        raise ValueError("set either window or half_life")
+    if window is not None:
+        return WindowedMoments(window)
+    if half_life is not None:
+        return DecayedMoments(half_life)
+    return RunningMoments()
+
+
+class _WelfordMoments:
+    """
+    Count, mean and M2 (sum of squared deviations from the mean) per key,
+    observations are added with Welford's update.
+    """
+
+    def __init__(self):
+        # key -> index of its moments
+        self.keys = {}
+        self.count = []
+        self.mean = []
+        self.m2 = []
+
+    def __len__(self):
+        return len(self.keys)
+
+    def _index(self, key):
+        """
+        returns index of a key, adds it if it's new
+        """
+        index = self.keys.get(key)
+        if index is None:
+            index = len(self.count)
+            self.keys[key] = index
+            self.count.append(0)
+            self.mean.append(0.0)
+            self.m2.append(0.0)
+
+        return index
+
+    def update(self, key, value, time=None):
+        """
+        adds an observation
+        :param key: key of the observation
+        :param value: observed duration
+        :param time: time of the observation in seconds, not needed over all time
+        """
+        i = self._index(key)
+        self.count[i] += 1
+        delta = value - self.mean[i]
+        self.mean[i] += delta / self.count[i]
+        self.m2[i] += delta * (value - self.mean[i])
+
+    def statistics(self, key, time=None):
+        """
+        returns count, mean and standard deviation (ddof 1) of a key,
+        mean is nan without observations and std with less than two
+        :param key: key
+        :param time: time in seconds the statistics are valid at, not needed over all time
+        """
+        i = self.keys.get(key)
+        if i is None:
+            return 0, math.nan, math.nan
+        count = self.count[i]
+        std = math.sqrt(self.m2[i] / (count - 1)) if count > 1 else math.nan
+
+        return count, self.mean[i], std
+
+    def arrays(self):
+        """
+        returns keys, count, mean and m2 as numpy arrays
+        """
+        return (list(self.keys), np.array(self.count, dtype=np.int64), np.array(self.mean, dtype=np.float64),
+                np.array(self.m2, dtype=np.float64))
+
+
+class RunningMoments(_WelfordMoments):
+    """
+    Count, mean and M2 (sum of squared deviations from the mean) per key.
+    Observations are added with Welford's update, partial moments of disjoint observations
+    are combined with Chan's formula, so merging shards gives the moments of the whole.
+    """
+
+    def combine(self, key, count, mean, m2):
+        """
+        adds the moments of other observations of a key
+        :param key: key of the observations
+        :param count: number of observations
+        :param mean: mean of the observations
+        :param m2: sum of squared deviations from their mean
+        """
+        if count == 0:
+            return
+        i = self._index(key)
+        total = self.count[i] + count
+        delta = mean - self.mean[i]
+        self.m2[i] += m2 + delta * delta * self.count[i] * count / total
+        self.mean[i] += delta * count / total
+        self.count[i] = total
+
+    def add(self, other):
+        """
+        adds the moments of other observations
+        :param other: RunningMoments of observations not contained yet
+        :return: self
+        """
+        for key, i in other.keys.items():
+            self.combine(key, other.count[i], other.mean[i], other.m2[i])
+
+        return self
+
+
+class WindowedMoments(_WelfordMoments):
+    """
+    Moments of the observations of the last window seconds.
+    Observations are kept in order of time, when the window advances the expired ones are removed
+    with the inverse Welford update, so the moments are never recomputed.
+    The window ends at the latest time seen, observations are expected roughly in order of time.
+    Windows are merged with add, which replays the observations of both.
+
+    :param window: length of the window, seconds or pandas.Timedelta (e.g. "30D")
+    """
+
+    def __init__(self, window):
+        super().__init__()
+        self.window = _duration(window)
+        self.now = -math.inf
+        # (time, index, value) in order of time
+        self._observations = deque()
+
+    def advance(self, time):
+        """
+        moves the end of the window to time, removes the observations that left the window
+        :param time: time in seconds
+        """
+        self.now = max(self.now, time)
+        deadline = self.now - self.window
+        while self._observations and self._observations[0][0] <= deadline:
+            _, i, value = self._observations.popleft()
+            self._remove(i, value)
+
+    def _remove(self, i, value):
+        """
+        removes an observation from the moments of index i
+        """
+        count = self.count[i] - 1
+        if count == 0:
+            self.count[i], self.mean[i], self.m2[i] = 0, 0.0, 0.0
+            return
+        mean = self.mean[i] - (value - self.mean[i]) / count
+        # clip rounding errors
+        self.m2[i] = max(self.m2[i] - (value - mean) *
+                         (value - self.mean[i]), 0.0)
+        self.mean[i] = mean
+        self.count[i] = count
+
+    def update(self, key, value, time=None):
+        if time is None:
+            time = self.now
+        self.advance(time)
+        super().update(key, value)
+        self._observations.append((time, self.keys[key], value))
+
+    def add(self, other):
+        """
+        adds the observations of another window
+        :param other: WindowedMoments of observations not contained yet
+        :return: self
+        """
+        keys, other_keys = list(self.keys), list(other.keys)
+        observations = [(time, keys[i], value) for time, i, value in self._observations] + \
+            [(time, other_keys[i], value) for time, i, value in other._observations]
+        # replay both in order of time
+        self.__init__(self.window)
+        for time, key, value in sorted(observations, key=lambda observation: observation[0]):
+            self.update(key, value, time)
+
+        return self
+
+    def statistics(self, key, time=None):
+        if time is not None:
+            self.advance(time)
+        return super().statistics(key)
+
+
+class DecayedMoments:
+    """
+    Exponentially time-decayed moments per key, the weight of an observation halves every half_life seconds.
+    Weights are decayed lazily when a key is accessed, the variance uses the effective number of observations
+    (sum of weights squared over sum of squared weights), so without decay it equals the running moments.
+    Observations without time are taken to be at the latest time seen.
+
+    :param half_life: half-life of the decay, seconds or pandas.Timedelta (e.g. "7D")
+    """
+
+    def __init__(self, half_life):
+        self.half_life = _duration(half_life)
+        self.keys = {}
+        # sum of weights, sum of squared weights, weighted mean, weighted M2, time of last decay
+        self.weight = []
+        self.weight2 = []
+        self.mean = []
+        self.m2 = []
+        self.time = []
+        # latest time seen, None before the first observation with time
+        self.now = None
+
+    def __len__(self):
+        return len(self.keys)
+
+    def _advance(self, time):
+        """
+        returns time, the latest time seen if None
+        """
+        if time is None:
+            return self.now
+        self.now = time if self.now is None else max(self.now, time)
+        return time
+
+    def _index(self, key, time):
+        index = self.keys.get(key)
+        if index is None:
+            index = len(self.weight)
+            self.keys[key] = index
+            self.weight.append(0.0)
+            self.weight2.append(0.0)
+            self.mean.append(0.0)
+            self.m2.append(0.0)
+            self.time.append(time)
+
+        return index
+
+    def _decay(self, i, time):
+        """
+        decays the weights of index i to time
+        """
+        if time is None:
+            return
+        if self.time[i] is None:
+            # observed before any time was known
+            self.time[i] = time
+            return
+        if time <= self.time[i]:
+            return
+        factor = 0.5 ** ((time - self.time[i]) / self.half_life)
+        self.weight[i] *= factor
+        self.weight2[i] *= factor * factor
+        self.m2[i] *= factor
+        self.time[i] = time
+
+    def update(self, key, value, time=None):
+        """
+        adds an observation with weight 1
+        :param key: key of the observation
+        :param value: observed duration
+        :param time: time of the observation in seconds, None for the latest time seen
+        """
+        time = self._advance(time)
+        i = self._index(key, time)
+        self._decay(i, time)
+        self.weight[i] += 1
+        self.weight2[i] += 1
+        delta = value - self.mean[i]
+        self.mean[i] += delta / self.weight[i]
+        self.m2[i] += delta * (value - self.mean[i])
+
+    def add(self, other):
+        """
+        adds the decayed moments of other observations, both are decayed to the later time
+        :param other: DecayedMoments of observations not contained yet
+        :return: self
+        """
+        if other.now is not None:
+            self._advance(other.now)
+        for key, j in other.keys.items():
+            i = self._index(key, other.time[j])
+            times = [t for t in [self.time[i], other.time[j]] if t is not None]
+            time = max(times) if times else None
+            self._decay(i, time)
+            factor = 1.0 if time is None or other.time[j] is None else \
+                0.5 ** ((time - other.time[j]) / self.half_life)
+            weight = other.weight[j] * factor
+            if weight == 0:
+                continue
+            total = self.weight[i] + weight
+            delta = other.mean[j] - self.mean[i]
+            self.m2[i] += other.m2[j] * factor + \
+                delta * delta * self.weight[i] * weight / total
+            self.mean[i] += delta * weight / total
+            self.weight[i] = total
+            self.weight2[i] += other.weight2[j] * factor * factor
+
+        return self
+
+    def statistics(self, key, time=None):
+        """
+        returns effective count, mean and standard deviation of a key, decayed to time
+        :param key: key
+        :param time: time in seconds the statistics are valid at
+        """
+        i = self.keys.get(key)
+        if i is None or self.weight[i] == 0:
+            return 0, math.nan, math.nan
+        self._decay(i, time)
+        count = self.weight[i] ** 2 / self.weight2[i]
+        denominator = self.weight[i] - self.weight2[i] / self.weight[i]
+        std = math.sqrt(self.m2[i] / denominator) if denominator > 0 else math.nan
+
+        return count, self.mean[i], std
+
+
+def moments_at_events(codes, values, times, moments):
+    """
+    replays observations in order of time and returns the statistics of their key valid at their time,
+    i.e. over the earlier observations only
+    :param codes: key of every observation
+    :param values: numpy.ndarray of durations, nan values are skipped
+    :param times: numpy.ndarray of times in seconds
+    :param moments: moments to update, see profile_moments
+    :return: (count, mean, std) arrays, one entry per observation
+    """
+    count = np.zeros(len(values), dtype=np.float64)
+    mean = np.full(len(values), np.nan)
+    std = np.full(len(values), np.nan)
+    valid = np.flatnonzero(~np.isnan(values))
+    order = valid[np.argsort(times[valid], kind="stable")]
+    for i, key, value, time in zip(order.tolist(), codes[order].tolist(), values[order].tolist(),
+                                   times[order].tolist()):
+        count[i], mean[i], std[i] = moments.statistics(key, time)
+        moments.update(key, value, time)
+
+    return count, mean, std
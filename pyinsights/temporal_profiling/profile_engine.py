@@ -0,0 +1,417 @@
+import numpy as np
+import pandas as pd
+from pyinsights.temporal_profiling.moments import moments_at_events, profile_moments
+from pyinsights.temporal_profiling.sketch import group_sketches
+
+
+def grouped_moments(codes, values, num_groups):
+    """
+    count, mean and standard deviation (ddof 1, like PU_STDEV) of values per group, nan values are ignored
+    :param codes: integer group code of every value
+    :param values: numpy.ndarray of floats
+    :param num_groups: number of groups
+    :return: (count, mean, std) arrays of length num_groups,
+        mean is nan for groups without values and std for groups with less than two values
+    """
+    valid = ~np.isnan(values)
+    count = np.bincount(codes, weights=valid, minlength=num_groups)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        mean = np.bincount(codes, weights=np.where(
+            valid, values, 0), minlength=num_groups) / count
+        # second pass over the deviations from the mean, numerically stable
+        deviations = np.where(valid, values - mean[codes], 0)
+        m2 = np.bincount(codes, weights=deviations ** 2,
+                         minlength=num_groups)
+        std = np.sqrt(m2 / (count - 1))
+    std[count < 2] = np.nan
+
+    return count.astype(np.int64), mean, std
+
+
+def z_score(duration, avg, std):
+    """
+    z-score of durations, 0 if standard deviation is 0
+    """
+    with np.errstate(divide="ignore", invalid="ignore"):
+        return np.where(std != 0, (duration - avg) / std, 0)
+
+
+def deviates(duration, avg, std, sigma):
+    """
+    true if duration deviates more than sigma * std from the average
+    """
+    return (duration >= avg + sigma * std) | (duration <= avg - sigma * std)
+
+
+def _merge_moments(count, mean, m2, codes, other_count, other_mean, other_m2):
+    """
+    merges partial moments of disjoint observations into the moments of their group, with Chan's formula.
+    the partial moments of a group are reduced first, with a second pass over the deviations from their mean
+    :param count: count per group, updated in place
+    :param mean: mean per group, updated in place
+    :param m2: sum of squared deviations from the mean per group, updated in place
+    :param codes: group of every partial moment
+    :param other_count: numpy.ndarray, counts of the partial moments
+    :param other_mean: numpy.ndarray, means of the partial moments
+    :param other_m2: numpy.ndarray, M2 of the partial moments
+    """
+    num_groups = len(count)
+    batch_count = np.bincount(codes, weights=other_count, minlength=num_groups)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        batch_mean = np.bincount(codes, weights=other_count * other_mean, minlength=num_groups) / batch_count
+    batch_mean[batch_count == 0] = 0
+    batch_m2 = np.bincount(codes, weights=other_m2 + other_count * (other_mean - batch_mean[codes]) ** 2,
+                           minlength=num_groups)
+
+    total = count + batch_count
+    with np.errstate(divide="ignore", invalid="ignore"):
+        delta = batch_mean - mean
+        m2 += np.where(total > 0, batch_m2 + delta * delta * count * batch_count / total, 0)
+        mean += np.where(total > 0, delta * batch_count / total, 0)
+    count += batch_count
+
+
+class TemporalProfileEngine:
+    """
+    Computes the temporal profile on the integer-coded event arrays of an in-memory log.
+    Every event is the source of one transition, to the next event of its case or to "END".
+    Transitions are keyed by the integer (source, target) pair, waiting and sojourn times are reduced
+    per key with bincount, so no strings are touched until the (small) result frames are built.
+
+    With a window or half-life, every transition is checked against the profile valid at its time,
+    computed over the earlier transitions in the window or with decayed weights. The moments are maintained
+    incrementally in order of time, see pyinsights.temporal_profiling.moments.
+
+    :param log: in-memory log sorted by case and timestamp
+    :type log: pyinsights.columnar_log.ColumnarLog
+
+    :param window: length of a sliding window, seconds or pandas.Timedelta (e.g. "30D"), None for all time
+    :type window: float
+
+    :param half_life: half-life of exponential time decay, seconds or pandas.Timedelta, None for no decay
+    :type half_life: float
+
+    :param robust: None for mean and std, "mad" or "quantile" for median and a robust std estimated
+        from the median absolute deviation or the interquartile range of a quantile sketch per key
+    :type robust: string
+
+    :param sketch_size: size of the quantile sketches, bounds memory per key
+    :type sketch_size: int
+
+    """
+
+    def __init__(self, log, window=None, half_life=None, robust=None, sketch_size=200):
+        if robust not in [None, "mad", "quantile"]:
+            raise ValueError(f"unknown robust mode {robust}")
+        if robust is not None and (window is not None or half_life is not None):
+            raise ValueError("robust profiles are computed over all time")
+        self.log = log
+        self.window = window
+        self.half_life = half_life
+        self.robust = robust
+        self.sketch_size = sketch_size
+        # names of center and spread of waiting and sojourn times
+        if robust is None:
+            self.labels = ["avg waiting time", "std waiting time",
+                           "avg sojourn time", "std sojourn"]
+        else:
+            self.labels = ["median waiting time", "robust std waiting time",
+                           "median sojourn time", "robust std sojourn"]
+        num_events = len(log.case_codes)
+        self.has_target = log._next_in_case()
+        # clip to stay in bounds, transitions to END are masked anyway
+        targets = np.minimum(np.arange(num_events) + 1, max(num_events - 1, 0))
+
+        # END gets the code after the last activity
+        self.end_code = log.num_activities
+        self.target_codes = np.where(
+            self.has_target, log.act_codes[targets], self.end_code)
+        self.waiting = np.where(
+            self.has_target, (log.starts[targets] - log.ends) / 1e9, np.nan)
+        self.sojourn = (log.ends - log.starts) / \
+            1e9 if log.has_end_timestamp() else None
+        # a transition is observed when its target starts, a sojourn when its event starts
+        self.waiting_times = log.starts[targets] / 1e9
+        self.sojourn_times = log.starts / 1e9
+
+        # transition codes in order of first occurrence
+        keys = log.act_codes * (self.end_code + 1) + self.target_codes
+        self.transition_codes, self.transition_keys = pd.factorize(keys)
+        self.num_transitions = len(self.transition_keys)
+        # z-scores of all transitions, see scores
+        self._scores = None
+
+    @property
+    def drifting(self):
+        """
+        true if the profile is computed over a window or with decay
+        """
+        return self.window is not None or self.half_life is not None
+
+    def _final_moments(self, codes, values, times, num_groups):
+        """
+        count, mean and std per group valid at the last observation, for windowed or decayed profiles
+        """
+        moments = profile_moments(self.window, self.half_life)
+        moments_at_events(codes, values, times, moments)
+        observed = ~np.isnan(values)
+        end = times[observed].max() if observed.any() else None
+        count = np.zeros(num_groups, dtype=np.float64)
+        mean = np.full(num_groups, np.nan)
+        std = np.full(num_groups, np.nan)
+        for code in moments.keys:
+            count[code], mean[code], std[code] = moments.statistics(code, end)
+
+        return count, mean, std
+
+    def waiting_moments(self):
+        """
+        returns count, mean and std of the waiting time per transition code
+        """
+        if self.drifting:
+            return self._final_moments(self.transition_codes, self.waiting, self.waiting_times,
+                                       self.num_transitions)
+        return grouped_moments(self.transition_codes, self.waiting, self.num_transitions)
+
+    def sojourn_moments(self):
+        """
+        returns count, mean and std of the sojourn time per activity code
+        """
+        if self.drifting:
+            return self._final_moments(self.log.act_codes, self.sojourn, self.sojourn_times,
+                                       self.log.num_activities)
+        return grouped_moments(self.log.act_codes, self.sojourn, self.log.num_activities)
+
+    def _robust_statistics(self, codes, values, num_groups):
+        """
+        median and robust std per group, from a quantile sketch per group
+        """
+        center = np.full(num_groups, np.nan)
+        scale = np.full(num_groups, np.nan)
+        for code, sketch in group_sketches(codes, values, num_groups, self.sketch_size).items():
+            center[code], scale[code] = sketch.robust_statistics(self.robust)
+
+        return center, scale
+
+    def _profile_statistics(self, codes, values, num_groups, moments):
+        """
+        center and spread per group, mean and std or median and robust std
+        """
+        if self.robust is not None:
+            return self._robust_statistics(codes, values, num_groups)
+        _, mean, std = moments()
+        return mean, std
+
+    def _waiting_statistics(self):
+        """
+        center and spread of the waiting time every transition is checked against
+        """
+        if self.drifting:
+            _, mean, std = moments_at_events(self.transition_codes, self.waiting, self.waiting_times,
+                                             profile_moments(self.window, self.half_life))
+            return mean, std
+        mean, std = self._profile_statistics(self.transition_codes, self.waiting, self.num_transitions,
+                                             self.waiting_moments)
+        return mean[self.transition_codes], std[self.transition_codes]
+
+    def _sojourn_statistics(self):
+        """
+        center and spread of the sojourn time every event is checked against
+        """
+        if self.drifting:
+            _, mean, std = moments_at_events(self.log.act_codes, self.sojourn, self.sojourn_times,
+                                             profile_moments(self.window, self.half_life))
+            return mean, std
+        mean, std = self._profile_statistics(self.log.act_codes, self.sojourn, self.log.num_activities,
+                                             self.sojourn_moments)
+        return mean[self.log.act_codes], std[self.log.act_codes]
+
+    def _deviates(self, duration, center, spread, sigma):
+        """
+        deviation test of the mode, a robust std of 0 (all durations are equal) flags every other duration
+        """
+        if self.robust is not None:
+            equal = (spread == 0) & (duration != center) & ~np.isnan(duration)
+            return np.where(spread > 0, deviates(duration, center, spread, sigma), equal)
+        return deviates(duration, center, spread, sigma)
+
+    def _activity(self, codes):
+        """
+        activity names of codes, END for the end code
+        """
+        names = np.append(self.log.activities.astype(object), "END")
+        return names[codes]
+
+    def temporal_profile(self):
+        """
+        computes waiting times per transition and sojourn times per activity
+        :return: dict {'waiting times': waiting_times, 'sojourn times': sojourn_times}
+        """
+        mean, std = self._profile_statistics(self.transition_codes, self.waiting, self.num_transitions,
+                                             self.waiting_moments)
+        # transitions to END only carry the sojourn time of their source
+        keys = np.flatnonzero(
+            self.transition_keys % (self.end_code + 1) != self.end_code)
+        waiting_times = pd.DataFrame({"source": self._activity(self.transition_keys[keys] // (self.end_code + 1)),
+                                      "target": self._activity(self.transition_keys[keys] % (self.end_code + 1)),
+                                      self.labels[0]: mean[keys],
+                                      self.labels[1]: std[keys]})
+        waiting_times.fillna(value=0, inplace=True)
+
+        sojourn_times = pd.DataFrame()
+        if self.sojourn is not None:
+            mean, std = self._profile_statistics(self.log.act_codes, self.sojourn, self.log.num_activities,
+                                                 self.sojourn_moments)
+            sojourn_times = pd.DataFrame({self.log.activity_col(): self.log.activities,
+                                          self.labels[2]: mean,
+                                          self.labels[3]: std})
+            sojourn_times.fillna(value=0, inplace=True)
+
+        return {'waiting times': waiting_times,
+                'sojourn times': sojourn_times}
+
+    def eventually_follows(self, max_distance=None, max_state=2 ** 22):
+        """
+        computes duration statistics of every ordered activity pair (a, b), over all pairs of events of a case
+        where a occurs before b, the duration is from the end of a to the start of b.
+        Instead of materializing the pairs, one pass over the events of every case keeps the count, mean and M2
+        of the end times per activity in the case prefix. An event of b then contributes the moments of all
+        pairs with a to (a, b) in O(number of activities), the durations have mean start - mean end and
+        the M2 of the end times. The pass runs position by position over a chunk of cases at once,
+        partial moments are merged with Chan's formula.
+        :param max_distance: only pairs at most max_distance events apart, caps the pairs of long traces,
+            None for all pairs
+        :param max_state: maximum number of (case, activity) prefix states held at once
+        :return: pandas.DataFrame with columns "source", "target", "count", "avg duration", "std duration"
+        """
+        log = self.log
+        num_activities = log.num_activities
+        offsets = log.case_offsets
+        lengths = np.diff(offsets)
+        # times relative to the start of the case keep the values small
+        case_starts = log.starts[offsets[:-1]][log.case_codes]
+        starts = (log.starts - case_starts) / 1e9
+        ends = (log.ends - case_starts) / 1e9
+
+        # moments of the durations per (source, target), source * num_activities + target
+        count = np.zeros(num_activities * num_activities)
+        mean = np.zeros_like(count)
+        m2 = np.zeros_like(count)
+
+        # longest cases first, the cases still running at a position are a prefix of the chunk
+        cases = np.argsort(-lengths, kind="stable")
+        chunk_size = max(1, max_state // max(num_activities, 1))
+        for chunk in range(0, len(cases), chunk_size):
+            chunk_cases = cases[chunk:chunk + chunk_size]
+            chunk_lengths = lengths[chunk_cases]
+            # prefix state per case and activity
+            prefix_count = np.zeros((len(chunk_cases), num_activities))
+            prefix_mean = np.zeros_like(prefix_count)
+            prefix_m2 = np.zeros_like(prefix_count)
+            for position in range(chunk_lengths[0] if len(chunk_cases) > 0 else 0):
+                rows = np.arange(np.searchsorted(-chunk_lengths, -position))
+                events = offsets[chunk_cases[rows]] + position
+
+                if max_distance is not None and position > max_distance:
+                    # the event max_distance + 1 positions back leaves the prefix
+                    left = events - max_distance - 1
+                    acts, value = log.act_codes[left], ends[left]
+                    remaining = prefix_count[rows, acts] - 1
+                    with np.errstate(divide="ignore", invalid="ignore"):
+                        left_mean = np.where(remaining > 0, prefix_mean[rows, acts] -
+                                             (value - prefix_mean[rows, acts]) / remaining, 0)
+                    # clip rounding errors
+                    prefix_m2[rows, acts] = np.where(remaining > 0, np.maximum(
+                        prefix_m2[rows, acts] - (value - left_mean) * (value - prefix_mean[rows, acts]), 0), 0)
+                    prefix_mean[rows, acts] = left_mean
+                    prefix_count[rows, acts] = remaining
+
+                # pairs of every activity in the prefix with the event
+                targets = log.act_codes[events]
+                n = prefix_count[rows]
+                case_rows, acts = np.nonzero(n > 0)
+                _merge_moments(count, mean, m2, acts * num_activities + targets[case_rows], n[case_rows, acts],
+                               starts[events][case_rows] - prefix_mean[rows[case_rows], acts],
+                               prefix_m2[rows[case_rows], acts])
+
+                # add the end of the event to the prefix, Welford's update
+                value = ends[events]
+                prefix_count[rows, targets] += 1
+                delta = value - prefix_mean[rows, targets]
+                prefix_mean[rows, targets] += delta / prefix_count[rows, targets]
+                prefix_m2[rows, targets] += delta * (value - prefix_mean[rows, targets])
+
+        keys = np.flatnonzero(count > 0.5)
+        sources, targets = np.divmod(keys, num_activities)
+        count = np.rint(count[keys]).astype(np.int64)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            std = np.sqrt(m2[keys] / (count - 1))
+        std[count < 2] = 0
+
+        return pd.DataFrame({"source": log.activities[sources],
+                             "target": log.activities[targets],
+                             "count": count,
+                             "avg duration": mean[keys],
+                             "std duration": std})
+
+    def scores(self):
+        """
+        computes center, spread and z-score of the waiting (and sojourn) time of every transition,
+        once, they don't depend on sigma
+        :return: dict column name -> numpy.ndarray, one entry per transition
+        """
+        if self._scores is None:
+            mean, std = self._waiting_statistics()
+            columns = {self.labels[0]: mean,
+                       self.labels[1]: std,
+                       "z-score (waiting time)": z_score(self.waiting, mean, std)}
+            if self.sojourn is not None:
+                mean, std = self._sojourn_statistics()
+                columns[self.labels[2]] = mean
+                columns[self.labels[3]] = std
+                columns["z-score (sojourn)"] = z_score(self.sojourn, mean, std)
+            self._scores = columns
+
+        return self._scores
+
+    def deviating(self, sigma=6):
+        """
+        returns boolean array, true for transitions deviating more than sigma, a vectorized filter on the scores
+        :param sigma: statistical sigma
+        """
+        columns = self.scores()
+        deviating = self._deviates(
+            self.waiting, columns[self.labels[0]], columns[self.labels[1]], sigma)
+        if self.sojourn is not None:
+            deviating |= self._deviates(
+                self.sojourn, columns[self.labels[2]], columns[self.labels[3]], sigma)
+
+        return deviating
+
+    def deviations(self, sigma=6):
+        """
+        computes transitions with a waiting or sojourn time deviating more than sigma * std from the average,
+        in robust mode more than sigma * robust std from the median
+        :param sigma: statistical sigma
+        :return: pandas.DataFrame with columns case, "source", "target", timestamp, "waiting time"(, "sojourn"),
+            "avg waiting time", "std waiting time", "z-score (waiting time)"(, "avg sojourn time",
+            "std sojourn", "z-score (sojourn)"), median and robust std instead of avg and std in robust mode
+        """
+        columns = self.scores()
+
+        # only deviating transitions are materialized
+        rows = np.flatnonzero(self.deviating(sigma))
+        df = pd.DataFrame({self.log.case_col(): self.log.case_ids[self.log.case_codes[rows]],
+                           "source": self.log.activities[self.log.act_codes[rows]],
+                           "target": self._activity(self.target_codes[rows]),
+                           self.log.timestamp(): self.log.log[self.log.timestamp()].iloc[rows].reset_index(drop=True),
+                           "waiting time": self.waiting[rows]})
+        if self.sojourn is not None:
+            df["sojourn"] = self.sojourn[rows]
+        for name, values in columns.items():
+            df[name] = values[rows]
+
+        # start/end transitions get na for temporal times
+        df.fillna(value=0, inplace=True)
+
+        return df
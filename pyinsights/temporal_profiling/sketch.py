@@ -0,0 +1,291 @@
+import numpy as np
+
+# scale factors of MAD and IQR to the standard deviation of a normal distribution
+MAD_SCALE = 1.4826
+IQR_SCALE = 1 / 1.349
+# scale factor of the mean absolute deviation
+MEAN_AD_SCALE = 1.2533
+
+
+class QuantileSketch:
+    """
+    KLL quantile sketch of a stream of durations.
+    Items are kept in levels, an item of level h stands for 2^h observations. A level that exceeds its
+    capacity is sorted and every other item (random offset) is promoted to the next level.
+    Capacities shrink geometrically towards the lower levels, so at most about 3k items are kept,
+    independent of the number of observations, and the rank error of a quantile is about 1/k.
+    Sketches of disjoint observations are merged level by level.
+
+    :param k: capacity of the highest level, bounds memory and error
+    :type k: int
+
+    :param seed: seed of the compaction offsets
+    :type seed: int
+    """
+
+    def __init__(self, k=200, seed=None):
+        self.k = k
+        self.count = 0
+        self.levels = [np.empty(0, dtype=np.float64)]
+        self._buffer = []
+        self._rng = np.random.default_rng(seed)
+
+    def __len__(self):
+        return self.count
+
+    def _capacity(self, level):
+        depth = len(self.levels) - 1 - level
+        return max(int(np.ceil(self.k * (2 / 3) ** depth)), 2)
+
+    def update(self, value):
+        """
+        adds an observation, in amortized O(1)
+        :param value: duration
+        """
+        self._buffer.append(value)
+        self.count += 1
+        if len(self._buffer) >= self._capacity(0):
+            self._flush()
+
+    def update_many(self, values):
+        """
+        adds an array of observations
+        :param values: numpy.ndarray of durations
+        """
+        values = np.asarray(values, dtype=np.float64)
+        self.levels[0] = np.concatenate([self.levels[0], values])
+        self.count += len(values)
+        self._flush()
+
+    def _flush(self):
+        if self._buffer:
+            self.levels[0] = np.concatenate(
+                [self.levels[0], np.array(self._buffer, dtype=np.float64)])
+            self._buffer = []
+        self._compress()
+
+    def _compress(self):
+        """
+        compacts levels above their capacity into the next level
+        """
+        level = 0
+        while level < len(self.levels):
+            if len(self.levels[level]) > self._capacity(level):
+                if level + 1 == len(self.levels):
+                    self.levels.append(np.empty(0, dtype=np.float64))
+                items = np.sort(self.levels[level])
+                # an odd item stays on its level
+                even = len(items) - len(items) % 2
+                offset = self._rng.integers(2)
+                self.levels[level + 1] = np.concatenate(
+                    [self.levels[level + 1], items[offset:even:2]])
+                self.levels[level] = items[even:]
+            level += 1
+
+    def add(self, other):
+        """
+        merges the sketch of other observations
+        :param other: QuantileSketch
+        :return: self
+        """
+        self._flush()
+        other._flush()
+        while len(self.levels) < len(other.levels):
+            self.levels.append(np.empty(0, dtype=np.float64))
+        for level, items in enumerate(other.levels):
+            self.levels[level] = np.concatenate([self.levels[level], items])
+        self.count += other.count
+        self._compress()
+
+        return self
+
+    def items(self):
+        """
+        returns retained items and their weights
+        """
+        self._flush()
+        items = np.concatenate(self.levels)
+        weights = np.concatenate([np.full(len(level_items), 2 ** level, dtype=np.float64)
+                                  for level, level_items in enumerate(self.levels)])
+
+        return items, weights
+
+    def quantile(self, q):
+        """
+        returns approximate quantile(s)
+        :param q: float or array in [0, 1]
+        """
+        return weighted_quantile(*self.items(), q)
+
+    def robust_statistics(self, method="mad"):
+        """
+        returns median and robust estimate of the standard deviation
+        :param method: "mad" (median absolute deviation) or "quantile" (interquartile range)
+        :return: (median, scale), the scale is 0 only if all items are equal
+        """
+        items, weights = self.items()
+        if len(items) == 0:
+            return np.nan, np.nan
+        q1, median, q3 = weighted_quantile(items, weights, [0.25, 0.5, 0.75])
+        scale = (q3 - q1) * IQR_SCALE
+        if method == "mad":
+            # median of the absolute deviations of the weighted items
+            mad = weighted_quantile(np.abs(items - median), weights, 0.5)
+            # more than half of the items are equal to the median, fall back to the interquartile range
+            scale = mad * MAD_SCALE if mad > 0 else scale
+        if scale == 0:
+            # more than half of the items are equal, fall back to the mean absolute deviation
+            scale = np.average(np.abs(items - median), weights=weights) * MEAN_AD_SCALE
+        return median, scale
+
+    def to_array(self):
+        """
+        serializes the sketch as array: k, count, number of levels, level sizes, items
+        """
+        self._flush()
+        header = [self.k, self.count, len(self.levels)] + \
+            [len(items) for items in self.levels]
+        return np.concatenate([np.array(header, dtype=np.float64)] + self.levels)
+
+    @classmethod
+    def from_array(cls, array, seed=None):
+        """
+        deserializes a sketch serialized with to_array
+        """
+        sketch = cls(int(array[0]), seed=seed)
+        sketch.count = int(array[1])
+        num_levels = int(array[2])
+        sizes = array[3:3 + num_levels].astype(np.int64)
+        offsets = 3 + num_levels + np.concatenate(([0], np.cumsum(sizes)))
+        sketch.levels = [array[offsets[i]:offsets[i + 1]].copy()
+                         for i in range(num_levels)]
+
+        return sketch
+
+
+def weighted_quantile(items, weights, q):
+    """
+    quantile of weighted items, the smallest item whose cumulative weight reaches q * total weight
+    """
+    order = np.argsort(items, kind="stable")
+    cumulative = np.cumsum(weights[order])
+    ranks = np.asarray(q, dtype=np.float64) * cumulative[-1]
+    index = np.minimum(np.searchsorted(cumulative, ranks),
+                       len(items) - 1)
+
+    return items[order][index]
+
+
+def group_sketches(codes, values, num_groups, k=200):
+    """
+    builds one sketch per group code of the non-nan values
+    :param codes: integer group code of every value
+    :param values: numpy.ndarray of durations
+    :param num_groups: number of groups
+    :param k: sketch size
+    :return: dict group code -> QuantileSketch, groups without values are left out
+    """
+    valid = ~np.isnan(values)
+    codes, values = codes[valid], values[valid]
+    order = np.argsort(codes, kind="stable")
+    bounds = np.searchsorted(codes[order], np.arange(num_groups + 1))
+    sketches = {}
+    for code in range(num_groups):
+        if bounds[code + 1] > bounds[code]:
+            sketch = QuantileSketch(k, seed=code)
+            sketch.update_many(values[order[bounds[code]:bounds[code + 1]]])
+            sketches[code] = sketch
+
+    return sketches
+
+
+class QuantileProfile:
+    """
+    Robust temporal profile, a quantile sketch of the waiting time per (source, target) transition
+    and of the sojourn time per activity. Memory per key is bounded by the sketch size.
+    Profiles of separate partitions are merged with add and stored with save.
+
+    :param k: sketch size, see QuantileSketch
+    :type k: int
+    """
+
+    def __init__(self, k=200):
+        self.k = k
+        self.waiting = {}
+        self.sojourn = {}
+
+    @classmethod
+    def from_engine(cls, engine, k=200):
+        """
+        sketches the durations of a profile engine
+        :param engine: pyinsights.temporal_profiling.TemporalProfileEngine
+        :param k: sketch size
+        :return: QuantileProfile
+        """
+        profile = cls(k)
+        log = engine.log
+        activities = np.append(log.activities.astype(object), "END")
+        for code, sketch in group_sketches(engine.transition_codes, engine.waiting, engine.num_transitions,
+                                          k).items():
+            source, target = divmod(
+                int(engine.transition_keys[code]), engine.end_code + 1)
+            profile.waiting[(activities[source], activities[target])] = sketch
+        if engine.sojourn is not None:
+            for code, sketch in group_sketches(log.act_codes, engine.sojourn, log.num_activities, k).items():
+                profile.sojourn[activities[code]] = sketch
+
+        return profile
+
+    def add(self, other):
+        """
+        merges the profile of another partition
+        :param other: QuantileProfile of events not contained yet
+        :return: self
+        """
+        for own, others in [(self.waiting, other.waiting), (self.sojourn, other.sojourn)]:
+            for key, sketch in others.items():
+                if key in own:
+                    own[key].add(sketch)
+                else:
+                    own[key] = QuantileSketch.from_array(sketch.to_array())
+
+        return self
+
+    def save(self, path):
+        """
+        saves the sketches as compressed numpy archive
+        :param path: file path
+        """
+        waiting = list(self.waiting.items())
+        sojourn = list(self.sojourn.items())
+        arrays = [sketch.to_array() for _, sketch in waiting + sojourn]
+        with open(path, "wb") as f:
+            np.savez_compressed(f, k=self.k,
+                                sources=np.array(
+                                    [str(s) for (s, _), _ in waiting], dtype=str),
+                                targets=np.array(
+                                    [str(t) for (_, t), _ in waiting], dtype=str),
+                                activities=np.array(
+                                    [str(a) for a, _ in sojourn], dtype=str),
+                                sizes=np.array([len(a)
+                                               for a in arrays], dtype=np.int64),
+                                sketches=np.concatenate(arrays) if arrays else np.empty(0))
+
+    @classmethod
+    def load(cls, path):
+        """
+        loads a profile saved with save
+        :param path: file path
+        :return: QuantileProfile
+        """
+        with np.load(path) as data:
+            profile = cls(int(data["k"]))
+            offsets = np.concatenate(([0], np.cumsum(data["sizes"])))
+            sketches = [QuantileSketch.from_array(data["sketches"][offsets[i]:offsets[i + 1]])
+                        for i in range(len(data["sizes"]))]
+            keys = list(zip(data["sources"].tolist(), data["targets"].tolist()))
+            profile.waiting = dict(zip(keys, sketches[:len(keys)]))
+            profile.sojourn = dict(
+                zip(data["activities"].tolist(), sketches[len(keys):]))
+
+        return profile
@@ -0,0 +1,277 @@
+import math
+from collections import OrderedDict
+import numpy as np
+import pandas as pd
+from pyinsights.temporal_profiling.moments import profile_moments
+from pyinsights.temporal_profiling.profile_engine import TemporalProfileEngine
+from pyinsights.time_utils import to_seconds
+
+
+class TemporalProfileMoments:
+    """
+    Mergeable temporal profile, running moments of the waiting time per (source, target) transition
+    and of the sojourn time per activity.
+    Profiles of separate shards or days are merged with add instead of recomputing on the whole log.
+    With a window or half-life, only recent observations count, see profile_moments.
+
+    :param window: length of a sliding window, seconds or pandas.Timedelta (e.g. "30D"), None for all time
+    :type window: float
+
+    :param half_life: half-life of exponential time decay, seconds or pandas.Timedelta, None for no decay
+    :type half_life: float
+
+    """
+
+    def __init__(self, window=None, half_life=None):
+        self.window = window
+        self.half_life = half_life
+        self.waiting = profile_moments(window, half_life)
+        self.sojourn = profile_moments(window, half_life)
+
+    @classmethod
+    def from_log(cls, log):
+        """
+        computes the moments of an in-memory log in one pass
+        :param log: pyinsights.columnar_log.ColumnarLog (snapshot or offline connector)
+        :return: TemporalProfileMoments
+        """
+        moments = cls()
+        engine = TemporalProfileEngine(log)
+        keys = engine.transition_keys
+        count, mean, std = engine.waiting_moments()
+        for i in np.flatnonzero(count > 0):
+            source, target = divmod(int(keys[i]), engine.end_code + 1)
+            moments.waiting.combine((log.activities[source], log.activities[target]), int(count[i]), mean[i],
+                                    std[i] ** 2 * (count[i] - 1) if count[i] > 1 else 0.0)
+        if engine.sojourn is not None:
+            count, mean, std = engine.sojourn_moments()
+            for i in np.flatnonzero(count > 0):
+                moments.sojourn.combine(log.activities[i], int(count[i]), mean[i],
+                                        std[i] ** 2 * (count[i] - 1) if count[i] > 1 else 0.0)
+
+        return moments
+
+    def add(self, other):
+        """
+        merges the profile of other observations
+        :param other: TemporalProfileMoments of events not contained yet
+        :return: self
+        """
+        self.waiting.add(other.waiting)
+        self.sojourn.add(other.sojourn)
+
+        return self
+
+    @staticmethod
+    def _statistics(moments, time):
+        """
+        returns keys with observations and their mean and std (0 with less than two observations)
+        """
+        statistics = [(key,) + moments.statistics(key, time)
+                      for key in list(moments.keys)]
+        statistics = [(key, mean, 0.0 if math.isnan(std) else std)
+                      for key, count, mean, std in statistics if count > 0]
+
+        return [key for key, _, _ in statistics], [mean for _, mean, _ in statistics], \
+            [std for _, _, std in statistics]
+
+    def temporal_profile(self, act_col="activity", time=None):
+        """
+        returns the profile in the format of TemporalProfiler.temporal_profile
+        :param act_col: name of the activity column of the sojourn times
+        :param time: time in seconds the profile is valid at, for windowed or decayed profiles
+        :return: dict {'waiting times': waiting_times, 'sojourn times': sojourn_times}
+        """
+        keys, mean, std = self._statistics(self.waiting, time)
+        waiting_times = pd.DataFrame({"source": [source for source, _ in keys],
+                                      "target": [target for _, target in keys],
+                                      "avg waiting time": mean,
+                                      "std waiting time": std}, columns=["source", "target", "avg waiting time",
+                                                                         "std waiting time"])
+
+        sojourn_times = pd.DataFrame()
+        if len(self.sojourn) > 0:
+            keys, mean, std = self._statistics(self.sojourn, time)
+            sojourn_times = pd.DataFrame({act_col: keys,
+                                          "avg sojourn time": mean,
+                                          "std sojourn": std})
+
+        return {'waiting times': waiting_times,
+                'sojourn times': sojourn_times}
+
+    def save(self, path):
+        """
+        saves the moments as compressed numpy archive
+        :param path: file path
+        """
+        if self.window is not None or self.half_life is not None:
+            raise ValueError("only profiles over all time can be saved")
+        keys, w_count, w_mean, w_m2 = self.waiting.arrays()
+        activities, s_count, s_mean, s_m2 = self.sojourn.arrays()
+        with open(path, "wb") as f:
+            np.savez_compressed(f, sources=np.array([str(s) for s, _ in keys], dtype=str),
+                                targets=np.array(
+                                    [str(t) for _, t in keys], dtype=str),
+                                waiting_count=w_count, waiting_mean=w_mean, waiting_m2=w_m2,
+                                activities=np.array(
+                                    [str(a) for a in activities], dtype=str),
+                                sojourn_count=s_count, sojourn_mean=s_mean, sojourn_m2=s_m2)
+
+    @classmethod
+    def load(cls, path):
+        """
+        loads moments saved with save
+        :param path: file path
+        :return: TemporalProfileMoments
+        """
+        moments = cls()
+        with np.load(path) as data:
+            for source, target, count, mean, m2 in zip(data["sources"].tolist(), data["targets"].tolist(),
+                                                       data["waiting_count"].tolist(), data["waiting_mean"].tolist(),
+                                                       data["waiting_m2"].tolist()):
+                moments.waiting.combine((source, target), count, mean, m2)
+            for activity, count, mean, m2 in zip(data["activities"].tolist(), data["sojourn_count"].tolist(),
+                                                 data["sojourn_mean"].tolist(), data["sojourn_m2"].tolist()):
+                moments.sojourn.combine(activity, count, mean, m2)
+
+        return moments
+
+
+class StreamingTemporalProfiler:
+    """
+    Online temporal conformance checking, event at a time.
+    Keeps the last activity and its end time per running case. When the next event of a case arrives,
+    the transition is complete: its waiting time (and the sojourn time of the event, if it has an end time)
+    is checked against the profile and then added to it, in O(1).
+    Durations with an absolute z-score of at least sigma are reported as deviations,
+    once the transition was observed min_count times.
+    If more than capacity cases are running, the least recently active case is evicted.
+
+    :param profile: profile to start from, e.g. computed on the history, None for an empty profile
+    :type profile: TemporalProfileMoments
+
+    :param sigma: statistical sigma
+    :type sigma: float
+
+    :param min_count: observations of a transition before it is checked
+    :type min_count: int
+
+    :param capacity: maximum number of running cases
+    :type capacity: int
+
+    :param learn: if false, the profile isn't updated
+    :type learn: bool
+
+    :param window: check against the profile of a sliding window, seconds or pandas.Timedelta (e.g. "30D"),
+        only without a profile
+    :type window: float
+
+    :param half_life: check against a profile with exponential time decay, seconds or pandas.Timedelta,
+        only without a profile
+    :type half_life: float
+    """
+
+    def __init__(self, profile=None, sigma=6, min_count=2, capacity=100000, learn=True, window=None,
+                 half_life=None):
+        if profile is None:
+            profile = TemporalProfileMoments(window=window, half_life=half_life)
+        elif window is not None or half_life is not None:
+            raise ValueError("window and half_life are those of the profile, set them on the profile")
+        self.profile = profile
+        self.sigma = sigma
+        self.min_count = max(min_count, 2)
+        self.capacity = capacity
+        self.learn = learn
+        self.evicted = 0
+        # case -> (last activity, end time of last activity), least recently active first
+        self._cases = OrderedDict()
+
+    def __len__(self):
+        return len(self._cases)
+
+    def __contains__(self, case):
+        return case in self._cases
+
+    def _check(self, moments, key, duration, time):
+        """
+        returns z-score of a duration if it deviates from the profile valid at time, else None,
+        and learns the duration
+        """
+        count, mean, std = moments.statistics(key, time)
+        z_score = None
+        if count >= self.min_count and std > 0 and abs(duration - mean) >= self.sigma * std:
+            z_score = (duration - mean) / std
+        if self.learn:
+            moments.update(key, duration, time)
+
+        return z_score
+
+    def process(self, case, activity, timestamp=None, end_timestamp=None):
+        """
+        processes the next event of a case
+        :param case: case id
+        :param activity: activity of the event
+        :param timestamp: start time of the event, defaults to now
+        :param end_timestamp: end time of the event, None if the log has no end timestamps
+        :return: list of deviations of the form (measure, transition or activity, duration in seconds, z-score)
+        """
+        start = to_seconds(timestamp)
+        end = start if end_timestamp is None else to_seconds(end_timestamp)
+        deviations = []
+
+        last = self._cases.pop(case, None)
+        if last is not None:
+            source, last_end = last
+            waiting = start - last_end
+            z_score = self._check(self.profile.waiting,
+                                  (source, activity), waiting, start)
+            if z_score is not None:
+                deviations.append(
+                    ("waiting time", (source, activity), waiting, z_score))
+        elif len(self._cases) >= self.capacity:
+            # evict least recently active case
+            self._cases.popitem(last=False)
+            self.evicted += 1
+
+        if end_timestamp is not None:
+            sojourn = end - start
+            z_score = self._check(
+                self.profile.sojourn, activity, sojourn, start)
+            if z_score is not None:
+                deviations.append(("sojourn", activity, sojourn, z_score))
+
+        self._cases[case] = (activity, end)
+
+        return deviations
+
+    def complete(self, case):
+        """
+        completes a case and removes its state
+        :param case: case id
+        """
+        self._cases.pop(case, None)
+
+    def process_log(self, df, case_col, act_col, timestamp, end_timestamp=None, complete=True):
+        """
+        replays an event log event by event
+        :param df: events as dataframe
+        :param case_col: name of case column
+        :param act_col: name of activity column
+        :param timestamp: name of (start) timestamp column
+        :param end_timestamp: name of end timestamp column or None
+        :param complete: if true, completes every case after its last event
+        :return: pandas.DataFrame with columns case, "activity", "measure", "transition", "duration", "z-score"
+        """
+        df = df.sort_values(by=timestamp, kind="stable").reset_index(drop=True)
+        last_events = set(df.drop_duplicates(
+            subset=case_col, keep="last").index) if complete else set()
+        ends = df[end_timestamp] if end_timestamp is not None else [None] * len(df)
+        rows = []
+        for index, case, activity, start, end in zip(df.index, df[case_col], df[act_col], df[timestamp], ends):
+            for measure, transition, duration, z_score in self.process(case, activity, start, end):
+                rows.append((case, activity, measure,
+                            transition, duration, z_score))
+            if index in last_events:
+                self.complete(case)
+
+        return pd.DataFrame(rows, columns=[case_col, "activity", "measure", "transition", "duration", "z-score"])
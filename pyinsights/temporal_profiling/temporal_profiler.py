@@ -1,6 +1,8 @@
 import pandas as pd
 from pycelonis.celonis_api.pql.pql import PQL, PQLColumn, PQLFilter
 from pyinsights.conformance import tbr_scores
+from pyinsights.snapshot import local_log, EventSnapshot
+from pyinsights.temporal_profiling.profile_engine import TemporalProfileEngine, deviates
 
 
 class TemporalProfiler:
@@ -12,6 +14,23 @@ class TemporalProfiler:
     :param connector: Connector to connect to celonis
     :type connector: pyinsights.Connector
 
+    :param snapshot: EventSnapshot to compute on instead of querying celonis
+    :type snapshot: pyinsights.EventSnapshot
+
+    :param window: compare with the profile of a sliding window before every event,
+        seconds or pandas.Timedelta (e.g. "30D"), None for all time
+    :type window: float
+
+    :param half_life: compare with a profile with exponential time decay, seconds or pandas.Timedelta
+    :type half_life: float
+
+    :param robust: "mad" or "quantile" to flag deviations from the median by a robust std,
+        estimated from quantile sketches per transition and activity, None for mean and std
+    :type robust: string
+
+    :param sketch_size: size of the quantile sketches of the robust mode
+    :type sketch_size: int
+
     """
     datamodel = None
     activity_table = None
@@ -21,10 +40,15 @@ class TemporalProfiler:
     transition_mode = None
     end_timestamp = None
 
-    def __init__(self, connector):
+    def __init__(self, connector, snapshot=None, window=None, half_life=None, robust=None, sketch_size=200):
         """
         constructor
         :param connector: pyinsights.Connector
+        :param snapshot: pyinsights.EventSnapshot
+        :param window: length of sliding window
+        :param half_life: half-life of time decay
+        :param robust: robust mode
+        :param sketch_size: size of quantile sketches
         """
         # init class
         global datamodel
@@ -47,6 +71,19 @@ class TemporalProfiler:
         end_timestamp = self.connector.end_timestamp()
         has_endtime = self.connector.has_end_timestamp()
         transition_mode = "ANY_OCCURRENCE[] TO ANY_OCCURRENCE[]"
+        # in-memory logs (snapshot or offline connector) are used natively
+        self.local_log = local_log(self.connector, snapshot)
+        self.window = window
+        self.half_life = half_life
+        self.robust = robust
+        self.sketch_size = sketch_size
+        if (window is not None or half_life is not None or robust is not None) and self.local_log is None:
+            # drifting and robust profiles are computed in memory
+            self.local_log = EventSnapshot(self.connector)
+        # z-scores of all transitions and replay cost per case, independent of sigma
+        self._profile_engine = None
+        self._scores = None
+        self._costs = None
 
     def temporal_profile(self):
         """
@@ -55,6 +92,8 @@ class TemporalProfiler:
         :returns df: waiting time and sojourn times as dataframes´within dict
         :type df: dict {'waiting times': waiting_times, 'sojourn times': sojourn_times}
         """
+        if self.local_log is not None:
+            return self._local_temporal_profile()
 
         # init vars
         waiting_times = pd.DataFrame()
@@ -95,7 +134,7 @@ class TemporalProfiler:
         query.add(PQLColumn(name="std waiting time", query=std_waiting))
 
         # get dataframe
-        waiting_times = datamodel.get_data_frame(query)
+        waiting_times = self.connector.get_data_frame(query)
         # pql returns profile for every occurrence of activity
         waiting_times.drop_duplicates(
             subset=["source", "target"], inplace=True)
@@ -123,7 +162,7 @@ class TemporalProfiler:
             # needs pull-up and domain table because of celonis joins
             sojourn_query.add(PQLColumn(name="std sojourn", query=std_sojourn))
 
-            sojourn_times = datamodel.get_data_frame(sojourn_query)
+            sojourn_times = self.connector.get_data_frame(sojourn_query)
             # pql returns profile for every occurrence of activity
             sojourn_times.drop_duplicates(subset=[act_col], inplace=True)
 
@@ -133,9 +172,27 @@ class TemporalProfiler:
 
         return temporal_profile
 
+    def eventually_follows_profile(self, max_distance=None):
+        """
+        Computes duration statistics of every ordered activity pair within a case,
+        e.g. from "Create Order" to "Ship" whatever happens in between.
+        Computed on the in-memory log, against celonis the event log is downloaded once
+
+        :param max_distance: only pairs at most max_distance events apart, None for all pairs
+        :type max_distance: int
+
+        :returns df: dataframe with columns 'source', 'target', 'count', 'avg duration', 'std duration'
+        :type df: pandas dataframe
+        """
+        if self.local_log is None:
+            self.local_log = EventSnapshot(self.connector)
+
+        return self._engine().eventually_follows(max_distance)
+
     def _deviations(self, sigma=6):
         """
         Computes deviating transitions
+        z-scores of all transitions are computed once, every sigma is a filter on them
 
         :param sigma: statistical sigma
         :type sigma: int
@@ -143,6 +200,32 @@ class TemporalProfiler:
         :returns df: deviating transitions as dataframe
         :type df: pandas dataframe
         """
+        if self.local_log is not None:
+            return self._local_deviations(sigma)
+
+        scores = self._transition_scores()
+        deviating = deviates(scores["waiting time"], scores["avg waiting time"],
+                             scores["std waiting time"], sigma)
+        if has_endtime:
+            deviating |= deviates(scores["sojourn"], scores["avg sojourn time"],
+                                  scores["std sojourn"], sigma)
+        df = scores[deviating].reset_index(drop=True)
+
+        # start/end transitions get na for temporal times
+        df.fillna(value=0, inplace=True)
+
+        return df
+
+    def _transition_scores(self):
+        """
+        Computes waiting (and sojourn) time, their average, std and z-score of every transition,
+        cached per profiler
+
+        :returns df: transitions as dataframe
+        :type df: pandas dataframe
+        """
+        if self._scores is not None:
+            return self._scores
 
         # declaring pql variables
         source_act = f"""SOURCE("{activity_table}"."{act_col}",{transition_mode} WITH START())"""
@@ -205,13 +288,6 @@ class TemporalProfiler:
                 end
                  """))
 
-        # filter all cases with waiting time deviating more than average +- sigma
-        # nice example of Pull-up with domain table
-        filter_larger_than_average = f"""( ( {waiting}) >= ({avg_waiting} + {sigma} * {std_waiting}) )
-                    OR
-                    ( ( {waiting} ) <= ({avg_waiting} - {sigma} * {std_waiting}) )
-                    """
-
         # checks if log has end_timestamps and computes statistics on sojourn time
         if has_endtime:
             # queries for sojourn time
@@ -245,22 +321,67 @@ class TemporalProfiler:
                             end
                              """))
 
-            # add deviating sojourn times to filter
-            filter_larger_than_average += "OR"
-            filter_larger_than_average += f"""( ( {sojourn}) >= ({avg_sojourn} + {sigma} * {std_sojourn}) )
-                    OR
-                    ( ( {sojourn} ) <= ({avg_sojourn} - {sigma} * {std_sojourn}) ) """
+        # get dataframe, deviations are filtered in memory
+        self._scores = self.connector.get_data_frame(query)
 
-        # filter deviations
-        query.add(PQLFilter(filter_larger_than_average))
+        return self._scores
 
-        # get dataframe
-        df = datamodel.get_data_frame(query)
+    def _engine(self):
+        """
+        returns profile engine on the in-memory log, it caches the z-scores of all transitions
+        """
+        if self._profile_engine is None:
+            self._profile_engine = TemporalProfileEngine(self.local_log, window=self.window,
+                                                         half_life=self.half_life, robust=self.robust,
+                                                         sketch_size=self.sketch_size)
+        return self._profile_engine
 
-        # start/end transitions get na for temporal times
-        df.fillna(value=0, inplace=True)
+    def _local_temporal_profile(self):
+        """
+        Computes temporal profile on the in-memory log
 
-        return df
+        :returns df: waiting time and sojourn times as dataframes´within dict
+        :type df: dict {'waiting times': waiting_times, 'sojourn times': sojourn_times}
+        """
+        return self._engine().temporal_profile()
+
+    def _local_deviations(self, sigma=6):
+        """
+        Computes deviating transitions on the in-memory log
+
+        :param sigma: statistical sigma
+        :type sigma: int
+
+        :returns df: deviating transitions as dataframe
+        :type df: pandas dataframe
+        """
+        return self._engine().deviations(sigma)
+
+    def _replay_costs(self, case_ids):
+        """
+        returns token replay cost of cases, cases scored before are looked up
+        :param case_ids: pandas.Series of case ids
+        :return: pandas.DataFrame with columns case and "cost"
+        """
+        new_cases = case_ids
+        if self._costs is not None:
+            new_cases = case_ids[~case_ids.isin(self._costs[case_col])]
+
+        if len(new_cases) > 0:
+            # load event log and filter to new deviating cases
+            if self.local_log is not None:
+                event_log = self.local_log.events()
+            else:
+                event_log = self.connector.events()
+            events_to_replay = event_log[event_log[case_col].isin(new_cases)]
+            cost = tbr_scores(events_to_replay=events_to_replay,
+                              event_log=event_log, connector=self.connector)
+            self._costs = cost if self._costs is None else pd.concat(
+                [self._costs, cost], ignore_index=True)
+
+        if self._costs is None:
+            return pd.DataFrame(columns=[case_col, "cost"])
+        return self._costs[self._costs[case_col].isin(case_ids)]
 
     def deviating_cases(self, sigma=6, deviation_cost=True, extended_view=True):
         """
@@ -276,20 +397,12 @@ class TemporalProfiler:
         case_ids = deviations[case_col].drop_duplicates()
         cols = list(deviations.columns)
 
-        # load event log and filter to deviating cases
-        event_log = self.connector.events()
-        events_to_replay = event_log[event_log[case_col].isin(case_ids)]
-
         # compute deviation cost
         if deviation_cost:
-            # compute cost
-            cost = tbr_scores(events_to_replay=events_to_replay,
-                              event_log=event_log, connector=self.connector)
-            deviating_cases = pd.DataFrame(
-                {f'{case_col}': case_ids, "cost": cost})
-            # append cost to deviations df
-            deviations = deviations.merge(
-                deviating_cases.set_index(case_col), on=case_col, how="left")
+            # compute cost, only for cases not scored yet
+            cost = self._replay_costs(case_ids)
+            # append cost to deviations df, cost is keyed by case id
+            deviations = deviations.merge(cost, on=case_col, how="left")
 
             # factor sojourn time into deviation cost if applicable
             if has_endtime:
@@ -0,0 +1,16 @@
+import time
+import numpy as np
+import pandas as pd
+
+
+def to_seconds(timestamp):
+    """
+    converts a timestamp to seconds since epoch, numbers are returned as they are
+    :param timestamp: number, pandas.Timestamp, datetime or string, None for now
+    :return: float
+    """
+    if timestamp is None:
+        return time.time()
+    if isinstance(timestamp, (int, float, np.number)):
+        return float(timestamp)
+    return pd.Timestamp(timestamp).timestamp()
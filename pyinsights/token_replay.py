@@ -0,0 +1,260 @@
+from copy import copy
+import numpy as np
+import pandas as pd
+# private helpers of pm4py's token replay, their signatures are only stable within the pinned pm4py version
+from pm4py.algo.conformance.tokenreplay.variants.token_replay import TechnicalParameters, apply_hidden_trans, \
+    break_condition_final_marking, get_req_transitions_for_final_marking
+from pm4py.objects.petri_net.obj import Marking
+from pm4py.objects.petri_net.utils.petri_utils import get_places_shortest_path_by_hidden
+
+
+class TokenReplay:
+    """
+    Token-based replay on the incidence matrices of a petri net.
+    The net is compiled into pre/post matrices (transitions x places), markings are integer vectors.
+    Replaying an activity from a marking always gives the same next marking and token counts, so every
+    (marking, activity) pair is resolved once, including the firing of invisible transitions needed to enable
+    the activity (same heuristic as pm4py's token replay), and stored in a table.
+    Batches of traces are then replayed as integer arrays by table lookups, one step per event position.
+    Counts of missing, consumed, remaining and produced tokens are the same as pm4py.conformance_diagnostics_token_based_replay.
+
+    :param net: pm4py petri net
+    :param initial_marking: initial marking
+    :param final_marking: final marking
+    """
+
+    def __init__(self, net, initial_marking, final_marking):
+        self.net = net
+        self.places = sorted(net.places, key=lambda p: p.name)
+        self._place_index = {place: i for i, place in enumerate(self.places)}
+        self.transitions = sorted(net.transitions, key=lambda t: t.name)
+        self._transition_index = {t: i for i, t in enumerate(self.transitions)}
+
+        # incidence matrices, transitions x places
+        self.pre = np.zeros(
+            (len(self.transitions), len(self.places)), dtype=np.int64)
+        self.post = np.zeros_like(self.pre)
+        for i, t in enumerate(self.transitions):
+            for arc in t.in_arcs:
+                self.pre[i, self._place_index[arc.source]] = arc.weight
+            for arc in t.out_arcs:
+                self.post[i, self._place_index[arc.target]] = arc.weight
+
+        self.initial_marking = self._vector(initial_marking)
+        self.final_marking = self._vector(final_marking)
+        self._final_marking = final_marking
+
+        # visible activities, their index is their code
+        self.activities = list(dict.fromkeys(
+            t.label for t in self.transitions if t.label is not None))
+        self._activity_index = {act: i for i,
+                                act in enumerate(self.activities)}
+        self._labelled = [np.array([i for i, t in enumerate(self.transitions) if t.label == act], dtype=np.int64)
+                          for act in self.activities]
+        # transition replayed if no transition with the label is enabled, the last one like pm4py
+        self._fallback = {act: self._transition_index[t]
+                          for t in net.transitions for act in [t.label] if act is not None}
+        self._shortest_paths = get_places_shortest_path_by_hidden(
+            net, TechnicalParameters.MAX_REC_DEPTH.value)
+
+        # markings seen so far, their index is their state
+        self._markings = []
+        self._states = {}
+        # state x activity -> next state (-1: not resolved yet) and (missing, consumed, produced) tokens
+        self._next = np.full((0, len(self.activities)), -1, dtype=np.int64)
+        self._delta = np.zeros((0, len(self.activities), 3), dtype=np.int64)
+        # state -> (missing, consumed, remaining, produced) tokens of reaching the final marking
+        self._final = {}
+        self._state(self.initial_marking)
+
+    def _vector(self, marking):
+        """
+        converts a pm4py marking into a marking vector
+        """
+        vector = np.zeros(len(self.places), dtype=np.int64)
+        for place, tokens in marking.items():
+            vector[self._place_index[place]] = tokens
+
+        return vector
+
+    def _marking(self, vector):
+        """
+        converts a marking vector into a pm4py marking
+        """
+        return Marking({self.places[i]: int(vector[i]) for i in np.flatnonzero(vector)})
+
+    def _state(self, vector):
+        """
+        returns the state of a marking vector, adds it to the table if it's new
+        """
+        key = vector.tobytes()
+        state = self._states.get(key)
+        if state is None:
+            state = len(self._markings)
+            self._states[key] = state
+            self._markings.append(vector)
+            if state == len(self._next):
+                # grow the table
+                size = max(16, 2 * len(self._next))
+                self._next = np.concatenate(
+                    [self._next, np.full((size - len(self._next), len(self.activities)), -1, dtype=np.int64)])
+                self._delta = np.concatenate(
+                    [self._delta, np.zeros((size - len(self._delta), len(self.activities), 3), dtype=np.int64)])
+
+        return state
+
+    def _enabled(self, vector, t):
+        return bool((vector >= self.pre[t]).all())
+
+    def _fire(self, vector, t):
+        """
+        fires transition t, returns the next marking vector and consumed & produced tokens
+        """
+        return vector - self.pre[t] + self.post[t], self.pre[t].sum(), self.post[t].sum()
+
+    def _fire_hidden(self, transitions):
+        """
+        returns consumed and produced tokens of the invisible transitions fired by pm4py's closure
+        """
+        indices = [self._transition_index[t] for t in transitions]
+        return self.pre[indices].sum(), self.post[indices].sum()
+
+    def _resolve(self, state, activity):
+        """
+        replays an activity from a marking and stores the next state and token counts in the table
+        """
+        vector = self._markings[state]
+        missing = consumed = produced = 0
+
+        # an enabled transition with the label, else the transition of the label
+        enabled = [t for t in self._labelled[activity]
+                   if self._enabled(vector, t)]
+        t = enabled[0] if enabled else self._fallback[self.activities[activity]]
+
+        if not self._enabled(vector, t):
+            # try to enable it by firing invisible transitions
+            marking = self._marking(vector)
+            _, marking, fired, _ = apply_hidden_trans(self.transitions[t], self.net, copy(marking), self._shortest_paths,
+                                                      [], 0, set(), [copy(marking)])
+            consumed, produced = self._fire_hidden(fired)
+            vector = self._vector(marking)
+
+        if not self._enabled(vector, t):
+            # add missing tokens, pm4py adds the arc weight to every underfed place
+            underfed = vector < self.pre[t]
+            missing += (self.pre[t] - vector)[underfed].sum()
+            vector = vector + np.where(underfed, self.pre[t], 0)
+
+        vector, c, p = self._fire(vector, t)
+        self._next[state, activity] = self._state(vector)
+        self._delta[state, activity] = [
+            missing, consumed + c, produced + p]
+
+    def _resolve_final(self, state):
+        """
+        returns the token counts of reaching the final marking from a state, like pm4py
+        :return: (missing, consumed, remaining, produced)
+        """
+        if state in self._final:
+            return self._final[state]
+
+        final_marking = self._final_marking
+        marking = self._marking(self._markings[state])
+        consumed = produced = 0
+
+        def fire(t, marking):
+            nonlocal consumed, produced
+            i = self._transition_index[t]
+            consumed += self.pre[i].sum()
+            produced += self.post[i].sum()
+            vector, _, _ = self._fire(self._vector(marking), i)
+            return self._marking(vector)
+
+        def enabled(t, marking):
+            return self._enabled(self._vector(marking), self._transition_index[t])
+
+        # fire invisible transitions towards the final marking
+        for _ in range(TechnicalParameters.MAX_IT_FINAL1.value):
+            if break_condition_final_marking(marking, final_marking):
+                break
+            for group in get_req_transitions_for_final_marking(marking, final_marking, self._shortest_paths):
+                for t in group:
+                    if enabled(t, marking):
+                        marking = fire(t, marking)
+                if break_condition_final_marking(marking, final_marking):
+                    break
+        # towards the sink place, if not reached yet
+        if not break_condition_final_marking(marking, final_marking) and len(final_marking) == 1:
+            sink = list(final_marking)[0]
+            connections = sorted([self._shortest_paths[place][sink] for place in marking
+                                  if place in self._shortest_paths and sink in self._shortest_paths[place]], key=len)
+            for _ in range(TechnicalParameters.MAX_IT_FINAL2.value):
+                for path in connections:
+                    for t in path:
+                        if not enabled(t, marking):
+                            break
+                        marking = fire(t, marking)
+
+        vector = self._vector(marking)
+        missing = np.maximum(self.final_marking - vector, 0).sum()
+        remaining = np.maximum(vector - self.final_marking, 0).sum()
+        self._final[state] = (missing, consumed + self.final_marking.sum(),
+                              remaining, produced)
+
+        return self._final[state]
+
+    def encode(self, traces):
+        """
+        encodes traces as padded integer matrix, activities unknown to the net and padding are -1
+        :param traces: list of activity sequences
+        :return: numpy.ndarray traces x maximum length
+        """
+        length = max([len(trace) for trace in traces], default=0)
+        codes = np.full((len(traces), length), -1, dtype=np.int64)
+        for i, trace in enumerate(traces):
+            codes[i, :len(trace)] = [self._activity_index.get(
+                act, -1) for act in trace]
+
+        return codes
+
+    def replay(self, traces):
+        """
+        replays a batch of traces
+        :param traces: list of activity sequences or encoded traces, see encode
+        :return: pandas.DataFrame with columns "missing tokens", "consumed tokens", "remaining tokens",
+            "produced tokens" and "trace fitness", one row per trace
+        """
+        codes = traces if isinstance(
+            traces, np.ndarray) else self.encode(traces)
+        num_traces = len(codes)
+        states = np.zeros(num_traces, dtype=np.int64)
+        # missing, consumed, produced
+        counts = np.zeros((num_traces, 3), dtype=np.int64)
+        counts[:, 2] = self.initial_marking.sum()
+
+        for position in range(codes.shape[1]):
+            # unknown activities don't change the marking
+            active = np.flatnonzero(codes[:, position] >= 0)
+            current, activities = states[active], codes[active, position]
+            unresolved = self._next[current, activities] < 0
+            if unresolved.any():
+                for state, activity in set(zip(current[unresolved].tolist(), activities[unresolved].tolist())):
+                    self._resolve(state, activity)
+            counts[active] += self._delta[current, activities]
+            states[active] = self._next[current, activities]
+
+        reached, index = np.unique(states, return_inverse=True)
+        final = np.array([self._resolve_final(state) for state in reached.tolist()],
+                         dtype=np.int64).reshape(-1, 4)[index]
+        missing = counts[:, 0] + final[:, 0]
+        consumed = counts[:, 1] + final[:, 1]
+        remaining = final[:, 2]
+        produced = counts[:, 2] + final[:, 3]
+
+        with np.errstate(divide="ignore", invalid="ignore"):
+            fitness = 0.5 * (1 - missing / consumed) + \
+                0.5 * (1 - remaining / produced)
+        fitness = np.where((consumed > 0) & (produced > 0), fitness, 1.0)
+
+        return pd.DataFrame({"missing tokens": missing, "consumed tokens": consumed, "remaining tokens": remaining,
+                             "produced tokens": produced, "trace fitness": fitness})
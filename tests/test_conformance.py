@@ -0,0 +1,138 @@
+import unittest
+from unittest import mock
+import os
+import pandas as pd
+import pm4py
+from pyinsights import OfflineConnector
+from pyinsights.conformance import tbr_scores, alignment_scores, evaluate_model, _get_top_variants, \
+    _discover_petri_net_from_log
+
+
+class ConformanceTest(unittest.TestCase):
+
+    def setUp(self):
+        path = os.path.join(os.path.dirname(__file__),
+                            "input_data", "running-example.xes")
+        self.connector = OfflineConnector(path)
+
+    def test_tbr_scores_per_case(self):
+        """
+        tests that replay costs are keyed by case id and equal within a variant
+        :return:
+        """
+        events = self.connector.events()
+        # case 7 has the same trace as case 1
+        copy = events[events["case:concept:name"] == "1"].assign(
+            **{"case:concept:name": "7"})
+        events = pd.concat([copy, events], ignore_index=True)
+        costs = tbr_scores(events_to_replay=events,
+                           event_log=self.connector.events(), connector=self.connector)
+
+        self.assertEqual(list(costs.columns), ["case:concept:name", "cost"])
+        self.assertEqual(set(costs["case:concept:name"]),
+                         set(events["case:concept:name"]))
+        costs = costs.set_index("case:concept:name")["cost"]
+        self.assertEqual(costs["1"], costs["7"])
+
+    def test_alignment_budget(self):
+        """
+        tests that parallel alignments match sequential ones and traces over budget get an upper bound
+        :return:
+        """
+        events = self.connector.events()
+        expected = alignment_scores(events, events, self.connector)
+        parallel = alignment_scores(events, events, self.connector, processes=2)
+        self.assertTrue(parallel.equals(expected))
+        self.assertFalse(expected["approximate"].any())
+
+        bounded = alignment_scores(events, events, self.connector, max_states=1)
+        self.assertTrue(bounded["approximate"].all())
+        self.assertTrue((bounded["cost"] >= expected["cost"]).all())
+
+    def test_top_variants_from_events(self):
+        """
+        tests that the variants of already fetched events are clustered without querying celonis
+        :return:
+        """
+        class RemoteConnector(OfflineConnector):
+            offline = False
+
+            def get_data_frame(self, query):
+                raise AssertionError("queried celonis")
+
+        events = self.connector.events()
+        connector = RemoteConnector(self.connector.log)
+        # every variant of the running example occurs once
+        self.assertEqual(_get_top_variants(connector, events, coverage=0.1)["case:concept:name"].nunique(), 6)
+        # no variant is in a cluster, the whole log is kept
+        self.assertEqual(len(_get_top_variants(connector, events, coverage=0.5, epsilon=0)), len(events))
+
+    def test_cluster_unique_variants(self):
+        """
+        tests that unique variants within epsilon of each other form a cluster
+        :return:
+        """
+        rows = []
+        for i in range(300):
+            start = pd.Timestamp("2022-01-01") + pd.Timedelta(days=i)
+            # every case has its own activity between b and c
+            for j, act in enumerate(["a", "b", f"x{i}", "c", "d"]):
+                rows.append((str(i), act, start + pd.Timedelta(hours=j)))
+        for i in range(3):
+            start = pd.Timestamp("2023-01-01") + pd.Timedelta(days=i)
+            for j in range(6):
+                rows.append((f"outlier {i}", f"y{i} {j}", start + pd.Timedelta(hours=j)))
+        connector = OfflineConnector(pd.DataFrame(
+            rows, columns=["case:concept:name", "concept:name", "time:timestamp"]))
+        events = connector.events()
+
+        top_variants = _get_top_variants(connector, events, coverage=0.01, epsilon=2)
+        self.assertEqual(top_variants["case:concept:name"].nunique(), 300)
+        self.assertFalse(top_variants["case:concept:name"].str.startswith("outlier").any())
+        net, _, _ = _discover_petri_net_from_log(connector, events)
+        self.assertIn("a", {t.label for t in net.transitions})
+
+    def test_sampled_model_evaluation(self):
+        """
+        tests that the sampled evaluation reports intervals around the estimates
+        :return:
+        """
+        events = self.connector.events()
+        net, im, fm = _discover_petri_net_from_log(self.connector, events)
+        evaluation = evaluate_model(self.connector, events, net, im, fm, sample_size=3,
+                                    max_width=0).set_index("metric")
+
+        self.assertEqual(list(evaluation.index), [
+                         "fitness", "simplicity", "precision", "generalization"])
+        self.assertTrue((evaluation["lower"] <= evaluation["estimate"]).all())
+        self.assertTrue((evaluation["estimate"] <= evaluation["upper"]).all())
+        # the sample is increased up to the whole log
+        self.assertEqual(evaluation.loc["precision", "sample size"], 6)
+
+    def test_evaluation_time_budget(self):
+        """
+        tests that a used up budget stops the sampling after the batches needed for an interval
+        :return:
+        """
+        events = self.connector.events()
+        net, im, fm = _discover_petri_net_from_log(self.connector, events)
+        calls = []
+        precision = pm4py.precision_token_based_replay
+
+        def counted_precision(*args):
+            calls.append(args)
+            return precision(*args)
+
+        with mock.patch("pm4py.precision_token_based_replay", counted_precision):
+            evaluation = evaluate_model(self.connector, events, net, im, fm, sample_size=3,
+                                        max_width=0, time_budget=0).set_index("metric")
+
+        self.assertEqual(len(calls), 2)
+        with self.assertRaises(ValueError):
+            evaluate_model(self.connector, events, net, im, fm, batches=1)
+        self.assertEqual(evaluation.loc["precision", "sample size"], 3)
+        self.assertTrue((evaluation["lower"] <= evaluation["upper"]).all())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,39 @@
+import unittest
+import os
+from pyinsights import OfflineConnector
+from pyinsights.log_skeleton import LogSkeleton, ConformanceMonitor
+
+
+class ConformanceMonitorTest(unittest.TestCase):
+
+    def setUp(self):
+        path = os.path.join(os.path.dirname(__file__),
+                            "input_data", "running-example.xes")
+        self.connector = OfflineConnector(path)
+
+    def test_conformance_monitor(self):
+        """
+        tests event-at-a-time conformance checking
+        :return:
+        """
+        model = LogSkeleton(connector=self.connector).get_log_skeleton(0)
+        monitor = ConformanceMonitor(model, capacity=2)
+
+        # register request always occurs before check ticket
+        self.assertIn(("always_before", ("check ticket", "register request")),
+                      monitor.process("new", "check ticket"))
+        self.assertIn(("activ_freq", ("register request", 2)),
+                      monitor.process("new", "register request") + monitor.process("new", "register request"))
+        # decide occurs in every case
+        self.assertIn(("activ_freq", ("decide", 0)), monitor.complete("new"))
+        self.assertEqual(len(monitor), 0)
+
+        # least recently active case is evicted
+        for case in ["a", "b", "c"]:
+            monitor.process(case, "register request")
+        self.assertNotIn("a", monitor)
+        self.assertEqual(monitor.evicted, 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
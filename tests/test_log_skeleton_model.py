@@ -0,0 +1,127 @@
+import unittest
+import os
+import tempfile
+import pandas as pd
+from pyinsights import OfflineConnector
+from pyinsights.log_skeleton import LogSkeleton, LogSkeletonModel, SkeletonStatistics
+from pyinsights.log_skeleton.bitset import SkeletonBitset
+
+
+class LogSkeletonModelTest(unittest.TestCase):
+
+    def setUp(self):
+        path = os.path.join(os.path.dirname(__file__),
+                            "input_data", "running-example.xes")
+        self.connector = OfflineConnector(path)
+
+    def test_skeleton_bitset(self):
+        """
+        tests that the bitset view of the log skeleton round trips
+        :return:
+        """
+        log_skeleton = LogSkeleton(connector=self.connector)
+        expected = log_skeleton.get_log_skeleton(0.1)
+        bitset = SkeletonBitset.from_dict(
+            expected, log_skeleton._get_activities())
+
+        self.assertTrue(bitset.to_dict() == expected)
+
+    def test_log_skeleton_model(self):
+        """
+        tests that a saved log skeleton checks cases like the original
+        :return:
+        """
+        log_skeleton = LogSkeleton(connector=self.connector)
+        model = log_skeleton.get_log_skeleton(0.1)
+        expected = log_skeleton.get_non_conforming_cases(0.1)
+
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "lsk.npz")
+            model.save(path)
+            loaded = LogSkeletonModel.load(path)
+
+        self.assertTrue(loaded == model)
+        self.assertEqual(loaded.noise_threshold, 0.1)
+        non_conforming = log_skeleton.check(loaded)
+        self.assertEqual(set(non_conforming["case:concept:name"]), set(
+            expected["case:concept:name"]))
+
+    def test_save_integer_activities(self):
+        """
+        tests that activity names keep their type when a model or statistics are saved
+        :return:
+        """
+        log = self.connector.log.copy()
+        log["concept:name"] = pd.factorize(log["concept:name"])[0]
+        log_skeleton = LogSkeleton(connector=OfflineConnector(log))
+        model = log_skeleton.get_log_skeleton(0.1)
+        statistics = log_skeleton.get_statistics()
+
+        with tempfile.TemporaryDirectory() as directory:
+            model.save(os.path.join(directory, "lsk.npz"))
+            statistics.save(os.path.join(directory, "statistics.npz"))
+            loaded = LogSkeletonModel.load(os.path.join(directory, "lsk.npz"))
+            loaded_statistics = SkeletonStatistics.load(os.path.join(directory, "statistics.npz"))
+
+        self.assertEqual(loaded.activities, model.activities)
+        self.assertTrue(all(isinstance(act, int) for act in loaded.activities))
+        self.assertTrue(loaded == model)
+        self.assertTrue(loaded_statistics.log_skeleton(0.1) == model)
+        self.assertEqual(set(log_skeleton.check(loaded)["case:concept:name"]),
+                         set(log_skeleton.check(model)["case:concept:name"]))
+
+    def test_incremental_statistics(self):
+        """
+        tests that adding and removing cases matches a full recompute
+        :return:
+        """
+        log = self.connector.log
+        first = log[log["case:concept:name"].isin(["1", "2", "3"])]
+        second = log[~log["case:concept:name"].isin(["1", "2", "3"])]
+        statistics = LogSkeleton(OfflineConnector(first)).get_statistics()
+        statistics.add(LogSkeleton(OfflineConnector(second)).get_statistics())
+
+        for noise_threshold in [0, 0.1, 0.5]:
+            self.assertTrue(statistics.log_skeleton(noise_threshold) == LogSkeleton(
+                self.connector).get_log_skeleton(noise_threshold))
+
+        statistics.remove(LogSkeleton(
+            OfflineConnector(first)).get_statistics())
+        self.assertTrue(statistics.log_skeleton(0.1) == LogSkeleton(
+            OfflineConnector(second)).get_log_skeleton(0.1))
+
+    def test_conformance_curve(self):
+        """
+        tests that the curve matches the results per noise threshold
+        :return:
+        """
+        log_skeleton = LogSkeleton(connector=self.connector)
+        noise_thresholds = [0, 0.2, 0.5]
+        result = log_skeleton.get_conformance_curve(noise_thresholds)
+
+        self.assertEqual(list(result["curve"]["noise threshold"]), noise_thresholds)
+        for noise_threshold in noise_thresholds:
+            expected = log_skeleton.get_non_conforming_cases(noise_threshold)
+            self.assertEqual(set(result["non-conforming cases"][noise_threshold]["case:concept:name"]),
+                             set(expected["case:concept:name"]))
+            self.assertTrue(result["log skeletons"][noise_threshold]
+                            == log_skeleton.get_log_skeleton(noise_threshold))
+
+    def test_parallel_relations(self):
+        """
+        tests that concurrent relations give the same results as sequential ones
+        :return:
+        """
+        sequential = LogSkeleton(connector=self.connector, max_workers=1)
+        concurrent = LogSkeleton(connector=self.connector, max_workers=4)
+
+        self.assertTrue(concurrent.get_log_skeleton(0.1)
+                        == sequential.get_log_skeleton(0.1))
+        self.assertEqual(concurrent.get_log_skeleton_per_case(None),
+                         sequential.get_log_skeleton_per_case(None))
+        self.assertEqual(set(concurrent.get_non_conforming_cases(0.1)["case:concept:name"]),
+                         set(sequential.get_non_conforming_cases(0.1)["case:concept:name"]))
+
+
+if __name__ == '__main__':
+    unittest.main()
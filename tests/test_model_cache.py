@@ -0,0 +1,61 @@
+import unittest
+import tempfile
+from pyinsights import OfflineConnector
+from pyinsights.conformance import _discover_petri_net_from_log
+from pyinsights.model_cache import PetriNetCache
+
+
+class PetriNetCacheTest(unittest.TestCase):
+
+    def setUp(self):
+        self.connector = OfflineConnector(
+            "tests/input_data/running-example.xes")
+        self.cache_dir = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.cache_dir.cleanup()
+
+    def test_discovery_is_cached(self):
+        """
+        tests that a net is discovered once per log and discovery parameters
+        :return:
+        """
+        cache = PetriNetCache()
+        events = self.connector.events()
+        net, _, _ = _discover_petri_net_from_log(
+            self.connector, events, cache=cache)
+
+        self.assertIs(_discover_petri_net_from_log(
+            self.connector, events, cache=cache)[0], net)
+        self.assertEqual(cache.stats()["hits"], 1)
+        # other coverage, other net
+        _discover_petri_net_from_log(
+            self.connector, events, coverage=0.5, cache=cache)
+        self.assertEqual(cache.stats()["misses"], 2)
+        # other events, other net
+        _discover_petri_net_from_log(
+            self.connector, events[events["case:concept:name"] != "1"], cache=cache)
+        self.assertEqual(cache.stats()["misses"], 3)
+
+    def test_pnml_persistence(self):
+        """
+        tests that stored nets are loaded from disk by a new cache instance
+        :return:
+        """
+        events = self.connector.events()
+        net, im, fm = _discover_petri_net_from_log(
+            self.connector, events, cache=PetriNetCache(cache_dir=self.cache_dir.name))
+
+        # new session
+        cache = PetriNetCache(cache_dir=self.cache_dir.name)
+        loaded_net, loaded_im, loaded_fm = _discover_petri_net_from_log(
+            self.connector, events, cache=cache)
+        self.assertEqual(cache.stats()["hits"], 1)
+        self.assertEqual(sorted(str(t.label) for t in loaded_net.transitions),
+                         sorted(str(t.label) for t in net.transitions))
+        self.assertEqual(len(loaded_im), len(im))
+        self.assertEqual(len(loaded_fm), len(fm))
+
+
+if __name__ == '__main__':
+    unittest.main()
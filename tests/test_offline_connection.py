@@ -0,0 +1,82 @@
+import unittest
+import pandas as pd
+from pyinsights import OfflineConnector, EventSnapshot
+from pyinsights.log_skeleton import LogSkeleton
+from pyinsights.temporal_profiling import TemporalProfiler
+import os
+
+
+class OfflineConnectorTest(unittest.TestCase):
+
+    def setUp(self):
+        path = os.path.join(os.path.dirname(__file__),
+                            "input_data", "running-example.xes")
+        self.connector = OfflineConnector(
+            path, resource_column="org:resource")
+
+    def test_events(self):
+        """
+        tests loading of the event log
+        :return:
+        """
+        events = self.connector.events()
+
+        self.assertEqual(len(events), 42)
+        self.assertEqual(events[self.connector.case_col()].nunique(), 6)
+        self.assertEqual(list(events.columns), [
+                         "case:concept:name", "concept:name", "time:timestamp"])
+
+    def test_activation_counts(self):
+        """
+        tests number of occurrences per case and activity
+        :return:
+        """
+        counts = self.connector.activation_counts(case_id="3")
+        counts = dict(zip(counts["concept:name"], counts["max nr"]))
+
+        self.assertEqual(counts["check ticket"], 2)
+        self.assertEqual(counts["register request"], 1)
+
+    def test_directly_follows_for_case(self):
+        """
+        tests directly follows relation for a specific case id without celonis
+        :return:
+        """
+        log_skeleton = LogSkeleton(connector=self.connector)
+        directly_follows_for_case = log_skeleton._get_directly_follows(
+            0, case_id="1")
+
+        self.assertTrue(directly_follows_for_case == set([('register request', 'examine thoroughly'), (
+            'examine thoroughly', 'check ticket'), ('check ticket', 'decide'), ('decide', 'reject request')]))
+
+    def test_temporal_profile(self):
+        """
+        tests temporal profile without celonis
+        :return:
+        """
+        temporal_profiler = TemporalProfiler(connector=self.connector)
+        profile = temporal_profiler.temporal_profile()
+
+        waiting_times = profile['waiting times']
+        self.assertEqual(list(waiting_times.columns), [
+                         'source', 'target', 'avg waiting time', 'std waiting time'])
+        # every directly-follows pair shows up exactly once
+        self.assertFalse(waiting_times.duplicated(
+            subset=['source', 'target']).any())
+        self.assertTrue(profile['sojourn times'].equals(pd.DataFrame()))
+
+    def test_snapshot(self):
+        """
+        tests that analyzers compute the same result on a snapshot
+        :return:
+        """
+        snapshot = EventSnapshot(self.connector)
+        expected = LogSkeleton(connector=self.connector).get_log_skeleton(0)
+        log_skeleton = LogSkeleton(
+            connector=self.connector, snapshot=snapshot).get_log_skeleton(0)
+
+        self.assertTrue(log_skeleton == expected)
+
+
+if __name__ == '__main__':
+    unittest.main()
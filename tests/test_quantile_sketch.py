@@ -0,0 +1,55 @@
+import unittest
+import numpy as np
+from pyinsights.temporal_profiling.sketch import QuantileSketch
+
+
+class QuantileSketchTest(unittest.TestCase):
+
+    def setUp(self):
+        rng = np.random.default_rng(0)
+        # heavy-tailed durations
+        self.durations = rng.lognormal(8, 1.5, 200000)
+        self.quantiles = [0.01, 0.25, 0.5, 0.75, 0.99]
+
+    def assert_rank_error(self, sketch, error):
+        estimates = sketch.quantile(self.quantiles)
+        ranks = np.searchsorted(np.sort(self.durations),
+                                estimates) / len(self.durations)
+        self.assertLess(np.abs(ranks - self.quantiles).max(), error)
+
+    def test_bounded_memory(self):
+        """
+        tests quantiles of a stream with a bounded number of retained items
+        :return:
+        """
+        sketch = QuantileSketch(k=200, seed=0)
+        for duration in self.durations[:20000]:
+            sketch.update(duration)
+        sketch.update_many(self.durations[20000:])
+
+        self.assertEqual(len(sketch), len(self.durations))
+        self.assertLess(sum(len(items) for items in sketch.levels), 3 * 200)
+        self.assert_rank_error(sketch, 0.02)
+
+    def test_merge_and_serialize(self):
+        """
+        tests that merged partitions and deserialized sketches keep their accuracy
+        :return:
+        """
+        partitions = [QuantileSketch(k=200, seed=i) for i in range(4)]
+        for i, sketch in enumerate(partitions):
+            sketch.update_many(self.durations[i::4])
+        merged = QuantileSketch.from_array(partitions[0].to_array())
+        for sketch in partitions[1:]:
+            merged.add(QuantileSketch.from_array(sketch.to_array()))
+
+        self.assertEqual(len(merged), len(self.durations))
+        self.assert_rank_error(merged, 0.02)
+        median, scale = merged.robust_statistics("mad")
+        expected = np.median(self.durations)
+        self.assertAlmostEqual(median / expected, 1, delta=0.05)
+        self.assertAlmostEqual(scale / (1.4826 * np.median(np.abs(self.durations - expected))), 1, delta=0.05)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,96 @@
+import unittest
+import tempfile
+import pandas as pd
+from pyinsights import Connector
+from pyinsights.query_cache import QueryCache, normalize_pql
+
+
+class QueryCacheTest(unittest.TestCase):
+
+    def setUp(self):
+        self.cache_dir = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.cache_dir.cleanup()
+
+    def test_normalize_pql(self):
+        """
+        tests that formatting doesn't change the query text, but quoted strings are kept
+        :return:
+        """
+        self.assertEqual(normalize_pql(""" PU_MAX ( "table"."col",
+                                        'a  b' ) """), """PU_MAX ( "table"."col", 'a  b' )""")
+
+    def test_hits_and_misses(self):
+        """
+        tests that stored results are served from disk, also by a new cache instance
+        :return:
+        """
+        cache = QueryCache(cache_dir=self.cache_dir.name)
+        key = QueryCache.key("model", "COLUMN x := 1", "reload 1")
+        df = pd.DataFrame({"case": ["1", "2"], "count": [1, 2]})
+
+        self.assertIsNone(cache.get(key))
+        cache.put(key, df)
+
+        # new session
+        cache = QueryCache(cache_dir=self.cache_dir.name)
+        self.assertTrue(cache.get(key).equals(df))
+        # reload of the datamodel changes the key
+        self.assertIsNone(cache.get(QueryCache.key(
+            "model", "COLUMN x := 1", "reload 2")))
+        self.assertEqual(cache.stats()["hits"], 1)
+        self.assertEqual(cache.stats()["misses"], 1)
+
+    def test_lru_eviction(self):
+        """
+        tests that least recently used results are evicted first
+        :return:
+        """
+        df = pd.DataFrame({"case": range(100)})
+        cache = QueryCache(cache_dir=self.cache_dir.name)
+        cache.put("a", df)
+        # room for two results
+        cache.max_size = int(cache.size() * 2.5)
+        cache.put("b", df)
+        cache.get("a")
+        cache.put("c", df)
+
+        self.assertIsNotNone(cache.get("a"))
+        self.assertIsNone(cache.get("b"))
+        self.assertEqual(cache.stats()["evictions"], 1)
+
+    def test_unknown_reload_skips_cache(self):
+        """
+        tests that results aren't cached while the last reload of the datamodel is unknown
+        :return:
+        """
+        class Datamodel:
+            id = "model"
+            url = "datamodel"
+            queries = 0
+
+            def get_data_frame(self, query):
+                self.queries += 1
+                return pd.DataFrame({"case": ["1"]})
+
+        class Celonis:
+            def api_request(self, url):
+                raise ConnectionError("load info unavailable")
+
+        # connector without connecting to celonis
+        connector = Connector.__new__(Connector)
+        connector.datamodel = Datamodel()
+        connector.celonis = Celonis()
+        connector._last_reload_check = None
+        connector.enable_cache(cache_dir=self.cache_dir.name)
+
+        with self.assertWarns(UserWarning):
+            connector.get_data_frame(None)
+        connector.get_data_frame(None)
+        self.assertEqual(connector.datamodel.queries, 2)
+        self.assertEqual(connector.cache.stats()["entries"], 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
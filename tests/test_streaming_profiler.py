@@ -0,0 +1,74 @@
+import unittest
+import os
+from pyinsights import OfflineConnector
+from pyinsights.temporal_profiling import StreamingTemporalProfiler, TemporalProfileMoments
+from pyinsights.temporal_profiling.moments import DecayedMoments, WindowedMoments
+
+
+class StreamingProfilerTest(unittest.TestCase):
+
+    def setUp(self):
+        path = os.path.join(os.path.dirname(__file__),
+                            "input_data", "running-example.xes")
+        self.connector = OfflineConnector(path)
+
+    def test_streaming_temporal_profile(self):
+        """
+        tests that the streamed profile and merged shards match the profile of the whole log
+        :return:
+        """
+        log = self.connector.log
+        first = OfflineConnector(log[log["case:concept:name"].isin(["1", "2", "3"])])
+        second = OfflineConnector(log[~log["case:concept:name"].isin(["1", "2", "3"])])
+        expected = TemporalProfileMoments.from_log(self.connector)
+        merged = TemporalProfileMoments.from_log(first).add(TemporalProfileMoments.from_log(second))
+
+        profiler = StreamingTemporalProfiler(sigma=1)
+        deviations = profiler.process_log(log, "case:concept:name", "concept:name", "time:timestamp")
+        self.assertEqual(len(profiler), 0)
+        self.assertEqual(list(deviations.columns), [
+                         "case:concept:name", "activity", "measure", "transition", "duration", "z-score"])
+        self.assertTrue((deviations["z-score"].abs() >= 1).all())
+
+        for moments in [merged.waiting, profiler.profile.waiting]:
+            self.assertEqual(set(moments.keys), set(expected.waiting.keys))
+            for key in expected.waiting.keys:
+                count, mean, std = moments.statistics(key)
+                expected_count, expected_mean, expected_std = expected.waiting.statistics(key)
+                self.assertEqual(count, expected_count)
+                self.assertAlmostEqual(mean, expected_mean, delta=1e-6)
+                if expected_count > 1:
+                    self.assertAlmostEqual(std, expected_std, delta=1e-6)
+
+    def test_window_with_profile(self):
+        """
+        tests that a window can't be set next to a profile
+        :return:
+        """
+        with self.assertRaises(ValueError):
+            StreamingTemporalProfiler(profile=TemporalProfileMoments(), window="5D")
+        with self.assertRaises(ValueError):
+            StreamingTemporalProfiler(profile=TemporalProfileMoments(), half_life="5D")
+
+    def test_observations_without_time(self):
+        """
+        tests that observations without time are taken to be at the latest time seen
+        :return:
+        """
+        decayed = DecayedMoments(half_life=10)
+        decayed.update("a", 1.0)
+        decayed.update("a", 2.0, time=10)
+        decayed.update("a", 3.0)
+        count, mean, _ = decayed.statistics("a", time=10)
+        self.assertAlmostEqual(count, 3)
+        self.assertAlmostEqual(mean, 2)
+
+        windowed = WindowedMoments(window=5)
+        windowed.update("a", 1.0, time=0)
+        windowed.update("a", 2.0)
+        self.assertEqual(windowed.statistics("a", time=10)[0], 0)
+        self.assertFalse(hasattr(windowed, "combine"))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,181 @@
+import unittest
+import os
+import numpy as np
+import pandas as pd
+from pyinsights import OfflineConnector
+from pyinsights.temporal_profiling import TemporalProfiler, StreamingTemporalProfiler
+from pyinsights.temporal_profiling.sketch import QuantileSketch
+
+
+class TemporalProfileEngineTest(unittest.TestCase):
+
+    def setUp(self):
+        path = os.path.join(os.path.dirname(__file__),
+                            "input_data", "running-example.xes")
+        self.connector = OfflineConnector(path)
+
+    def test_temporal_profile_engine(self):
+        """
+        tests grouped statistics of the profile engine against pandas
+        :return:
+        """
+        log = self.connector.log.copy()
+        log["end"] = log["time:timestamp"] + \
+            pd.to_timedelta(log.index % 7, unit="h")
+        connector = OfflineConnector(log, end_timestamp="end")
+        profile = TemporalProfiler(connector=connector).temporal_profile()
+
+        events = connector.log
+        sojourn = (events["end"] - events["time:timestamp"]
+                   ).dt.total_seconds()
+        expected = sojourn.groupby(events["concept:name"], sort=False).agg(
+            ["mean", "std"]).fillna(0)
+        sojourn_times = profile['sojourn times'].set_index("concept:name")
+        self.assertTrue(((sojourn_times["avg sojourn time"] - expected["mean"]).abs() < 1e-6).all())
+        self.assertTrue(((sojourn_times["std sojourn"] - expected["std"]).abs() < 1e-6).all())
+
+        transitions = pd.DataFrame({"source": events["concept:name"],
+                                    "target": events["concept:name"].shift(-1),
+                                    "waiting": (events["time:timestamp"].shift(-1) - events["end"]).dt.total_seconds()})
+        same_case = events["case:concept:name"] == events["case:concept:name"].shift(-1)
+        expected = transitions[same_case].groupby(["source", "target"])["waiting"].mean()
+        waiting_times = profile['waiting times'].set_index(["source", "target"])
+        self.assertEqual(len(waiting_times), len(expected))
+        self.assertTrue(((waiting_times["avg waiting time"] - expected).abs() < 1e-6).all())
+
+    def test_drifting_temporal_profile(self):
+        """
+        tests that a sliding window or decay finds deviations hidden by the profile over all time
+        :return:
+        """
+        # the process gets faster after 20 days, the last case is slow again
+        hours = [10] * 20 + [1] * 19 + [3]
+        rows = []
+        for i, waiting in enumerate(hours):
+            start = pd.Timestamp("2022-01-01") + pd.Timedelta(days=i)
+            rows.append((str(i), "a", start))
+            rows.append((str(i), "b", start + pd.Timedelta(hours=waiting, minutes=i % 3)))
+        log = pd.DataFrame(rows, columns=["case:concept:name", "concept:name", "time:timestamp"])
+        connector = OfflineConnector(log)
+
+        self.assertEqual(len(TemporalProfiler(connector)._deviations(sigma=3)), 0)
+        # the first fast case deviates from the slow cases before it
+        for profiler in [TemporalProfiler(connector, window="5D"), TemporalProfiler(connector, half_life="2D")]:
+            deviations = profiler._deviations(sigma=3)
+            self.assertEqual(list(deviations["case:concept:name"]), ["20", "39"])
+
+        streaming = StreamingTemporalProfiler(sigma=3, window="5D")
+        deviations = streaming.process_log(log, "case:concept:name", "concept:name", "time:timestamp")
+        self.assertEqual(list(deviations["case:concept:name"]), ["20", "39"])
+
+    def test_robust_temporal_profile(self):
+        """
+        tests that the robust mode finds an outlier hidden by a heavy tail
+        :return:
+        """
+        # mostly 1 hour, a few very slow cases inflate the std, case 30 takes 3 hours
+        hours = [1 + (i % 5) / 10 for i in range(30)] + [3] + [100, 150, 200]
+        rows = []
+        for i, waiting in enumerate(hours):
+            start = pd.Timestamp("2022-01-01") + pd.Timedelta(days=i)
+            rows.append((str(i), "a", start))
+            rows.append((str(i), "b", start + pd.Timedelta(hours=waiting)))
+        connector = OfflineConnector(pd.DataFrame(
+            rows, columns=["case:concept:name", "concept:name", "time:timestamp"]))
+
+        self.assertNotIn("30", set(TemporalProfiler(connector)._deviations(sigma=3)["case:concept:name"]))
+        for robust in ["mad", "quantile"]:
+            profiler = TemporalProfiler(connector, robust=robust)
+            deviations = profiler._deviations(sigma=3)
+            self.assertIn("30", set(deviations["case:concept:name"]))
+            self.assertIn("median waiting time", deviations.columns)
+            self.assertIn("deviation cost", profiler.deviating_cases(sigma=3).columns)
+
+    def test_robust_profile_zero_mad(self):
+        """
+        tests that outliers are found if more than half of the durations are equal
+        :return:
+        """
+        # most cases wait 0 or 60 seconds, case 0 waits 30 days
+        seconds = [30 * 24 * 3600] + [0] * 30 + [60] * 19
+        rows = []
+        for i, waiting in enumerate(seconds):
+            start = pd.Timestamp("2022-01-01") + pd.Timedelta(days=i)
+            rows.append((str(i), "a", start))
+            rows.append((str(i), "b", start + pd.Timedelta(seconds=waiting)))
+        connector = OfflineConnector(pd.DataFrame(
+            rows, columns=["case:concept:name", "concept:name", "time:timestamp"]))
+
+        for robust in [None, "mad", "quantile"]:
+            deviations = TemporalProfiler(connector, robust=robust)._deviations(sigma=3)
+            self.assertEqual(list(deviations["case:concept:name"]), ["0"])
+
+        # the robust std is 0 only if all durations are equal
+        sketch = QuantileSketch()
+        sketch.update_many(np.zeros(30))
+        self.assertEqual(sketch.robust_statistics("mad"), (0, 0))
+        sketch.update_many(np.full(19, 60.0))
+        self.assertGreater(sketch.robust_statistics("mad")[1], 0)
+
+    def test_deviation_cache(self):
+        """
+        tests that changing sigma filters cached z-scores and replays every case once
+        :return:
+        """
+        profiler = TemporalProfiler(connector=self.connector)
+        for sigma in [1.5, 1, 0.5, 1.5]:
+            expected = TemporalProfiler(
+                connector=self.connector).deviating_cases(sigma=sigma)
+            self.assertTrue(profiler.deviating_cases(
+                sigma=sigma).equals(expected))
+
+        self.assertIs(profiler._engine().scores(), profiler._engine().scores())
+        self.assertFalse(profiler._costs.duplicated(
+            subset=["case:concept:name"]).any())
+
+    def test_eventually_follows_profile(self):
+        """
+        tests the eventually-follows profile against all pairs of events
+        :return:
+        """
+        profiler = TemporalProfiler(connector=self.connector)
+        events = self.connector.log
+        for max_distance in [None, 2]:
+            profile = profiler.eventually_follows_profile(
+                max_distance).set_index(["source", "target"])
+            durations = {}
+            for _, case in events.groupby("case:concept:name"):
+                acts, times = list(case["concept:name"]), list(case["time:timestamp"])
+                for i in range(len(case)):
+                    for j in range(i + 1, len(case)):
+                        if max_distance is None or j - i <= max_distance:
+                            durations.setdefault((acts[i], acts[j]), []).append(
+                                (times[j] - times[i]).total_seconds())
+
+            self.assertEqual(len(profile), len(durations))
+            for pair, values in durations.items():
+                expected = pd.Series(values)
+                self.assertEqual(profile.loc[pair, "count"], len(values))
+                self.assertAlmostEqual(profile.loc[pair, "avg duration"], expected.mean(), delta=1e-6)
+                self.assertAlmostEqual(profile.loc[pair, "std duration"], expected.std() if len(values) > 1 else 0,
+                                       delta=1e-6)
+
+    def test_eventually_follows_chunks(self):
+        """
+        tests that the pass over chunks of cases gives the profile of the pass over all cases
+        :return:
+        """
+        profiler = TemporalProfiler(connector=self.connector)
+        profiler.eventually_follows_profile()
+        engine = profiler._engine()
+        for max_distance in [None, 2]:
+            expected = engine.eventually_follows(max_distance)
+            chunked = engine.eventually_follows(max_distance, max_state=1)
+            self.assertTrue((expected[["source", "target", "count"]] == chunked[["source", "target", "count"]])
+                            .all().all())
+            self.assertTrue(((expected["avg duration"] - chunked["avg duration"]).abs() < 1e-6).all())
+            self.assertTrue(((expected["std duration"] - chunked["std duration"]).abs() < 1e-6).all())
+
+
+if __name__ == '__main__':
+    unittest.main()
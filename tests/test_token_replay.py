@@ -0,0 +1,60 @@
+import unittest
+import pm4py
+from pyinsights import OfflineConnector
+from pyinsights.token_replay import TokenReplay
+
+
+class TokenReplayTest(unittest.TestCase):
+
+    def setUp(self):
+        connector = OfflineConnector("tests/input_data/running-example.xes")
+        self.log = pm4py.format_dataframe(connector.events(), case_id="case:concept:name",
+                                          activity_key="concept:name", timestamp_key="time:timestamp")
+        self.traces = list(self.log.groupby(
+            "case:concept:name")["concept:name"].agg(tuple))
+
+    def assert_same_as_pm4py(self, net, im, fm, traces):
+        expected = pm4py.conformance_diagnostics_token_based_replay(
+            pm4py.convert_to_event_log(self.log), net, im, fm)
+        replay = TokenReplay(net, im, fm).replay(traces)
+
+        for i, diagnostics in enumerate(expected):
+            for key in ["missing", "consumed", "remaining", "produced"]:
+                self.assertEqual(
+                    replay[f"{key} tokens"][i], diagnostics[f"{key}_tokens"])
+            self.assertAlmostEqual(
+                replay["trace fitness"][i], diagnostics["trace_fitness"])
+
+    def test_inductive_net(self):
+        """
+        tests token counts on a net with invisible transitions
+        :return:
+        """
+        net, im, fm = pm4py.discover_petri_net_inductive(
+            self.log, noise_threshold=0.3)
+        self.assert_same_as_pm4py(net, im, fm, self.traces)
+
+    def test_alpha_net(self):
+        """
+        tests token counts on a net that doesn't fit the log
+        :return:
+        """
+        net, im, fm = pm4py.discover_petri_net_alpha(self.log)
+        self.assert_same_as_pm4py(net, im, fm, self.traces)
+
+    def test_unknown_activities(self):
+        """
+        tests that activities unknown to the net don't change the marking
+        :return:
+        """
+        net, im, fm = pm4py.discover_petri_net_inductive(self.log)
+        replay = TokenReplay(net, im, fm)
+        with_unknown = [trace[:2] + ("unknown",) + trace[2:]
+                        for trace in self.traces]
+
+        self.assertTrue(replay.replay(with_unknown).equals(
+            replay.replay(self.traces)))
+
+
+if __name__ == '__main__':
+    unittest.main()
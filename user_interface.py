@@ -7,6 +7,7 @@ from pyinsights.organisational_profiling import ResourceProfiler
 from pyinsights.log_skeleton import LogSkeleton
 from pyinsights.anomaly_detection import anomaly_detection
 from pyinsights import Combiner
+from pyinsights import EventSnapshot
 from sklearn.preprocessing import MinMaxScaler
 from pycelonis.celonis_api.pql.pql import PQL, PQLColumn
 import plotly.express as px
@@ -22,7 +23,7 @@ def num_cases(_model, url):
     query = PQL()
     query.add(
         PQLColumn(name="num", query=f""" COUNT(DISTINCT "{activity_table}"."{case_col}") """))
-    num_cases_df = _model.get_data_frame(query)
+    num_cases_df = st.session_state.connector.get_data_frame(query)
     num_cases = num_cases_df["num"][0]
 
     return num_cases
@@ -77,10 +78,23 @@ def set_datamodel(_model, endtime, resource_co, url):
     st.session_state.resource_col = resource_col["name"]
 
 
+@st.cache_resource(show_spinner=True)
+def event_snapshot(endtime, resource_col, url):
+    # download the event log once per datamodel and columns, shared by all methods
+    return EventSnapshot(connector=st.session_state.connector)
+
+
+@st.cache_resource(show_spinner=True)
+def temporal_profiler(endtime, resource_col, url):
+    # one profiler per snapshot, it caches z-scores and replay costs independent of sigma
+    snapshot = event_snapshot(endtime, resource_col, url)
+    return TemporalProfiler(connector=st.session_state.connector, snapshot=snapshot)
+
+
 @st.cache_data(show_spinner=True)
-def temporal_deviations(endtime, resource_col, simga, deviation_cost, extended_view, url):
-    # compute temporal deviations
-    profiler = TemporalProfiler(connector=st.session_state.connector)
+def temporal_deviations(endtime, resource_col, sigma, deviation_cost, extended_view, url):
+    # compute temporal deviations, a new sigma only filters the cached z-scores
+    profiler = temporal_profiler(endtime, resource_col, url)
     df = profiler.deviating_cases(
         sigma=sigma, extended_view=extended_view, deviation_cost=deviation_cost)
 
@@ -88,9 +102,24 @@ def temporal_deviations(endtime, resource_col, simga, deviation_cost, extended_v
 
 
 @st.cache_data(show_spinner=True)
-def lsk_deviations(noise_threshold, url):
-    # compute lsk deviations
-    lsk = LogSkeleton(connector=st.session_state.connector)
+def lsk_curve(url, endtime, resource_col):
+    # compute lsk deviations for a grid of noise thresholds at once
+    snapshot = event_snapshot(endtime, resource_col, url)
+    lsk = LogSkeleton(connector=st.session_state.connector, snapshot=snapshot)
+    noise_thresholds = [round(x, 2) for x in np.arange(0, 1.01, 0.05)]
+
+    return lsk.get_conformance_curve(noise_thresholds)
+
+
+@st.cache_data(show_spinner=True)
+def lsk_deviations(noise_threshold, url, endtime, resource_col):
+    # compute lsk deviations, thresholds of the curve are looked up
+    curve = lsk_curve(url, endtime, resource_col)
+    if noise_threshold in curve["non-conforming cases"]:
+        return curve["non-conforming cases"][noise_threshold]
+
+    snapshot = event_snapshot(endtime, resource_col, url)
+    lsk = LogSkeleton(connector=st.session_state.connector, snapshot=snapshot)
     df = lsk.get_non_conforming_cases(noise_threshold=noise_threshold)
 
     return df
@@ -99,8 +128,9 @@ def lsk_deviations(noise_threshold, url):
 @st.cache_data(show_spinner=True)
 def anomaly_deviations(contamination, param_optimization, url, endtime, resource_col):
     # compute anomalies
+    snapshot = event_snapshot(endtime, resource_col, url)
     df = anomaly_detection(st.session_state.connector,
-                           parameter_optimization=param_optimization, contamination=contamination)
+                           parameter_optimization=param_optimization, contamination=contamination, snapshot=snapshot)
 
     return df
 
@@ -118,8 +148,9 @@ def resource_deviations(endtime, resource_col, time_unit, reference_unit, min_ba
     st.session_state.connector.resource_col = resource_col
 
     if st.session_state.connector.resource_col != None:
+        snapshot = event_snapshot(endtime, resource_col, url)
         profiler = ResourceProfiler(
-            connector=st.session_state.connector)
+            connector=st.session_state.connector, snapshot=snapshot)
     else:
         st.error("Not all parameters set")
         return
@@ -168,6 +199,8 @@ if "connector" not in st.session_state:
         try:
             st.session_state.connector = Connector(
                 api_token=api_token, url=url, key_type=key_type)
+            # persist query results across sessions and restarts
+            st.session_state.connector.enable_cache()
         except:
             st.error("Couldn't login. Try again")
         st.experimental_rerun()
@@ -235,8 +268,8 @@ After that, you can just click on 'Get deviations'!""",  icon="ℹ️")
                     grouped_by_batches = st.selectbox("Grouped", [True, False])
                     batch_types = st.selectbox("Batch types", [True, False])
             with tab3:
-                noise_treshold = st.number_input(
-                    label="Noise-threshold", value=0.2, step=0.1)
+                noise_treshold = round(st.number_input(
+                    label="Noise-threshold", value=0.2, step=0.05), 2)
             with tab4:
                 param_opti = st.checkbox(
                     label="Hyperparameter Optimization", value=True)
@@ -280,7 +313,8 @@ After that, you can just click on 'Get deviations'!""",  icon="ℹ️")
                     else:
                         st.error("Please select a valid resource column!")
                 if "Log Skeleton" in method_option:
-                    df = lsk_deviations(noise_treshold, url=model_option.url)
+                    df = lsk_deviations(noise_treshold, url=model_option.url,
+                                        endtime=end_timestamp["name"], resource_col=resource_col["name"])
                     st.session_state.deviations["Log Skeleton"] = df
                 if "Anomaly Detection" in method_option:
 
@@ -322,6 +356,13 @@ After that, you can just click on 'Get deviations'!""",  icon="ℹ️")
         fig = px.pie(values=[num_all_cases-num_deviations, num_deviations], names=[
                      "conforming cases", "non-conforming cases"], title='Proportion of deviations')
         st.plotly_chart(fig)
+        # show how the number of lsk deviations depends on the noise threshold
+        if "Log Skeleton" in method_option:
+            curve = lsk_curve(model_option.url, endtime=end_timestamp["name"],
+                              resource_col=resource_col["name"])["curve"]
+            fig = px.line(curve, x="noise threshold", y="non-conforming cases", markers=True,
+                          title="Sensitivity of the log skeleton to the noise threshold")
+            st.plotly_chart(fig)
         # show bar chart with deviation scores
         st.markdown("**Distribution of deviation scores**")
         if len(scoring_cols) > 0: